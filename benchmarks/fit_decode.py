@@ -0,0 +1,44 @@
+"""Compare fast FIT decoder with `fitdecode` based parser.
+
+Usage: python -m benchmarks.fit_decode --points 100000
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from firome.codecs.fit import parse_fit
+
+from .synthetic import write_fit
+
+
+def _measure(path: Path, *, fast: bool, repeat: int) -> float:
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_fit(path, fast=fast)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[10_000, 100_000], help="Records in FIT file")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per decoder, best is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="firome-bench-") as tmp:
+        for points in args.points:
+            path = write_fit(Path(tmp, f"{points}.fit"), points, laps=10)
+
+            for name, fast in (("fitdecode", False), ("fast", True)):
+                elapsed = _measure(path, fast=fast, repeat=args.repeat)
+                print(f"{name:>10} {points:>9} points {elapsed:8.3f}s {points / elapsed:12.0f} points/s")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
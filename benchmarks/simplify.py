@@ -0,0 +1,85 @@
+"""Measure simplification of merged tracks: time, kept points and the largest error of dropped positions.
+
+Synthetic activity is given a winding route, so that Ramer-Douglas-Peucker has turns to keep.
+
+Usage: python -m benchmarks.simplify --points 100000 1000000
+"""
+
+import argparse
+import time
+from dataclasses import replace
+
+import numpy as np
+
+from firome.classes.tracks import ActivityTrack
+from firome.simplify import Simplification, _local_coordinates, _squared_distance, simplify
+
+from .synthetic import activity_track
+
+_methods = {
+    "tolerance 1 m": Simplification(tolerance=1),
+    "tolerance 5 m": Simplification(tolerance=5),
+    "interval 10 s": Simplification(interval=10),
+    "spacing 50 m": Simplification(spacing=50),
+    "tolerance 2 m, interval 30 s": Simplification(tolerance=2, interval=30),
+}
+
+
+def _winding(track: ActivityTrack, seed: int = 0) -> ActivityTrack:
+    """Return track following a route with random turns, with the same distances between points."""
+    rng = np.random.default_rng(seed)
+    step = np.diff(track.distance, prepend=0)
+    heading = np.cumsum(rng.normal(0, 0.02, len(track))) + 0.3 * np.sin(track.distance / 300)
+
+    north, east = np.cumsum(np.sin(heading) * step), np.cumsum(np.cos(heading) * step)
+
+    return replace(
+        track,
+        lat=np.ma.MaskedArray(55 + north / 111_000, mask=np.ma.getmaskarray(track.lat)),
+        lon=np.ma.MaskedArray(37 + east / 64_000, mask=np.ma.getmaskarray(track.lon)),
+    )
+
+
+def _max_error(track: ActivityTrack, simplified: ActivityTrack) -> float:
+    """Return the largest distance from dropped positioned points to the simplified track, meters."""
+    kept = np.isin(track.timestamp, simplified.timestamp)
+    positioned = ~np.ma.getmaskarray(track.lat)
+
+    dropped = np.flatnonzero(~kept & positioned)
+
+    if len(dropped) == 0:
+        return 0
+
+    ends = np.flatnonzero(kept)
+    segment = np.searchsorted(ends, dropped) - 1
+    squared = _squared_distance(_local_coordinates(track, positioned), dropped, ends, segment)
+
+    return float(np.sqrt(squared.max()))
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[100_000, 1_000_000], help="Trackpoints in activity")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per method, best is reported")
+    args = parser.parse_args()
+
+    for points in args.points:
+        track = _winding(activity_track(points))
+
+        for name, simplification in _methods.items():
+            best = float("inf")
+
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                simplified = simplify(track, simplification)
+                best = min(best, time.perf_counter() - start)
+
+            print(  # noqa: T201
+                f"{name:>28} {points:>9} points {best:8.3f}s {points / best:12.0f} points/s "
+                f"kept {len(simplified) / points:7.2%}, error {_max_error(track, simplified):6.2f} m",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Measure startup time and import time per module of the entry points, `-X importtime` based.
+
+Heavy dependencies must be imported on the first use: `--check` fails if any of them is imported on startup.
+
+Usage: python -m benchmarks.startup --top 5 --check
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+_heavy = ("numpy", "scipy", "lxml", "fitdecode", "PySide6")
+
+_scenarios = {  # name: interpreter arguments, dependencies allowed to be imported
+    "cli --version": (["-m", "firome", "--version"], ()),
+    "cli --help": (["-m", "firome", "--help"], ()),
+    "gui --version": (["-m", "firome.ui", "--version"], ()),
+    "import firome.codecs.fit": (["-c", "import firome.codecs.fit"], ("numpy",)),
+    "import firome.codecs.gpx": (["-c", "import firome.codecs.gpx"], ("numpy",)),
+    "import firome.codecs.tcx": (["-c", "import firome.codecs.tcx"], ("numpy",)),
+    "import firome.pipeline": (["-c", "import firome.pipeline"], ("numpy",)),
+}
+
+
+@dataclass(frozen=True)
+class _Import:
+    module: str
+    cumulative: int  # microseconds
+    level: int  # nesting of the import
+
+
+def _run(arguments: list[str]) -> tuple[float, list[_Import]]:
+    """Return wall time and the imports of the interpreter run."""
+    start = time.perf_counter()
+    completed = subprocess.run(  # noqa: S603  # arguments are the scenarios above
+        [sys.executable, "-X", "importtime", *arguments],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    return elapsed, _parse(completed.stderr)
+
+
+def _parse(log: str) -> list[_Import]:
+    """Parse `import time: self [us] | cumulative | imported package` lines."""
+    imports = []
+
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        module = name.strip()
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+
+        imports.append(_Import(module, int(cumulative), level))
+
+    return imports
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario, the best is reported")
+    parser.add_argument("--top", type=int, default=3, help="Slowest top-level imports reported per scenario")
+    parser.add_argument("--check", action="store_true", help="Fail if heavy dependencies are imported on startup")
+    args = parser.parse_args()
+
+    violations = []
+
+    for name, (arguments, allowed) in _scenarios.items():
+        runs = [_run(arguments) for _ in range(args.repeat)]
+        elapsed, imports = min(runs, key=lambda run: run[0])
+
+        top_level = [i for i in imports if i.level == 0]
+        total = sum(i.cumulative for i in top_level) / 1000
+
+        print(f"{name:>26} {elapsed * 1000:8.1f} ms wall {total:8.1f} ms imports")  # noqa: T201
+
+        for i in sorted(top_level, key=lambda i: i.cumulative, reverse=True)[: args.top]:
+            print(f"{i.module:>45} {i.cumulative / 1000:8.1f} ms")  # noqa: T201
+
+        imported = {i.module.split(".")[0] for i in imports}
+        violations.extend(f"{name}: {dep}" for dep in _heavy if dep in imported and dep not in allowed)
+
+    if violations:
+        print("\nheavy dependencies imported on startup:", *violations, sep="\n  ")  # noqa: T201
+
+    if args.check and violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Benchmark pipeline stages and the end-to-end run on synthetic inputs of several sizes, for time and memory.
+
+Time of a stage excludes its inner stages, e.g. merge run lazily by the exporter, memory is the allocation peak
+of the stage traced in a separate run. Results are saved as JSON baseline, `--compare` fails if any stage takes
+more time or memory than in the baseline beyond the threshold.
+
+Usage: python -m benchmarks.suite --sizes 1000 100000 --save baseline.json
+       python -m benchmarks.suite --compare baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from firome.logger import LOGGER
+from firome.pipeline import Job, Options, process
+from firome.profiling import Profiler, stage
+
+from .synthetic import MAX_SPEED, Corruption, write_fit, write_gpx
+
+_TOTAL = "end_to_end"
+_warm_up_size = 100
+
+_min_time = 0.005  # seconds, shorter stages are too noisy to compare
+_min_memory = 2**20  # bytes, smaller peaks are too noisy to compare
+
+
+def _measure(job: Job, options: Options, repeat: int) -> dict[str, dict]:
+    """Return the best time and the memory peak of each stage of the job."""
+    times: dict[str, float] = {}
+
+    for _ in range(repeat):
+        for name, stats in _profile(job, options, trace_memory=False).items():
+            time = stats["wall"] if name == _TOTAL else stats["wall_self"]
+            times[name] = min(times.get(name, time), time)
+
+    memory = _profile(job, options, trace_memory=True)
+
+    return {name: {"time": time, "memory": memory[name]["memory_peak"]} for name, time in times.items()}
+
+
+def _profile(job: Job, options: Options, *, trace_memory: bool) -> dict[str, dict]:
+    profiler = Profiler(trace_memory=trace_memory)
+
+    with profiler.activate(), stage(_TOTAL):
+        process(job, options)
+
+    return profiler.to_dict()
+
+
+def _job(directory: Path, size: int, args: argparse.Namespace) -> Job:
+    """Write synthetic inputs of given size, return the job merging them."""
+    corruption = Corruption.uniform(args.corruption)
+    recording = write_fit(
+        directory / f"{size}.fit",
+        size,
+        laps=10,
+        interval=args.interval,
+        corruption=corruption,
+    )
+    route = write_gpx(
+        directory / f"{size}.gpx",
+        max(size // args.route_ratio, 100),
+        size * args.interval * MAX_SPEED,  # covers the whole activity
+        corruption=corruption,
+    )
+
+    return Job(route, recording, directory / f"{size}.{args.format}", args.precision)
+
+
+def _run(args: argparse.Namespace) -> dict:
+    options = Options(output_format=args.format, use_cache=False)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="firome-bench-") as tmp:
+        process(_job(Path(tmp), _warm_up_size, args), options)  # dependencies are imported on the first run
+
+        for size in args.sizes:
+            results[str(size)] = _measure(_job(Path(tmp), size, args), options, args.repeat)
+
+            print(f"{size} points:")  # noqa: T201
+            _print(results[str(size)])
+
+    return {
+        "parameters": {
+            "interval": args.interval,
+            "corruption": args.corruption,
+            "route_ratio": args.route_ratio,
+            "precision": args.precision,
+            "format": args.format,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "results": results,
+    }
+
+
+def _print(stages: dict[str, dict]):
+    for name, result in stages.items():
+        print(f"{name:>16} {result['time']:9.4f} s {result['memory'] / 2**20:9.1f} MiB")  # noqa: T201
+
+
+def _compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return regressions of the current results over the baseline."""
+    if current["parameters"] != baseline["parameters"]:
+        print(f"\nwarning: baseline parameters differ: {baseline['parameters']}")  # noqa: T201
+
+    regressions = []
+    print(f"\n{'size':>8} {'stage':>16} {'time':>8} {'memory':>8}  (change over baseline)")  # noqa: T201
+
+    for size, stages in current["results"].items():
+        for name, result in stages.items():
+            base = baseline["results"].get(size, {}).get(name)
+
+            if base is None:
+                continue
+
+            changes = []
+
+            for metric, minimum in (("time", _min_time), ("memory", _min_memory)):
+                change = result[metric] / base[metric] - 1 if base[metric] else 0
+                changes.append(f"{change:+8.1%}")
+
+                if change > threshold and max(result[metric], base[metric]) >= minimum:
+                    regressions.append(f"{size} points {name} {metric}: {change:+.1%}")
+
+            print(f"{size:>8} {name:>16} {' '.join(changes)}")  # noqa: T201
+
+    return regressions
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="Records in FIT file",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size, the best time is reported")
+    parser.add_argument("--interval", type=int, default=1, help="Seconds between records")
+    parser.add_argument("--corruption", type=float, default=0.001, help="Share of broken points of each kind")
+    parser.add_argument("--route-ratio", type=int, default=10, help="Records per route point")
+    parser.add_argument("--precision", type=float, help="Route interpolation precision (m), route model if not set")
+    parser.add_argument("--format", choices=("tcx", "fit"), default="tcx", help="Output format")
+    parser.add_argument("--save", type=Path, help="Write results as JSON baseline")
+    parser.add_argument("--compare", type=Path, help="Fail if results regress over JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    LOGGER.setLevel(logging.CRITICAL)  # broken points of the synthetic inputs are reported on every run
+
+    baseline = None if args.compare is None else json.loads(args.compare.read_text(encoding="utf-8"))
+    current = _run(args)
+
+    if args.save is not None:
+        args.save.write_text(json.dumps(current, indent=2), encoding="utf-8")
+
+    if baseline is None:
+        return
+
+    regressions = _compare(current, baseline, args.threshold)
+
+    if regressions:
+        print("\nregressions beyond the threshold:", *regressions, sep="\n  ")  # noqa: T201
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
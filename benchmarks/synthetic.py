@@ -0,0 +1,174 @@
+"""Synthetic input files for benchmarks."""
+
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from firome.classes.tracks import TIMESTAMP_DTYPE, ActivityTrack
+from firome.codecs.fit.crc import fit_crc
+from firome.codecs.fit.profile import FIT_UTC_REFERENCE
+
+_START = 1_700_000_000 - FIT_UTC_REFERENCE  # FIT timestamp of the first point
+_DAY = 24 * 60 * 60  # seconds
+
+MAX_SPEED = 10  # m/s, activity covers at most `MAX_SPEED * interval` meters per record
+
+_record_dtype = np.dtype(
+    [
+        ("header", "u1"),
+        ("timestamp", "<u4"),
+        ("distance", "<u4"),
+        ("speed", "<u2"),
+        ("power", "<u2"),
+        ("heart_rate", "u1"),
+        ("cadence", "u1"),
+    ],
+)  # packed, matches the record definition below
+_invalid = {"speed": 0xFFFF, "power": 0xFFFF, "heart_rate": 0xFF, "cadence": 0xFF}  # FIT invalid values
+
+
+@dataclass(frozen=True)
+class Corruption:
+    """Share of broken points by kind, as written by faulty head units."""
+
+    timestamps: float = 0  # wrong date or time, out of distance order
+    duplicates: float = 0  # points written twice
+    missing: float = 0  # per optional field: speed, power, heart rate and cadence in FIT, elevation in GPX
+
+    @classmethod
+    def uniform(cls, rate: float) -> "Corruption":
+        """Return the same share of broken points of each kind."""
+        return cls(rate, rate, rate)
+
+
+def write_fit(  # noqa: PLR0913  # generator configuration
+    path: Path,
+    points: int,
+    laps: int = 1,
+    *,
+    interval: int = 1,
+    corruption: Corruption | None = None,
+    seed: int = 0,
+) -> Path:
+    """Write FIT activity of given number of records with timestamp, distance, speed, power, HR and cadence.
+
+    Records are written every `interval` seconds, broken ones are chosen randomly by `seed`.
+    """
+    corruption = Corruption() if corruption is None else corruption
+    rng = np.random.default_rng(seed)
+
+    i = np.arange(points)
+    speed = 8 + 2 * np.sin(i * interval / 100)
+    timestamp = _START + i * interval
+
+    records = np.zeros(points, dtype=_record_dtype)
+    records["timestamp"] = timestamp
+    records["distance"] = np.cumsum(speed * interval) * 100
+    records["speed"] = speed * 1000
+    records["power"] = 150 + i % 50
+    records["heart_rate"] = 120 + i % 40
+    records["cadence"] = 80 + i % 20
+
+    broken = np.flatnonzero(rng.random(points) < corruption.timestamps)
+    wrong_date = rng.random(len(broken)) < 0.5  # noqa: PLR2004  # the rest is out of order within the day
+    shift = np.where(wrong_date, rng.choice([-2, -1, 1, 2], len(broken)) * _DAY, rng.integers(-600, 600, len(broken)))
+    records["timestamp"][broken] = timestamp[broken] + shift
+
+    for name, invalid in _invalid.items():
+        records[name][rng.random(points) < corruption.missing] = invalid
+
+    copies = 1 + (rng.random(points) < corruption.duplicates)
+    records = np.repeat(records, copies)
+
+    lap_size = max(points // laps, 1)
+    lap_ends = (np.cumsum(copies) - 1)[lap_size - 1 :: lap_size]  # last copy of the last record of each lap
+    lap_timestamps = timestamp[lap_size - 1 :: lap_size]
+
+    body = bytearray()
+
+    # definition of local message 0: record
+    body += struct.pack("<BBBHB", 0x40, 0, 0, 20, 6)
+    body += bytes((253, 4, 0x86, 5, 4, 0x86, 6, 2, 0x84, 7, 2, 0x84, 3, 1, 0x02, 4, 1, 0x02))
+    # definition of local message 1: lap
+    body += struct.pack("<BBBHB", 0x41, 0, 0, 19, 2)
+    body += bytes((253, 4, 0x86, 24, 1, 0x00))
+
+    lap = struct.Struct("<BIB")
+    start = 0
+
+    for end, lap_timestamp in zip(lap_ends.tolist(), lap_timestamps.tolist(), strict=True):
+        body += records[start : end + 1].tobytes()
+        body += lap.pack(1, lap_timestamp, 0)
+        start = end + 1
+
+    body += records[start:].tobytes()
+
+    data = struct.pack("<BBHI4s", 12, 0x20, 2132, len(body), b".FIT") + body
+
+    path.write_bytes(data + struct.pack("<H", fit_crc(data)))
+
+    return path
+
+
+def write_gpx(path: Path, points: int, length: float, *, corruption: Corruption | None = None, seed: int = 0) -> Path:
+    """Write GPX track of given number of points evenly spread over `length` meters.
+
+    Broken points are chosen randomly by `seed`, there are no timestamps in the route to break.
+    """
+    corruption = Corruption() if corruption is None else corruption
+    rng = np.random.default_rng(seed)
+
+    distance = np.linspace(0, length, points)
+    lat = 55 + distance / 111_000 + 0.001 * np.sin(distance / 500)
+    lon = 37 + distance / 64_000
+    ele = 150 + 10 * np.sin(distance / 1000)
+
+    no_ele = rng.random(points) < corruption.missing
+    copies = 1 + (rng.random(points) < corruption.duplicates)
+
+    lines = [
+        f'<trkpt lat="{lat_:.7f}" lon="{lon_:.7f}">' + ("" if no_ele_ else f"<ele>{ele_:.1f}</ele>") + "</trkpt>\n"
+        for lat_, lon_, ele_, no_ele_ in zip(
+            np.repeat(lat, copies).tolist(),
+            np.repeat(lon, copies).tolist(),
+            np.repeat(ele, copies).tolist(),
+            np.repeat(no_ele, copies).tolist(),
+            strict=True,
+        )
+    ]
+
+    with path.open("w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<gpx version="1.1" creator="firome-benchmarks" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        f.write("<trk><trkseg>\n")
+        f.writelines(lines)
+        f.write("</trkseg></trk>\n</gpx>\n")
+
+    return path
+
+
+def activity_track(points: int, laps: int = 1) -> ActivityTrack:
+    """Return 1 Hz activity merged with route, every 100th point misses heart rate and every 250th misses position."""
+    i = np.arange(points)
+    speed = np.round(8 + 2 * np.sin(i / 100), 3).astype(np.float32)  # FIT stores speed in mm/s
+    distance = np.round(np.cumsum(speed.astype(np.float64)), 2)
+
+    no_position = i % 250 == 0
+
+    def channel(values, *, mask=False):
+        return np.ma.MaskedArray(values, mask=np.broadcast_to(mask, values.shape).copy())
+
+    return ActivityTrack(
+        timestamp=(_START + FIT_UTC_REFERENCE + i).astype(TIMESTAMP_DTYPE),
+        distance=distance,
+        lap=(1 + i // max(points // laps, 1)).astype(np.int32),
+        speed=channel(speed),
+        power=channel((150 + i % 50).astype(np.int16)),
+        heart_rate=channel((120 + i % 40).astype(np.int16), mask=i % 100 == 0),
+        cadence=channel((80 + i % 20).astype(np.int16)),
+        lat=channel(55 + distance / 111_000, mask=no_position),
+        lon=channel(37 + distance / 64_000, mask=no_position),
+        elevation=channel(150 + 10 * np.sin(distance / 1000)),
+    )
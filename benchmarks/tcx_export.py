@@ -0,0 +1,141 @@
+"""Compare streaming TCX exporter with the element tree based one it replaced.
+
+Streaming exporter is run with the full precision to produce the same output, and with the default one.
+
+Usage: python -m benchmarks.tcx_export --points 100000
+"""
+
+import argparse
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from lxml import etree
+
+from firome import __version__
+from firome.classes.export import ExportFields, ExportPrecision
+from firome.classes.points import DataPoint
+from firome.classes.tracks import ActivityTrack
+from firome.codecs.tcx import export_as_tcx
+from firome.codecs.tcx.common import _namespaces, _time_format, _with_ns
+from firome.codecs.tcx.export import _root_attrs
+
+from .synthetic import activity_track
+
+
+def _fitdecode_points(track: ActivityTrack) -> list[DataPoint]:
+    """Return data points the replaced exporter was given: speed parsed by `fitdecode` is 1 mm/s units / 1000."""
+    points = list(track)
+
+    for p in points:
+        if p.speed is not None:
+            p.speed = round(p.speed * 1000) / 1000  # float32 speed holds the exact FIT value of mm/s
+
+    return points
+
+
+def _export_tree(points: list[DataPoint], destination: str, fields: ExportFields):
+    """Element tree based exporter, reference for the output and the throughput, formatting is kept verbatim."""
+    start_ts = points[0].timestamp.strftime(_time_format)
+
+    root = etree.Element(_with_ns("TrainingCenterDatabase"), _root_attrs, nsmap=_namespaces)
+    activities = etree.SubElement(root, _with_ns("Activities"))
+    activity = etree.SubElement(activities, _with_ns("Activity"), {"Sport": "Biking"})
+    etree.SubElement(activity, _with_ns("Id")).text = start_ts
+    etree.SubElement(activity, _with_ns("Notes")).text = f"Merged by firome {__version__}"
+
+    lap_i = 0
+    track = None
+
+    for p in points:
+        if p.lap != lap_i:
+            lap_i = p.lap
+            lap = etree.SubElement(activity, _with_ns("Lap"), {"StartTime": start_ts})
+            etree.SubElement(lap, _with_ns("TriggerMethod")).text = "Manual"
+            track = etree.SubElement(lap, _with_ns("Track"))
+
+        _append_point(p, track, fields)
+
+    root.getroottree().write(destination, encoding="utf-8", xml_declaration=True)
+
+
+def _append_point(p: DataPoint, track: etree.ElementBase, fields: ExportFields):
+    point = etree.SubElement(track, _with_ns("Trackpoint"))
+    etree.SubElement(point, _with_ns("Time")).text = p.timestamp.strftime(_time_format)
+
+    if p.position is not None:
+        position = etree.SubElement(point, _with_ns("Position"))
+        etree.SubElement(position, _with_ns("LatitudeDegrees")).text = str(p.position[0])
+        etree.SubElement(position, _with_ns("LongitudeDegrees")).text = str(p.position[1])
+
+    if fields.altitude and p.elevation is not None:
+        etree.SubElement(point, _with_ns("AltitudeMeters")).text = str(p.elevation)
+
+    if fields.distance:
+        etree.SubElement(point, _with_ns("DistanceMeters")).text = str(p.distance)
+
+    if fields.heart_rate and p.heart_rate is not None:
+        hr = etree.SubElement(point, _with_ns("HeartRateBpm"))
+        etree.SubElement(hr, _with_ns("Value")).text = str(p.heart_rate)
+
+    if fields.cadence and p.cadence is not None:
+        etree.SubElement(point, _with_ns("Cadence")).text = str(p.cadence)
+
+    need_speed = fields.speed and p.speed is not None
+    need_power = fields.power and p.power is not None
+
+    if need_speed or need_power:
+        tpx = etree.SubElement(etree.SubElement(point, _with_ns("Extensions")), _with_ns("TPX", "ns3"))
+        if need_speed:
+            etree.SubElement(tpx, _with_ns("Speed", "ns3")).text = str(p.speed)
+        if need_power:
+            etree.SubElement(tpx, _with_ns("Watts", "ns3")).text = str(p.power)
+
+
+def _measure(export, points, destination: str, fields: ExportFields, repeat: int) -> float:
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        export(points, destination, fields)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[10_000, 100_000], help="Trackpoints in activity")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per exporter, best is reported")
+    args = parser.parse_args()
+
+    fields = ExportFields(altitude=True)
+
+    with tempfile.TemporaryDirectory(prefix="firome-bench-") as tmp:
+        for points in args.points:
+            track = activity_track(points, laps=10)
+            outputs = {}
+
+            exporters = (
+                ("tree", _export_tree, _fitdecode_points(track), ".tcx"),
+                ("streaming", partial(export_as_tcx, precision=ExportPrecision.full()), track, ".tcx"),
+                ("rounded", export_as_tcx, track, ".tcx"),
+                ("gzip", export_as_tcx, track, ".tcx.gz"),
+            )
+
+            for name, export, data, suffix in exporters:
+                outputs[name] = Path(tmp, name + suffix)
+                elapsed = _measure(export, data, str(outputs[name]), fields, args.repeat)
+                size = outputs[name].stat().st_size / 1024 / 1024
+                print(  # noqa: T201
+                    f"{name:>10} {points:>9} points {elapsed:8.3f}s {points / elapsed:12.0f} points/s {size:8.2f} MiB",
+                )
+
+            same = outputs["tree"].read_bytes() == outputs["streaming"].read_bytes()
+            print(f"{'':>10} {points:>9} points output is {'identical' if same else 'DIFFERENT'}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -2,54 +2,395 @@ import argparse
 import logging
 import sys
 import time
+from contextlib import nullcontext
+from multiprocessing import freeze_support
 from pathlib import Path
 
 from firome import __version__
-from firome.codecs.fit import parse_fit
-from firome.codecs.gpx import interpolate, parse_gpx
-from firome.codecs.tcx import export_as_tcx
+from firome.classes.export import OUTPUT_FORMATS, ExportFields, ExportPrecision
 from firome.logger import LOGGER
-from firome.merge import merge
+from firome.progress import Progress, ProgressReport
+
+# merging modules import numpy, scipy and parsers, they're imported by commands to keep `--help` and `--version` fast
+
+
+__progress_interval = 0.2  # seconds between progress updates in the terminal
+__progress_width = 72  # characters of progress line, cleared on update
 
 
 def __no_prio_args():
     return "--version" not in sys.argv
 
 
+common = argparse.ArgumentParser(add_help=False)
+common.add_argument("--output", choices=OUTPUT_FORMATS, default="tcx", help="Output format")
+common.add_argument(
+    "--full-precision",
+    action="store_true",
+    help="Export TCX values as they are stored instead of rounding positions to 7 decimals and distances to 0.1 m",
+)
+common.add_argument(
+    "--fields",
+    nargs="+",
+    choices=ExportFields.list_fields(),
+    default=None,
+    help="Exported data fields, other channels are not parsed. By default all fields except altitude are exported",
+)
+common.add_argument(
+    "--stream",
+    action="store_true",
+    help="Process recording in chunks with bounded memory, for very long activities",
+)
+common.add_argument(
+    "--simplify-tolerance",
+    type=float,
+    default=None,
+    help="Drop points within the tolerance of the simplified track (Ramer-Douglas-Peucker on position and elevation), "
+    "meters",
+)
+common.add_argument(
+    "--simplify-interval",
+    type=float,
+    default=None,
+    help="Keep a point per interval along with power and heart rate peaks of the interval, seconds",
+)
+common.add_argument(
+    "--simplify-spacing",
+    type=float,
+    default=None,
+    help="Keep a point per distance along with power and heart rate peaks of the distance, meters",
+)
+common.add_argument("--no-cache", action="store_true", help="Parse input files without using the cache")
+common.add_argument("--cache-dir", type=Path, default=None, help="Directory of the cache of parsed input files")
+common.add_argument("--debug", action="store_true", help="Enable debug logging")
+
+profiling = argparse.ArgumentParser(add_help=False)
+profiling.add_argument(
+    "--profile",
+    action="store_true",
+    help="Print wall and CPU time, memory and processed items of each processing stage",
+)
+profiling.add_argument("--metrics-json", type=Path, default=None, help="Write stage statistics to JSON file")
+profiling.add_argument(
+    "--trace-memory",
+    action="store_true",
+    help="Measure memory peak of the stages with tracemalloc, slows down",
+)
+
 parser = argparse.ArgumentParser(
     description="Combines GPX file with training data with GPX file with position data based on the distance",
+    epilog="Run `firome batch --help` for processing of many files at once, "
+    "`firome watch --help` for processing of files appearing in a directory, "
+    "`firome serve --help` for HTTP service",
+    parents=[common, profiling],
 )
 parser.add_argument("--route", type=Path, required=__no_prio_args(), help="Path to GPX file with route of the training")
 parser.add_argument(
-    "--recording", type=Path, required=__no_prio_args(), help="Path to FIT file with GPS-less data of the training",
+    "--recording",
+    type=Path,
+    required=__no_prio_args(),
+    help="Path to FIT file with GPS-less data of the training",
+)
+parser.add_argument(
+    "--precision",
+    type=float,
+    default=None,
+    help="Precision of interpolation, meters. By default route is evaluated exactly at activity distances",
+)
+parser.add_argument(
+    "--profile-dir",
+    type=Path,
+    default=None,
+    help="Write cProfile statistics of each stage to the directory",
 )
-parser.add_argument("--precision", type=float, default=1.0, help="Precision of interpolation, meters")
-parser.add_argument("--output", choices=["tcx"], default="tcx", help="Output format")
-parser.add_argument("--debug", action="store_true", help="Enable debug logging")
 parser.add_argument("--version", action="store_true", help="Print app version")
 
-if __name__ == "__main__":
-    args = parser.parse_args()
+batch_parser = argparse.ArgumentParser(
+    prog="firome batch",
+    description="Runs merges listed in the manifest in parallel. "
+    "Manifest is a CSV file with `route,recording,output,precision` header or JSON list of objects with the same keys, "
+    "only route and recording are required. Output is named after the recording if it's not set",
+    parents=[common, profiling],
+)
+batch_parser.add_argument("manifest", type=Path, help="Path to CSV or JSON manifest")
+batch_parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of worker processes, number of CPU cores by default",
+)
+batch_parser.add_argument(
+    "--output-dir",
+    type=Path,
+    default=Path(),
+    help="Directory of outputs not set in the manifest",
+)
+
+watch_parser = argparse.ArgumentParser(
+    prog="firome watch",
+    description="Watches inbox directory merging new recordings with the route and moving results to the outbox. "
+    "Route of the recording can be set in sidecar file, e.g. `ride.route` for `ride.fit`, containing path to GPX file "
+    "relative to the inbox",
+    parents=[common],
+)
+watch_parser.add_argument("inbox", type=Path, help="Directory of new FIT files")
+watch_parser.add_argument("outbox", type=Path, help="Directory of merged files")
+watch_parser.add_argument("--route", type=Path, default=None, help="Path to GPX file of recordings without sidecar")
+watch_parser.add_argument(
+    "--precision",
+    type=float,
+    default=None,
+    help="Precision of interpolation, meters. By default route is evaluated exactly at activity distances",
+)
+watch_parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of worker processes, number of CPU cores by default",
+)
+watch_parser.add_argument("--interval", type=float, default=2, help="Inbox polling interval, seconds")
+watch_parser.add_argument(
+    "--ledger",
+    type=Path,
+    default=None,
+    help="File of processed recordings, `.firome-ledger.jsonl` in outbox by default",
+)
+
+serve_parser = argparse.ArgumentParser(
+    prog="firome serve",
+    description="Serves merges over HTTP: POST /merge with multipart form of `route` and `recording` files "
+    "and optional `precision` and `output` fields responds with the merged file, GET /metrics reports "
+    "request latency and queue depth",
+    parents=[common],
+)
+serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+serve_parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+serve_parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of worker processes, number of CPU cores by default",
+)
+serve_parser.add_argument(
+    "--queue",
+    type=int,
+    default=16,
+    help="Merges waiting for a worker, requests over the limit are rejected",
+)
+serve_parser.add_argument("--timeout", type=float, default=60, help="Request timeout, seconds")
+serve_parser.add_argument("--max-upload", type=int, default=64, help="Maximum request size, MiB")
+serve_parser.add_argument("--max-routes", type=int, default=256, help="Size of stored uploaded routes, MiB")
+
+
+def __options(args):
+    from firome.pipeline import Options  # noqa: PLC0415  # see module imports
+    from firome.simplify import Simplification  # noqa: PLC0415  # see module imports
+
+    fields = ExportFields()
+
+    if args.fields is not None:
+        fields = ExportFields(**{name: name in args.fields for name in ExportFields.list_fields()})
+
+    return Options(
+        fields=fields,
+        precision=ExportPrecision.full() if args.full_precision else ExportPrecision(),
+        output_format=args.output,
+        stream=args.stream,
+        simplification=Simplification(args.simplify_tolerance, args.simplify_interval, args.simplify_spacing),
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        profile=__profiled(args),
+        trace_memory=getattr(args, "trace_memory", False),
+    )
+
+
+def __profiled(args) -> bool:
+    return getattr(args, "profile", False) or getattr(args, "metrics_json", None) is not None
+
+
+def __profiler(args):
+    from firome.profiling import Profiler  # noqa: PLC0415  # see module imports
+
+    return Profiler(trace_memory=args.trace_memory, profile_dir=getattr(args, "profile_dir", None))
+
+
+def __report(profiler, args):
+    if args.profile:
+        LOGGER.info("\n%s", profiler.table())
+
+    if args.metrics_json is not None:
+        profiler.write_json(args.metrics_json)
+        LOGGER.info("stage statistics: %s", args.metrics_json)
+
+    for path in profiler.dump_profiles():
+        LOGGER.info("profile: %s", path)
 
+
+def __throughput():
+    """Return progress callback showing progress and throughput of the running stage in the terminal."""
+    started: dict[str, float] = {}
+    shown = 0.0
+
+    def show(report: ProgressReport):
+        nonlocal shown
+
+        now = time.perf_counter()
+        start = started.setdefault(report.stage, now)
+
+        if now - shown < __progress_interval and report.done != report.total:
+            return
+
+        shown = now
+        rate = report.done / max(now - start, 1e-9)
+
+        if report.unit == "bytes":
+            amount = f"{report.done / 2**20:.1f} MiB, {rate / 2**20:.1f} MiB/s"
+        else:
+            amount = f"{report.done} {report.unit}, {rate:.0f} {report.unit}/s"
+
+        percent = "" if report.total is None else f"{report.done / max(report.total, 1):4.0%} "
+
+        sys.stderr.write(f"\r{report.stage}: {percent}{amount}".ljust(__progress_width))
+        sys.stderr.flush()
+
+    return show
+
+
+def __run_single(args):
     if args.version:
         print("Firome version", __version__)  # noqa: T201  # not for debug
         print("Python version", sys.version)  # noqa: T201  # not for debug
         sys.exit(0)
 
+    from firome.pipeline import Job, process  # noqa: PLC0415  # see module imports
+
     LOGGER.info("route: %s", args.route)
     LOGGER.info("recording: %s", args.recording)
 
-    if args.debug:
-        LOGGER.setLevel(logging.DEBUG)
+    # archive with several recordings results in an output per recording, suffixed with the recording name
+    output = Path(f"{int(time.time())}.{args.output}")
+    job = Job(args.route, args.recording.resolve(), output, args.precision)
+
+    # throughput is shown only in the terminal, not in redirected output
+    progress = Progress(__throughput()) if sys.stderr.isatty() else None
+
+    profiler = __profiler(args) if __profiled(args) or args.profile_dir is not None else None
+    options = __options(args)
+
+    try:
+        with nullcontext() if profiler is None else profiler.activate():
+            result = process(job, options, progress=progress)
+    finally:
+        if progress is not None:
+            sys.stderr.write("\r".ljust(__progress_width) + "\r")  # clear the progress line
+
+    if profiler is not None:
+        __report(profiler, args)
+
+    if options.simplification.enabled:
+        LOGGER.info(
+            "simplified: %d of %d points exported (%.1f%%)",
+            result.exported,
+            result.points,
+            100 * result.exported / max(result.points, 1),
+        )
+
+    for path in result.outputs:
+        LOGGER.info("\nresult: %s", path)
+
+
+def __run_batch(args):
+    from firome.pipeline import ManifestError, read_manifest, run_batch, summarize  # noqa: PLC0415  # see module imports
 
-    route_points = interpolate(parse_gpx(args.route), args.precision)
-    activity_points = parse_fit(args.recording.resolve())
+    try:
+        jobs = read_manifest(args.manifest)
+    except ManifestError as e:
+        LOGGER.error("%s", e)
+        sys.exit(2)
 
-    points = merge(route_points, activity_points, args.precision)
+    LOGGER.info("%d jobs from %s", len(jobs), args.manifest)
 
-    if args.output == "tcx":
-        output_path = f"{int(time.time())}.tcx"
+    started = time.perf_counter()
+    results = []
+    profiler = __profiler(args)
 
-        export_as_tcx(points, output_path)
+    for result in run_batch(jobs, __options(args), args.output_dir, args.workers):
+        results.append(result)
+
+        if result.stages is not None:
+            profiler.merge(result.stages)
+
+        if result.error is None:
+            outputs = ", ".join(map(str, result.outputs))
+            LOGGER.info(
+                "done %s -> %s (%d points, %.2f s)",
+                result.job.recording,
+                outputs,
+                result.points,
+                result.elapsed,
+            )
+        else:
+            LOGGER.error("failed %s: %s", result.job.recording, result.error)
+
+    summary = summarize(results, time.perf_counter() - started)
+    LOGGER.info("\n%s", summary)
+
+    if __profiled(args):
+        __report(profiler, args)  # stages of all workers, time is the sum over the workers
+
+    if summary.failed:
+        sys.exit(1)
+
+
+def __run_watch(args):
+    from firome.watch import Watcher  # noqa: PLC0415  # see module imports
+
+    watcher = Watcher(
+        args.inbox,
+        args.outbox,
+        route=args.route,
+        precision=args.precision,
+        options=__options(args),
+        workers=args.workers,
+        interval=args.interval,
+        ledger=args.ledger,
+    )
+    watcher.run()
+
+
+def __run_serve(args):
+    from firome.serve import Server  # noqa: PLC0415  # see module imports
+
+    server = Server(
+        __options(args),
+        args.host,
+        args.port,
+        workers=args.workers,
+        queue_size=args.queue,
+        timeout=args.timeout,
+        max_upload=args.max_upload * 1024 * 1024,
+        max_routes=args.max_routes * 1024 * 1024,
+    )
+    server.run()
+
+
+__commands = {
+    "batch": (batch_parser, __run_batch),
+    "watch": (watch_parser, __run_watch),
+    "serve": (serve_parser, __run_serve),
+}
+
+if __name__ == "__main__":
+    freeze_support()  # pool workers of the frozen executable
+
+    command_parser, run = parser, __run_single
+
+    if len(sys.argv) > 1 and sys.argv[1] in __commands:
+        command_parser, run = __commands[sys.argv.pop(1)]
+
+    args = command_parser.parse_args()
+
+    if args.debug:
+        LOGGER.setLevel(logging.DEBUG)
 
-        LOGGER.info("\nresult: %s", output_path)
+    run(args)
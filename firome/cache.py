@@ -0,0 +1,203 @@
+"""On-disk cache of parsed tracks keyed by the input file content."""
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from dataclasses import asdict, fields
+from pathlib import Path
+
+import numpy as np
+
+from .classes.export import ExportFields
+from .classes.tracks import ActivityTrack, RouteTrack
+from .codecs import PARSER_VERSION
+from .codecs.fit import parse_fit
+from .codecs.gpx import interpolate, parse_gpx
+from .codecs.zip import Source
+from .geodesy import Accuracy
+from .logger import LOGGER
+from .profiling import count, stage
+from .progress import Progress
+
+_default_max_size = 512 * 1024 * 1024  # bytes
+_hash_block_size = 1024 * 1024  # bytes
+_mask_suffix = ".mask"
+_entry_suffix = ".npz"
+
+
+def default_cache_dir() -> Path:
+    """Return platform-specific user cache directory for firome."""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+
+    return Path(base) / "firome"
+
+
+class TrackCache:
+    """Cache of parsed and interpolated tracks.
+
+    Entries are keyed by the input file content hash, `PARSER_VERSION` and parsing parameters, and stored as
+    uncompressed NumPy archives. Least recently used entries are evicted when cache exceeds `max_size` bytes.
+    Disabled cache parses inputs every time. Route distances are measured with given `accuracy`.
+    """
+
+    def __init__(
+        self,
+        directory: Path | None = None,
+        max_size: int = _default_max_size,
+        *,
+        enabled: bool = True,
+        accuracy: Accuracy = Accuracy.ELLIPSOID,
+    ):
+        self.directory = default_cache_dir() if directory is None else directory
+        self.max_size = max_size
+        self.enabled = enabled
+        self.accuracy = accuracy
+
+    def load_route(
+        self,
+        src: Path | Source,
+        precision: float | None = None,
+        progress: Progress | None = None,
+    ) -> RouteTrack:
+        """Return route parsed from GPX file, interpolated with given precision if it's set.
+
+        Parsing and interpolation report to `progress` token, see `firome.progress`.
+        """
+
+        def compute():
+            track = parse_gpx(src, progress, accuracy=self.accuracy)
+            return track if precision is None else interpolate(track, precision, progress, accuracy=self.accuracy)
+
+        return self.__cached(src, RouteTrack, {"precision": precision, "accuracy": self.accuracy.value}, compute)
+
+    def load_activity(
+        self,
+        src: Path | Source,
+        fields: ExportFields | None = None,
+        progress: Progress | None = None,
+    ) -> ActivityTrack:
+        """Return activity parsed from FIT file, see `parse_fit`."""
+        params = {"fields": None if fields is None else asdict(fields)}
+
+        return self.__cached(src, ActivityTrack, params, lambda: parse_fit(src, fields, progress=progress))
+
+    def __cached(self, src: Path | Source, cls: type, params: dict, compute):
+        if not self.enabled:
+            return compute()
+
+        with stage("cache_read"):
+            path = self.directory / (_key(src, cls, params) + _entry_suffix)
+            track = _read(path, cls)
+            count("hits" if track is not None else "misses")
+
+        if track is not None:
+            LOGGER.debug("cache hit for %s: %s", src, path)
+            return track
+
+        track = compute()
+
+        try:
+            with stage("cache_write"):
+                _write(path, track)
+                self.__evict()
+        except OSError as e:
+            LOGGER.warning("failed to write cache entry %s: %s", path, e)
+
+        return track
+
+    def __evict(self):
+        """Remove least recently used entries until cache fits into the size limit."""
+        evict(self.directory, "*" + _entry_suffix, self.max_size)
+
+
+def evict(directory: Path, pattern: str, max_size: int):
+    """Remove least recently modified files matching the pattern until they fit into `max_size` bytes.
+
+    The most recent file is kept even if it doesn't fit alone, it's the one just stored.
+    """
+    entries = []
+
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # removed concurrently
+            continue
+
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries)[:-1]:
+        if total <= max_size:
+            break
+
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def _key(src: Path | Source, cls: type, params: dict) -> str:
+    source = src if isinstance(src, Source) else Source(src)
+    digest = hashlib.sha256()
+
+    # whole archive is hashed for archive members, member name makes the difference
+    with source.path.open("rb") as f:
+        while block := f.read(_hash_block_size):
+            digest.update(block)
+
+    digest.update(json.dumps([PARSER_VERSION, cls.__name__, source.member, params], sort_keys=True).encode())
+
+    return digest.hexdigest()
+
+
+def _write(path: Path, track: ActivityTrack | RouteTrack):
+    """Store track columns atomically, masks are stored only if there are missing values."""
+    arrays = {}
+
+    for f in fields(track):
+        column = getattr(track, f.name)
+
+        if column is None:
+            continue
+
+        arrays[f.name] = np.ma.getdata(column)
+
+        if np.ma.is_masked(column):
+            arrays[f.name + _mask_suffix] = np.ma.getmaskarray(column)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp:
+        np.savez(tmp, **arrays)
+
+    Path(tmp.name).replace(path)
+
+
+def _read(path: Path, cls: type):
+    """Return cached track, `None` if there is no valid entry."""
+    try:
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+
+        os.utime(path)  # mark as recently used
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        LOGGER.warning("dropping broken cache entry %s: %s", path, e)
+        path.unlink(missing_ok=True)
+        return None
+
+    columns = {}
+
+    for f in fields(cls):
+        if f.name not in arrays:
+            continue
+
+        data = arrays[f.name]
+        mask = arrays.get(f.name + _mask_suffix, np.zeros(data.shape, dtype=bool))
+
+        # required columns are plain arrays
+        columns[f.name] = np.ma.MaskedArray(data, mask=mask) if f.default is None else data
+
+    return cls(**columns)
@@ -1,5 +1,7 @@
 from dataclasses import asdict, dataclass
 
+OUTPUT_FORMATS = ("tcx", "tcx.gz", "fit")
+
 
 @dataclass
 class ExportFields:
@@ -16,3 +18,18 @@ class ExportFields:
     def list_fields(cls):
         """List of field names."""
         return asdict(cls()).keys()
+
+
+@dataclass
+class ExportPrecision:
+    """Decimal places of exported values, `None` keeps the shortest representation of the stored value."""
+
+    position: int | None = 7  # ~1 cm
+    altitude: int | None = 1
+    distance: int | None = 1
+    speed: int | None = 3
+
+    @classmethod
+    def full(cls):
+        """Precision keeping values as they are stored."""
+        return cls(position=None, altitude=None, distance=None, speed=None)
@@ -4,7 +4,7 @@ from datetime import datetime
 Position = tuple[float, float]
 
 
-@dataclass
+@dataclass(slots=True)
 class DataPoint:
     """Single activity data point."""
 
@@ -20,7 +20,7 @@ class DataPoint:
     elevation: float = None
 
 
-@dataclass
+@dataclass(slots=True)
 class PositionPoint:
     """Single position point."""
 
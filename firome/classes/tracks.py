@@ -0,0 +1,164 @@
+from dataclasses import dataclass, fields, replace
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .points import DataPoint, PositionPoint
+
+TIMESTAMP_DTYPE = "datetime64[s]"
+
+
+def masked(values: list, dtype) -> np.ma.MaskedArray:
+    """Build masked array from values where `None` is a missing value.
+
+    Values not fitting into the integer `dtype` are treated as missing too.
+    """
+    data = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    mask = np.isnan(data)
+
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        mask |= (data < info.min) | (data > info.max)
+
+    return np.ma.MaskedArray(np.where(mask, 0, data).astype(dtype), mask=mask)
+
+
+def _value(channel: np.ma.MaskedArray | None, idx: int):
+    if channel is None or np.ma.getmaskarray(channel)[idx]:
+        return None
+
+    return channel.data[idx].item()
+
+
+class _Columns:
+    """Common operations of column-based tracks. Optional channels are `None` if missing completely."""
+
+    def __len__(self):
+        return len(self.distance)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return self._row(range(len(self))[idx])
+
+        return self.take(idx)
+
+    def take(self, idx):
+        """Return new track made of rows selected by slice, index or boolean mask array."""
+        columns = {f.name: getattr(self, f.name) for f in fields(self)}
+
+        return replace(self, **{k: None if v is None else v[idx] for k, v in columns.items()})
+
+    def _row(self, idx: int):
+        raise NotImplementedError
+
+
+@dataclass(eq=False)
+class ActivityTrack(_Columns):
+    """Activity data points stored column-wise.
+
+    Iterating or indexing by `int` returns `DataPoint` row view.
+    """
+
+    timestamp: np.ndarray  # datetime64[s], UTC
+    distance: np.ndarray  # float64
+    lap: np.ndarray  # int32
+    speed: np.ma.MaskedArray | None = None  # float32
+    power: np.ma.MaskedArray | None = None  # int16
+    heart_rate: np.ma.MaskedArray | None = None  # int16
+    cadence: np.ma.MaskedArray | None = None  # int16
+
+    lat: np.ma.MaskedArray | None = None  # float64
+    lon: np.ma.MaskedArray | None = None  # float64
+    elevation: np.ma.MaskedArray | None = None  # float64
+
+    @classmethod
+    def from_points(cls, points: list[DataPoint]) -> "ActivityTrack":
+        """Build track from data point list."""
+        has_position = any(p.position is not None for p in points)
+
+        return cls(
+            timestamp=np.array([_to_datetime64(p.timestamp) for p in points], dtype=TIMESTAMP_DTYPE),
+            distance=np.array([p.distance for p in points], dtype=np.float64),
+            lap=np.array([p.lap or 0 for p in points], dtype=np.int32),
+            speed=masked([p.speed for p in points], np.float32),
+            power=masked([p.power for p in points], np.int16),
+            heart_rate=masked([p.heart_rate for p in points], np.int16),
+            cadence=masked([p.cadence for p in points], np.int16),
+            lat=masked([p.position and p.position[0] for p in points], np.float64) if has_position else None,
+            lon=masked([p.position and p.position[1] for p in points], np.float64) if has_position else None,
+            elevation=masked([p.elevation for p in points], np.float64),
+        )
+
+    def _row(self, idx: int) -> DataPoint:
+        lat = _value(self.lat, idx)
+        lon = _value(self.lon, idx)
+
+        return DataPoint(
+            timestamp=self.timestamp[idx].astype(datetime).replace(tzinfo=timezone.utc),
+            speed=_value(self.speed, idx),
+            power=_value(self.power, idx),
+            heart_rate=_value(self.heart_rate, idx),
+            cadence=_value(self.cadence, idx),
+            lap=self.lap[idx].item(),
+            position=None if lat is None or lon is None else (lat, lon),
+            distance=self.distance[idx].item(),
+            elevation=_value(self.elevation, idx),
+        )
+
+
+@dataclass(eq=False)
+class RouteTrack(_Columns):
+    """Route position points stored column-wise.
+
+    Iterating or indexing by `int` returns `PositionPoint` row view.
+    """
+
+    lat: np.ndarray  # float64
+    lon: np.ndarray  # float64
+    distance: np.ndarray  # float64
+    elevation: np.ma.MaskedArray | None = None  # float64
+
+    @classmethod
+    def from_points(cls, points: list[PositionPoint]) -> "RouteTrack":
+        """Build track from position point list."""
+        return cls(
+            lat=np.array([p.position[0] for p in points], dtype=np.float64),
+            lon=np.array([p.position[1] for p in points], dtype=np.float64),
+            distance=np.array([p.distance for p in points], dtype=np.float64),
+            elevation=masked([p.elevation for p in points], np.float64),
+        )
+
+    def _row(self, idx: int) -> PositionPoint:
+        return PositionPoint(
+            position=(self.lat[idx].item(), self.lon[idx].item()),
+            distance=self.distance[idx].item(),
+            elevation=_value(self.elevation, idx),
+        )
+
+
+def filled_elevation(track: ActivityTrack | RouteTrack) -> np.ndarray | None:
+    """Return elevation with missing values interpolated by distance, `None` if it's missing everywhere."""
+    if track.elevation is None:
+        return None
+
+    known = ~np.ma.getmaskarray(track.elevation)
+    elevation = track.elevation.data.astype(np.float64)
+
+    if not known.any():
+        return None
+
+    if known.all():
+        return elevation
+
+    return np.interp(track.distance, track.distance[known], elevation[known])
+
+
+def _to_datetime64(value: datetime) -> np.datetime64:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return np.datetime64(value, "s")
@@ -1 +1,4 @@
 """Functions operating input and output files."""
+
+# version of parsed tracks, bumped whenever parsing changes their content, invalidates cached tracks
+PARSER_VERSION = 1
@@ -0,0 +1,24 @@
+"""Chunks of exported tracks."""
+
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import chain
+
+from ..classes.tracks import ActivityTrack
+from ..progress import slices
+
+
+def export_parts(chunks: Iterable[ActivityTrack]) -> tuple[ActivityTrack, Iterator[ActivityTrack], int | None]:
+    """Split chunks into parts exported at once, see `firome.progress.slices`.
+
+    Return the first part, iterator of all the parts starting with it, and the total of points if chunks are given
+    as a sequence. Raise `ValueError` if there are no points.
+    """
+    total = sum(map(len, chunks)) if isinstance(chunks, Sequence) else None
+    parts = (chunk[part] for chunk in chunks for part in slices(len(chunk)))
+    first = next(parts, None)
+
+    if first is None:
+        msg = "no data points to export"
+        raise ValueError(msg)
+
+    return first, chain([first], parts), total
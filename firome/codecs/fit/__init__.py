@@ -1,5 +1,14 @@
 """FIT file operations."""
 
-from .parse import parse_fit
+from .export import export_as_fit, export_chunks_as_fit
+from .parse import fit_sources, parse_fit, parse_fit_chunks
+from .timestamps import StreamingError
 
-__all__ = ["parse_fit"]
+__all__ = [
+    "StreamingError",
+    "export_as_fit",
+    "export_chunks_as_fit",
+    "fit_sources",
+    "parse_fit",
+    "parse_fit_chunks",
+]
@@ -0,0 +1,76 @@
+"""FIT CRC-16 (CRC-16/ARC) computed over blocks of data in parallel.
+
+CRC without final XOR is linear: CRC of the concatenation is the CRC of the first part shifted over the length of
+the second one, XORed with CRC of the second part. So equal blocks are processed all at once with NumPy and then
+combined using precomputed shift tables.
+"""
+
+from functools import cache
+
+import numpy as np
+
+_POLY = 0xA001  # reflected 0x8005
+_block_size = 1024  # bytes
+_min_parallel_size = 4 * _block_size  # smaller data is processed byte by byte
+
+
+def _make_table() -> np.ndarray:
+    table = np.arange(256, dtype=np.uint16)
+
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ _POLY, table >> 1).astype(np.uint16)
+
+    return table
+
+
+_table = _make_table()
+_table_list = _table.tolist()
+
+
+def fit_crc(data: bytes, crc: int = 0) -> int:
+    """Return CRC of data continuing from given CRC value."""
+    size = len(data)
+
+    if size < _min_parallel_size:
+        return _crc_bytes(data, crc)
+
+    blocks = size // _block_size
+    parallel = blocks * _block_size
+
+    block_crc = _crc_blocks(np.frombuffer(data, dtype=np.uint8, count=parallel).reshape(blocks, _block_size))
+    shift_low, shift_high = _shift_tables(_block_size)
+
+    for value in block_crc.tolist():
+        crc = shift_low[crc & 0xFF] ^ shift_high[crc >> 8] ^ value
+
+    return _crc_bytes(data[parallel:], crc)
+
+
+def _crc_bytes(data: bytes, crc: int) -> int:
+    table = _table_list
+
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+
+    return crc
+
+
+def _crc_blocks(blocks: np.ndarray) -> np.ndarray:
+    """Return CRC of each row starting from zero."""
+    crc = np.zeros(len(blocks), dtype=np.uint16)
+
+    for column in blocks.T:
+        crc = (crc >> 8) ^ _table[(crc ^ column) & 0xFF]
+
+    return crc
+
+
+@cache
+def _shift_tables(size: int) -> tuple[list[int], list[int]]:
+    """Return tables shifting CRC over `size` zero bytes, for low and high CRC byte."""
+    shifted = np.concatenate((np.arange(256), np.arange(256) << 8)).astype(np.uint16)
+
+    for _ in range(size):
+        shifted = (shifted >> 8) ^ _table[shifted & 0xFF]
+
+    return shifted[:256].tolist(), shifted[256:].tolist()
@@ -0,0 +1,327 @@
+"""FIT activity encoder.
+
+Records of each chunk are packed at once into NumPy structured array matching the record definition message.
+"""
+
+import struct
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from ...classes.export import ExportFields
+from ...classes.tracks import ActivityTrack
+from ...profiling import count, stage
+from ...progress import Progress, report
+from ..chunks import export_parts
+from .crc import fit_crc
+from .profile import FIT_UTC_REFERENCE
+
+_PROTOCOL_VERSION = 0x20  # 2.0
+_PROFILE_VERSION = 2132  # 21.32
+
+_MESG_FILE_ID = 0
+_MESG_SESSION = 18
+_MESG_LAP = 19
+_MESG_RECORD = 20
+_MESG_ACTIVITY = 34
+
+_LOCAL_RECORD = 0  # local message type of records, other messages are defined right before their data
+
+_BASE_ENUM = 0x00
+_BASE_UINT8 = 0x02
+_BASE_UINT16 = 0x84
+_BASE_SINT32 = 0x85
+_BASE_UINT32 = 0x86
+
+_base_dtypes = {_BASE_ENUM: "u1", _BASE_UINT8: "u1", _BASE_UINT16: "<u2", _BASE_SINT32: "<i4", _BASE_UINT32: "<u4"}
+_base_formats = {_BASE_ENUM: "B", _BASE_UINT8: "B", _BASE_UINT16: "H", _BASE_SINT32: "i", _BASE_UINT32: "I"}
+_invalid = {
+    _BASE_ENUM: 0xFF,
+    _BASE_UINT8: 0xFF,
+    _BASE_UINT16: 0xFFFF,
+    _BASE_SINT32: 0x7FFFFFFF,
+    _BASE_UINT32: 0xFFFFFFFF,
+}
+
+_SEMICIRCLES = 2**31 / 180  # per degree
+
+_FILE_TYPE_ACTIVITY = 4
+_MANUFACTURER_DEVELOPMENT = 255
+_SPORT_CYCLING = 2
+_EVENT_LAP = 9
+_EVENT_SESSION = 8
+_EVENT_ACTIVITY = 26
+_EVENT_TYPE_STOP = 1
+_LAP_TRIGGER_MANUAL = 0
+
+_header = struct.Struct("<BBHI4s")
+_header_crc = struct.Struct("<H")
+
+
+@dataclass(frozen=True)
+class _RecordField:
+    """Record field encoded from the track channel as `value * scale + offset`."""
+
+    channel: str
+    number: int
+    base_type: int
+    scale: float = 1
+    offset: float = 0
+
+
+_timestamp_field = _RecordField("timestamp", 253, _BASE_UINT32)
+
+_record_fields = {  # export field controlling the record field: record fields
+    None: (
+        _timestamp_field,
+        _RecordField("lat", 0, _BASE_SINT32, _SEMICIRCLES),
+        _RecordField("lon", 1, _BASE_SINT32, _SEMICIRCLES),
+    ),
+    "altitude": (_RecordField("elevation", 2, _BASE_UINT16, 5, 500 * 5),),
+    "distance": (_RecordField("distance", 5, _BASE_UINT32, 100),),
+    "speed": (_RecordField("speed", 6, _BASE_UINT16, 1000),),
+    "power": (_RecordField("power", 7, _BASE_UINT16),),
+    "heart_rate": (_RecordField("heart_rate", 3, _BASE_UINT8),),
+    "cadence": (_RecordField("cadence", 4, _BASE_UINT8),),
+}
+
+
+def export_as_fit(points: ActivityTrack, destination: str, fields=None, progress=None):
+    """Export data points to FIT activity file."""
+    export_chunks_as_fit([points], destination, fields, progress)
+
+
+@stage("export_fit")
+def export_chunks_as_fit(
+    chunks: Iterable[ActivityTrack],
+    destination: str,
+    fields=None,
+    progress: Progress | None = None,
+):
+    """Export data points to FIT activity file writing chunks as they come.
+
+    Only the chunk being written is kept in memory, large chunks are encoded in parts. Header and CRC are written
+    when all the data is written.
+    Written points are reported to `progress` token, with the total if chunks are given as a sequence.
+    """
+    if fields is None:
+        fields = ExportFields()
+
+    first, chunks, total = export_parts(chunks)
+
+    record_fields = _select_fields(first, fields)
+    record_dtype = np.dtype(
+        [("header", "u1")] + [(f.channel, _base_dtypes[f.base_type]) for f in record_fields],
+    )
+
+    path = Path(destination)
+
+    with path.open("w+b") as dst:
+        dst.write(bytes(_header.size + _header_crc.size))  # written in the end
+
+        start_ts = _fit_time(first.timestamp[:1])[0]
+        dst.write(_message(_MESG_FILE_ID, 1, [
+            (0, _BASE_ENUM, _FILE_TYPE_ACTIVITY),  # type
+            (1, _BASE_UINT16, _MANUFACTURER_DEVELOPMENT),  # manufacturer
+            (2, _BASE_UINT16, 0),  # product
+            (4, _BASE_UINT32, start_ts),  # time_created
+        ]))  # fmt: skip
+
+        dst.write(_definition(_MESG_RECORD, _LOCAL_RECORD, [(f.number, f.base_type) for f in record_fields]))
+
+        laps = _Laps(start_ts)
+        written = 0
+
+        for chunk in chunks:
+            count("points", len(chunk))
+            laps.write_chunk(dst, chunk, _records(chunk, record_fields, record_dtype))
+
+            written += len(chunk)
+            report(progress, "export_fit", written, total)
+
+        laps.finish(dst)
+
+        data_size = dst.tell() - _header.size - _header_crc.size
+
+        header = _header.pack(_header.size + _header_crc.size, _PROTOCOL_VERSION, _PROFILE_VERSION, data_size, b".FIT")
+        dst.seek(0)
+        dst.write(header + _header_crc.pack(fit_crc(header)))
+
+        dst.seek(0)
+        crc = 0
+        while block := dst.read(1024 * 1024):
+            crc = fit_crc(block, crc)
+
+        dst.write(_header_crc.pack(crc))
+        count("bytes", dst.tell())
+
+
+class _Laps:
+    """Lap, session and activity messages, written as the laps end."""
+
+    def __init__(self, start_ts: int):
+        self.start_ts = start_ts
+        self.lap = None  # current lap number
+        self.count = 0  # written laps
+
+        self._start_distance = 0.0
+        self._lap_start = (start_ts, 0.0)  # timestamp and distance of the current lap first point
+        self._last = (start_ts, 0.0)  # timestamp and distance of the last written point
+
+    def write_chunk(self, dst, chunk: ActivityTrack, records: bytes):
+        """Write chunk records splitting them by laps."""
+        timestamps = _fit_time(chunk.timestamp).tolist()
+        distance = chunk.distance.tolist()
+        record_size = len(records) // len(chunk)
+
+        if self.lap is None:
+            self.lap = int(chunk.lap[0])
+            self._start_distance = distance[0]
+            self._lap_start = (timestamps[0], distance[0])
+
+        starts = np.flatnonzero(np.diff(chunk.lap, prepend=self.lap)).tolist()  # points starting new laps
+        prev = 0
+
+        for start in [*starts, len(chunk)]:
+            if start > prev:
+                dst.write(records[prev * record_size : start * record_size])
+                self._last = (timestamps[start - 1], distance[start - 1])
+
+            if start == len(chunk):
+                break
+
+            self._write_lap(dst)
+
+            # lap distance includes the way from the last point of the previous lap
+            self._lap_start = (timestamps[start], self._last[1])
+            prev = start
+
+        self.lap = int(chunk.lap[-1])
+
+    def finish(self, dst):
+        """Write the last lap, session and activity."""
+        self._write_lap(dst)
+
+        end_ts, end_distance = self._last
+        elapsed = (end_ts - self.start_ts) * 1000
+
+        dst.write(_message(_MESG_SESSION, 1, [
+            (253, _BASE_UINT32, end_ts),  # timestamp
+            (2, _BASE_UINT32, self.start_ts),  # start_time
+            (7, _BASE_UINT32, elapsed),  # total_elapsed_time
+            (8, _BASE_UINT32, elapsed),  # total_timer_time
+            (9, _BASE_UINT32, round((end_distance - self._start_distance) * 100)),  # total_distance
+            (0, _BASE_ENUM, _EVENT_SESSION),  # event
+            (1, _BASE_ENUM, _EVENT_TYPE_STOP),  # event_type
+            (5, _BASE_ENUM, _SPORT_CYCLING),  # sport
+            (25, _BASE_UINT16, 0),  # first_lap_index
+            (26, _BASE_UINT16, self.count),  # num_laps
+        ]))  # fmt: skip
+
+        dst.write(_message(_MESG_ACTIVITY, 1, [
+            (253, _BASE_UINT32, end_ts),  # timestamp
+            (0, _BASE_UINT32, elapsed),  # total_timer_time
+            (1, _BASE_UINT16, 1),  # num_sessions
+            (2, _BASE_ENUM, 0),  # type: manual
+            (3, _BASE_ENUM, _EVENT_ACTIVITY),  # event
+            (4, _BASE_ENUM, _EVENT_TYPE_STOP),  # event_type
+        ]))  # fmt: skip
+
+    def _write_lap(self, dst):
+        (start_ts, start_distance), (end_ts, end_distance) = self._lap_start, self._last
+        elapsed = (end_ts - start_ts) * 1000
+
+        dst.write(_message(_MESG_LAP, 1, [
+            (253, _BASE_UINT32, end_ts),  # timestamp
+            (254, _BASE_UINT16, self.count),  # message_index
+            (2, _BASE_UINT32, start_ts),  # start_time
+            (7, _BASE_UINT32, elapsed),  # total_elapsed_time
+            (8, _BASE_UINT32, elapsed),  # total_timer_time
+            (9, _BASE_UINT32, round((end_distance - start_distance) * 100)),  # total_distance
+            (0, _BASE_ENUM, _EVENT_LAP),  # event
+            (1, _BASE_ENUM, _EVENT_TYPE_STOP),  # event_type
+            (24, _BASE_ENUM, _LAP_TRIGGER_MANUAL),  # lap_trigger
+        ]))  # fmt: skip
+
+        self.count += 1
+
+
+def _select_fields(points: ActivityTrack, fields: ExportFields) -> list[_RecordField]:
+    """Return record fields of exported channels present in the track."""
+    selected = []
+
+    for field_name, record_fields in _record_fields.items():
+        if field_name is not None and not getattr(fields, field_name):
+            continue
+
+        selected.extend(f for f in record_fields if f is _timestamp_field or _present(points, f.channel))
+
+    return selected
+
+
+def _present(points: ActivityTrack, channel: str) -> bool:
+    """Whether the channel is present in the track.
+
+    Merged elevation is always set, it's missing everywhere if the route has none.
+    """
+    values = getattr(points, channel)
+
+    if channel == "elevation":
+        return values is not None and not np.ma.getmaskarray(values).all()
+
+    return values is not None
+
+
+def _records(points: ActivityTrack, record_fields: list[_RecordField], dtype: np.dtype) -> bytes:
+    """Pack record data messages of all points."""
+    records = np.zeros(len(points), dtype=dtype)
+    records["header"] = _LOCAL_RECORD
+
+    for f in record_fields:
+        if f is _timestamp_field:
+            records[f.channel] = _fit_time(points.timestamp)
+            continue
+
+        records[f.channel] = _encode(getattr(points, f.channel), f)
+
+    return records.tobytes()
+
+
+def _encode(channel: np.ndarray, f: _RecordField) -> np.ndarray:
+    """Scale channel values to the field type, missing and out of range values are invalid."""
+    values = np.round(np.ma.getdata(channel).astype(np.float64) * f.scale + f.offset)
+    invalid = _invalid[f.base_type]
+
+    info = np.iinfo(_base_dtypes[f.base_type])
+    # maximum value is reserved for invalid values for all used types
+    missing = np.ma.getmaskarray(channel) | ~np.isfinite(values) | (values < info.min) | (values >= info.max)
+
+    return np.where(missing, invalid, values).astype(_base_dtypes[f.base_type])
+
+
+def _fit_time(timestamps: np.ndarray) -> np.ndarray:
+    return timestamps.astype("datetime64[s]").astype(np.int64) - FIT_UTC_REFERENCE
+
+
+def _definition(global_num: int, local_num: int, fields: list[tuple[int, int]]) -> bytes:
+    """Pack definition message of little-endian fields given as `(number, base type)`."""
+    field_defs = b"".join(
+        struct.pack("<BBB", number, struct.calcsize(_base_formats[base_type]), base_type)
+        for number, base_type in fields
+    )
+
+    return struct.pack("<BBBHB", 0x40 | local_num, 0, 0, global_num, len(fields)) + field_defs
+
+
+def _message(global_num: int, local_num: int, values: list[tuple[int, int, int]]) -> bytes:
+    """Pack definition and the single data message of fields given as `(number, base type, value)`."""
+    definition = _definition(global_num, local_num, [(number, base_type) for number, base_type, _ in values])
+    data = struct.pack(
+        "<B" + "".join(_base_formats[base_type] for _, base_type, _ in values),
+        local_num,
+        *(int(value) for _, _, value in values),
+    )
+
+    return definition + data
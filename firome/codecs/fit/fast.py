@@ -0,0 +1,288 @@
+"""Fast decoder of FIT `record` and `lap` messages.
+
+Instead of decoding every message into objects, definitions are compiled once and fields of all data messages
+are gathered from the file buffer at once with NumPy.
+Anything unusual for the activity file results in `UnsupportedFitError`, so the caller falls back to `fitdecode`.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from ...classes.export import ExportFields
+from ...classes.tracks import TIMESTAMP_DTYPE, ActivityTrack
+from ...progress import Progress, report
+from .profile import FIT_UTC_REFERENCE
+
+_FIT_DATETIME_MIN = 0x10000000  # lower values are relative timestamps
+
+_MESG_LAP = 19
+_MESG_RECORD = 20
+_FIELD_TIMESTAMP = 253
+_FIELD_LAP_TRIGGER = 24
+_FIELD_COMPRESSED_SPEED_DISTANCE = 8
+
+# messages having `distance` field (message number: field number), those are data points for `fitdecode` parser
+_DISTANCE_FIELDS = {_MESG_RECORD: 5, 32: 4, 33: 1, 55: 2, 150: 3, 285: 0}
+
+_BASE_UINT8 = 0x02
+_BASE_UINT16 = 0x04
+_BASE_UINT32 = 0x06
+
+_progress_step = 1024 * 1024  # bytes decoded between the checks of the progress token
+
+_base_sizes = {_BASE_UINT8: 1, _BASE_UINT16: 2, _BASE_UINT32: 4}
+_invalid = {_BASE_UINT8: 0xFF, _BASE_UINT16: 0xFFFF, _BASE_UINT32: 0xFFFFFFFF}
+
+
+@dataclass(frozen=True)
+class _RecordField:
+    name: str
+    number: int
+    base_type: int
+    scale: int = 1
+
+
+_record_fields = (
+    _RecordField("timestamp", _FIELD_TIMESTAMP, _BASE_UINT32),
+    _RecordField("distance", _DISTANCE_FIELDS[_MESG_RECORD], _BASE_UINT32, 100),
+    _RecordField("speed", 6, _BASE_UINT16, 1000),
+    _RecordField("power", 7, _BASE_UINT16),
+    _RecordField("heart_rate", 3, _BASE_UINT8),
+    _RecordField("cadence", 4, _BASE_UINT8),
+)
+
+_required_fields = ("timestamp", "distance")
+
+
+class UnsupportedFitError(Exception):
+    """FIT file can't be handled by the fast decoder."""
+
+
+@dataclass(eq=False)
+class _Definition:
+    """Compiled definition message."""
+
+    global_num: int
+    num_fields: int
+    size: int
+    endian: str
+    fields: dict[int, tuple[int, int, int]]  # field number: (offset, size, base type)
+    offsets: list[int] = field(default_factory=list)  # data message offsets
+
+
+def decode_fit(
+    data: bytes | memoryview,
+    fields: ExportFields | None = None,
+    progress: Progress | None = None,
+) -> ActivityTrack:
+    """Decode activity data points from FIT file content in file order.
+
+    Only channels enabled in `fields` are decoded, others are left `None`. All channels are decoded by default.
+    Decoded bytes are reported to `progress` token.
+    CRC is not checked, chained FIT files, compressed timestamps and developer data are not supported.
+    """
+    pos, end = _data_range(data)
+
+    local_defs: dict[int, _Definition] = {}
+    records: list[_Definition] = []
+    lap_offsets = []
+    checkpoint = pos
+
+    while pos < end:
+        if progress is not None and pos >= checkpoint:
+            progress.report("parse_fit", pos, end, "bytes")
+            checkpoint = pos + _progress_step
+
+        header = data[pos]
+
+        if header & 0x80:
+            msg = "compressed timestamp header"
+            raise UnsupportedFitError(msg)
+
+        if header & 0x40:
+            definition = _read_definition(data, pos + 1, developer=bool(header & 0x20))
+            local_defs[header & 0x0F] = definition
+
+            if definition.global_num == _MESG_RECORD:
+                records.append(definition)
+
+            pos += 6 + 3 * definition.num_fields
+            continue
+
+        definition = local_defs.get(header & 0x0F)
+        if definition is None:
+            msg = f"undefined local message {header & 0x0F}"
+            raise UnsupportedFitError(msg)
+
+        if definition.global_num == _MESG_RECORD:
+            definition.offsets.append(pos + 1)
+        elif definition.global_num == _MESG_LAP and _FIELD_LAP_TRIGGER in definition.fields:
+            lap_offsets.append(pos + 1)
+
+        pos += 1 + definition.size
+
+    if pos != end:
+        msg = "last message exceeds data size"
+        raise UnsupportedFitError(msg)
+
+    report(progress, "parse_fit", end, end, "bytes")
+
+    selected = tuple(
+        rf for rf in _record_fields if rf.name in _required_fields or fields is None or getattr(fields, rf.name)
+    )
+
+    return _gather(np.frombuffer(data, dtype=np.uint8), records, np.array(lap_offsets, dtype=np.int64), selected)
+
+
+def _data_range(data: bytes | memoryview) -> tuple[int, int]:
+    """Return start and end offsets of data records."""
+    header_size = data[0] if data else 0
+
+    if header_size not in (12, 14) or data[8:12] != b".FIT":
+        msg = "not a FIT file header"
+        raise UnsupportedFitError(msg)
+
+    end = header_size + int.from_bytes(data[4:8], "little")
+
+    if len(data) != end + 2:
+        msg = "file size doesn't match header, truncated or chained file"
+        raise UnsupportedFitError(msg)
+
+    return header_size, end
+
+
+def _read_definition(data: bytes | memoryview, pos: int, *, developer: bool) -> _Definition:
+    if developer:
+        msg = "developer data fields"
+        raise UnsupportedFitError(msg)
+
+    endian = "<" if data[pos + 1] == 0 else ">"
+    global_num = int.from_bytes(data[pos + 2 : pos + 4], "little" if endian == "<" else "big")
+    num_fields = data[pos + 4]
+
+    fields = {}
+    offset = 0
+
+    for i in range(num_fields):
+        number, size, base_type = data[pos + 5 + 3 * i : pos + 8 + 3 * i]
+        if number in fields:
+            msg = f"duplicate field {number} in message {global_num}"
+            raise UnsupportedFitError(msg)
+
+        fields[number] = (offset, size, base_type & 0x1F)
+        offset += size
+
+    if global_num in _DISTANCE_FIELDS and global_num != _MESG_RECORD and _DISTANCE_FIELDS[global_num] in fields:
+        msg = f"message {global_num} with distance"
+        raise UnsupportedFitError(msg)
+
+    if global_num == _MESG_RECORD:
+        _check_record(fields)
+
+    return _Definition(global_num, num_fields, offset, endian, fields)
+
+
+def _check_record(fields: dict[int, tuple[int, int, int]]):
+    if _FIELD_COMPRESSED_SPEED_DISTANCE in fields:
+        msg = "compressed speed and distance"
+        raise UnsupportedFitError(msg)
+
+    if _FIELD_TIMESTAMP not in fields:
+        msg = "record without timestamp"
+        raise UnsupportedFitError(msg)
+
+    for rf in _record_fields:
+        if rf.number not in fields:
+            continue
+
+        _, size, base_type = fields[rf.number]
+
+        if base_type != rf.base_type or size != _base_sizes[rf.base_type]:
+            msg = f"unexpected type of record field {rf.name}"
+            raise UnsupportedFitError(msg)
+
+
+def _gather(
+    raw: np.ndarray,
+    records: list[_Definition],
+    lap_offsets: np.ndarray,
+    selected: tuple[_RecordField, ...],
+) -> ActivityTrack:
+    """Collect selected record fields of all record data messages."""
+    offsets = []
+    columns = {rf.name: [] for rf in selected}
+    missing = {rf.name: [] for rf in selected}
+
+    for definition in records:
+        msg_offsets = np.array(definition.offsets, dtype=np.int64)
+        offsets.append(msg_offsets)
+
+        for rf in selected:
+            values, invalid = _field_values(raw, definition, msg_offsets, rf)
+            columns[rf.name].append(values)
+            missing[rf.name].append(invalid)
+
+    offsets = np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64)
+    order = np.argsort(offsets, kind="stable")
+
+    def column(name):
+        if not offsets.size:
+            return np.zeros(0), np.zeros(0, dtype=bool)
+
+        return np.concatenate(columns[name])[order], np.concatenate(missing[name])[order]
+
+    timestamp, no_timestamp = column("timestamp")
+    distance, no_distance = column("distance")
+
+    if np.any(no_timestamp[~no_distance]) or np.any(timestamp[~no_distance] < _FIT_DATETIME_MIN):
+        msg = "invalid or relative timestamps"
+        raise UnsupportedFitError(msg)
+
+    keep = ~no_distance
+    lap = 1 + np.searchsorted(lap_offsets, offsets[order], side="left")
+
+    def channel(name, dtype):
+        if name not in columns:
+            return None
+
+        values, invalid = column(name)
+        values, invalid = values[keep], invalid[keep]
+
+        if np.issubdtype(dtype, np.integer):
+            invalid = invalid | (values > np.iinfo(dtype).max)
+
+        return np.ma.MaskedArray(np.where(invalid, 0, values).astype(dtype), mask=invalid)
+
+    return ActivityTrack(
+        timestamp=(timestamp[keep].astype(np.int64) + FIT_UTC_REFERENCE).astype(TIMESTAMP_DTYPE),
+        distance=distance[keep].astype(np.float64),
+        lap=lap[keep].astype(np.int32),
+        speed=channel("speed", np.float32),
+        power=channel("power", np.int16),
+        heart_rate=channel("heart_rate", np.int16),
+        cadence=channel("cadence", np.int16),
+    )
+
+
+def _field_values(
+    raw: np.ndarray,
+    definition: _Definition,
+    msg_offsets: np.ndarray,
+    rf: _RecordField,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return scaled field values of data messages and mask of invalid values."""
+    if rf.number not in definition.fields:
+        return np.zeros(len(msg_offsets)), np.ones(len(msg_offsets), dtype=bool)
+
+    offset, size, base_type = definition.fields[rf.number]
+
+    field_bytes = raw[(msg_offsets + offset)[:, None] + np.arange(size)]
+    values = np.ascontiguousarray(field_bytes).view(f"{definition.endian}u{size}").ravel()
+
+    invalid = values == _invalid[base_type]
+
+    if rf.scale != 1:
+        return values / rf.scale, invalid
+
+    return values.astype(np.float64), invalid
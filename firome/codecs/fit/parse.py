@@ -1,26 +1,93 @@
+import heapq
+from collections.abc import Iterable, Iterator
+from dataclasses import replace
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from fitdecode import FIT_FRAME_DATA, FitDataMessage, FitReader
+import numpy as np
 
-from ...classes.points import DataPoint
+from ...classes.export import ExportFields
+from ...classes.tracks import TIMESTAMP_DTYPE, ActivityTrack, masked
 from ...logger import LOGGER
+from ...profiling import count, profiled, stage
+from ...progress import Progress, report
 from ..errors import UnsupportedFileExtError
-from ..zip import unzip
+from ..zip import Source, single_source, sources
+from .fast import UnsupportedFitError, decode_fit
+from .timestamps import RepairSummary, StreamingError, TimestampStream, repair_timestamps
+
+if TYPE_CHECKING:
+    from fitdecode import FitDataMessage, FitReader
 
 __max_delta_days = 120  # expected activity date range from now
 
 
-def parse_fit(src: Path) -> list[DataPoint]:
-    """Parse FIT file by given path."""
-    if src.suffix.lower() == ".zip":
-        src = unzip(src)
+_chunk_size = 4096  # points in a single streamed chunk
+_reorder_window = 1024  # points buffered to restore distance order while streaming
+
+
+@stage("parse_fit")
+def parse_fit(
+    src: Path | Source,
+    fields: ExportFields | None = None,
+    *,
+    fast: bool = True,
+    progress: Progress | None = None,
+) -> ActivityTrack:
+    """Parse FIT file by given path or source, see `firome.codecs.zip.Source`.
+
+    Only channels enabled in `fields` are parsed, others are left `None`. All channels are parsed by default.
+    If `fast` is set, file is decoded with `decode_fit`, falling back to `fitdecode` if it's not supported there.
+    Progress is reported to `progress` token, see `firome.progress`.
+    """
+    source = _fit_source(src)
+
+    if fast:
+        try:
+            return _prepare(decode_fit(source.read(), fields, progress))
+        except UnsupportedFitError as e:
+            LOGGER.debug("fast FIT decoder is not applicable: %s", e)
+
+    from fitdecode import FitReader  # noqa: PLC0415  # imported only if fast decoder is not applicable
+
+    with source.open() as stream, FitReader(stream) as fit:
+        return FitParser(fit, fields, progress).process()
+
+
+def parse_fit_chunks(
+    src: Path | Source,
+    chunk_size: int = _chunk_size,
+    fields: ExportFields | None = None,
+    progress: Progress | None = None,
+) -> Iterator[ActivityTrack]:
+    """Parse FIT file by given path or source yielding chunks of points, see `FitParser.iter_chunks`.
+
+    Raise `StreamingError` if the file can't be parsed in chunks the same way as `parse_fit` does.
+    """
+    from fitdecode import FitReader  # noqa: PLC0415  # imported on the first use
+
+    with _fit_source(src).open() as stream, FitReader(stream) as fit:
+        yield from profiled("parse_fit", FitParser(fit, fields, progress).iter_chunks(chunk_size))
+
+
+def fit_sources(src: Path) -> list[Source]:
+    """Return sources of all FIT files in ZIP archive, or the source of the file itself."""
+    found = [source for source in sources(src) if source.suffix == ".fit"]
+
+    if not found:
+        raise UnsupportedFileExtError(src)
+
+    return found
+
+
+def _fit_source(src: Path | Source) -> Source:
+    source = single_source(src)
 
-    if not src.suffix.lower() == ".fit":
+    if source.suffix != ".fit":
         raise UnsupportedFileExtError(src)
 
-    with FitReader(src) as fit:
-        return FitParser(fit).process()
+    return source
 
 
 class FitParserRecreatedError(Exception):
@@ -30,55 +97,80 @@ class FitParserRecreatedError(Exception):
 class FitParser:
     """FIT file parser."""
 
-    def __init__(self, reader: FitReader):
+    def __init__(self, reader: "FitReader", fields: ExportFields | None = None, progress: Progress | None = None):
+        from fitdecode import FIT_FRAME_DATA  # noqa: PLC0415  # imported on the first use
+
+        self._frame_data = FIT_FRAME_DATA
         self._lap = 1  # track increasing lap value
         self._fit = reader
         self._closed = False
         self._reference_date = None
+        self._channels = _selected_channels(fields)
+        self._progress = progress
 
     def process(self):
         """Execute FIT file processing."""
         if self._closed:
             raise FitParserRecreatedError
 
-        result = []
-
-        for data in self._fit:
-            point = self.__frame_to_point(data)
+        self._closed = True
 
-            if point is None or point.distance is None:
-                continue
+        return _prepare(_to_track(list(self.__rows()), self._channels))
 
-            if point.timestamp.tzinfo is None:
-                point.timestamp = point.timestamp.replace(tzinfo=timezone.utc)
+    def iter_chunks(self, chunk_size: int = _chunk_size) -> Iterator[ActivityTrack]:
+        """Execute FIT file processing yielding chunks of points ordered by distance.
 
-            result.append(point)
+        Memory is bounded by the chunk size: distance order is restored within `_reorder_window` points and
+        timestamps are repaired chunk by chunk with the context of the previous ones, see `TimestampStream`.
+        Output is the same as of `process`, `StreamingError` is raised if it can't be.
+        """
+        if self._closed:
+            raise FitParserRecreatedError
 
         self._closed = True
 
-        result.sort(key=lambda x: x.distance)
+        timestamps = TimestampStream()
+        pending = []
+
+        for rows in _batched(_reorder(self.__rows(), _reorder_window), chunk_size):
+            pending.extend(rows)
+            repaired = timestamps.feed(np.array([row[0] for row in rows], dtype=np.int64))
+
+            if len(repaired):
+                yield self.__chunk(pending[: len(repaired)], repaired)
+                del pending[: len(repaired)]
+
+        repaired = timestamps.finish()
 
-        # expecting sorted list here
-        self.__fix_timestamps(result)
+        if len(repaired):
+            yield self.__chunk(pending, repaired)
 
-        return result
+        count("timestamps_repaired", timestamps.summary.broken)
+        _log_repair(timestamps.summary)
 
-    @staticmethod
-    def __fix_timestamps(points: list[DataPoint]):
-        err_index = []
+    def __chunk(self, rows: list[tuple], timestamps: np.ndarray) -> ActivityTrack:
+        count("points", len(rows))
 
-        for i in range(1, len(points) - 1):
-            if not _ts_ok(points[i - 1].timestamp, points[i].timestamp, points[i + 1].timestamp):
-                err_index.append(i)  # not mutating slice during iteration  # noqa:PERF401  # too complex
+        return replace(_to_track(rows, self._channels), timestamp=timestamps.astype(TIMESTAMP_DTYPE))
 
-        if size := len(err_index):
-            LOGGER.error("found %d broken timestamps in activity", size)
+    def __rows(self) -> Iterator[tuple]:
+        rows = 0
 
-        for idx in err_index:
-            points[idx].timestamp = _fix_ts(points[idx].timestamp, points[idx - 1].timestamp, points[idx + 1].timestamp)
+        for data in self._fit:
+            row = self.__frame_to_row(data)
+
+            if row is None:
+                continue
+
+            if rows % _chunk_size == 0:
+                report(self._progress, "parse_fit", rows)
 
-    def __frame_to_point(self, data: FitDataMessage) -> DataPoint | None:
-        if data.frame_type != FIT_FRAME_DATA:
+            rows += 1
+            yield row
+
+    def __frame_to_row(self, data: "FitDataMessage") -> tuple | None:
+        """Return values of `_columns` for the frame, `None` if frame is not a data point."""
+        if data.frame_type != self._frame_data:
             return None
 
         if data.has_field("lap_trigger"):
@@ -90,34 +182,104 @@ class FitParser:
 
             return None
 
-        return DataPoint(
-            timestamp=data.get_value("timestamp").replace(tzinfo=timezone.utc),
-            distance=data.get_value("distance"),
-            speed=data.get_value("speed", fallback=None),
-            power=data.get_value("power", fallback=None),
-            heart_rate=data.get_value("heart_rate", fallback=None),
-            cadence=data.get_value("cadence"),
-            lap=self._lap,
+        distance = data.get_value("distance")
+        if distance is None:
+            return None
+
+        return (
+            _to_epoch(data.get_value("timestamp")),
+            distance,
+            self._lap,
+            *(data.get_value(name, fallback=None) if name in self._channels else None for name in _channels),
+        )
+
+
+_channels = ("speed", "power", "heart_rate", "cadence")  # optional channels, selected by export fields
+_columns = ("timestamp", "distance", "lap", *_channels)
+_channel_types = {"speed": np.float32, "power": np.int16, "heart_rate": np.int16, "cadence": np.int16}
+
+
+def _selected_channels(fields: ExportFields | None) -> frozenset[str]:
+    """Return names of optional channels to be parsed, all of them if `fields` are not given."""
+    return frozenset(name for name in _channels if fields is None or getattr(fields, name))
+
+
+def _prepare(track: ActivityTrack) -> ActivityTrack:
+    """Sort parsed track by distance and fix timestamps."""
+    track = track.take(np.argsort(track.distance, kind="stable"))
+
+    # expecting sorted track here
+    summary = repair_timestamps(track.timestamp.view(np.int64))
+    count("points", len(track))
+    count("timestamps_repaired", summary.broken)
+    _log_repair(summary)
+
+    return track
+
+
+def _log_repair(summary: RepairSummary):
+    if summary.broken:
+        LOGGER.error("found %d broken timestamps in activity", summary.broken)
+        LOGGER.info(
+            "%d with wrong date, %d out of order; %d fixed by date only, %d interpolated",
+            summary.wrong_date,
+            summary.out_of_order,
+            summary.date_only,
+            summary.interpolated,
         )
 
 
-def _ts_ok(prev, curr, nxt):
-    if prev > curr:
-        return False
+def _to_track(rows: list[tuple], channels: frozenset[str]) -> ActivityTrack:
+    """Build track from rows of `_columns` values, channels not selected are left `None`."""
+    columns = dict(zip(_columns, zip(*rows, strict=True), strict=True)) if rows else dict.fromkeys(_columns, ())
+
+    return ActivityTrack(
+        timestamp=np.array(columns["timestamp"], dtype=np.int64).astype(TIMESTAMP_DTYPE),
+        distance=np.array(columns["distance"], dtype=np.float64),
+        lap=np.array(columns["lap"], dtype=np.int32),
+        **{name: masked(columns[name], _channel_types[name]) if name in channels else None for name in _channels},
+    )
+
+
+def _reorder(rows: Iterable[tuple], window: int) -> Iterator[tuple]:
+    """Restore distance order of rows buffering at most `window` rows.
+
+    Order is the same as of stable sort of all rows, `StreamingError` is raised for a row arriving too late for it.
+    """
+    heap = []
+    last_distance = float("-inf")
+
+    for seq, row in enumerate(rows):
+        if row[1] < last_distance:
+            msg = f"point {seq} is more than {window} points out of distance order"
+            raise StreamingError(msg)
+
+        heapq.heappush(heap, (row[1], seq, row))
+
+        if len(heap) > window:
+            last_distance, _, smallest = heapq.heappop(heap)
+            yield smallest
+
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    batch = []
 
-    # if next < prev, then next is broken
-    if curr > nxt >= prev:
-        return False
+    for row in rows:
+        batch.append(row)
 
-    return (curr - prev).days == 0
+        if len(batch) == size:
+            yield batch
+            batch = []
 
+    if batch:
+        yield batch
 
-def _fix_ts(current: datetime, normal_previous: datetime, next_ts: datetime) -> datetime:
-    current_fix_date = current.replace(year=normal_previous.year, month=normal_previous.month, day=normal_previous.day)
 
-    if _ts_ok(normal_previous, current_fix_date, next_ts):
-        LOGGER.debug("only date is broken: %s", current.ctime())
-        return current_fix_date
+def _to_epoch(timestamp: datetime) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
 
-    LOGGER.debug("full replace %s with %s", current.ctime(), normal_previous.ctime())
-    return normal_previous
+    return int(timestamp.timestamp())
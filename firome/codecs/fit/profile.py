@@ -0,0 +1,3 @@
+"""FIT profile constants shared by the decoder and the encoder."""
+
+FIT_UTC_REFERENCE = 631065600  # FIT epoch, 1989-12-31T00:00:00Z
@@ -0,0 +1,243 @@
+"""Repair of broken activity timestamps.
+
+Head units sometimes write records with wrong date or time, while the distance stays correct.
+With points sorted by distance, timestamps are expected to be non-decreasing and without day-long gaps.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+_day = 24 * 60 * 60  # seconds
+_jump = _day // 2  # gap splitting runs, less than a day to catch dates shifted by exactly one day
+
+
+@dataclass
+class RepairSummary:
+    """Summary of repaired timestamps."""
+
+    wrong_date: int = 0  # points separated from the activity by a day or more
+    out_of_order: int = 0  # points breaking non-decreasing order
+    date_only: int = 0  # points repaired by changing date only, keeping time of the day
+    interpolated: int = 0  # points repaired by interpolation between good neighbours
+
+    @property
+    def broken(self) -> int:
+        """Total number of broken timestamps."""
+        return self.wrong_date + self.out_of_order
+
+    def add(self, other: "RepairSummary"):
+        """Add counts of another repair."""
+        self.wrong_date += other.wrong_date
+        self.out_of_order += other.out_of_order
+        self.date_only += other.date_only
+        self.interpolated += other.interpolated
+
+
+def repair_timestamps(timestamps: np.ndarray) -> RepairSummary:
+    """Repair broken timestamps in place, timestamps are seconds since epoch of points sorted by distance.
+
+    Whole runs of broken timestamps are repaired at once: time of the day is kept if changing the date only puts
+    the point between good neighbours, otherwise timestamp is interpolated between good neighbours.
+    """
+    return _repair(timestamps).summary()
+
+
+class StreamingError(Exception):
+    """Timestamps can't be repaired in chunks the same way as all at once."""
+
+
+class TimestampStream:
+    """Repair of timestamps coming in chunks, see `repair_timestamps`.
+
+    Each chunk is repaired along with the context carried over from the previous ones: the tail of the returned
+    timestamps, ending with a good one, and the pending points after it, which are returned once a good timestamp
+    follows them. `StreamingError` is raised if the context doesn't suffice to repair timestamps as all at once:
+    returned timestamps turn out broken, order within the chunk is ambiguous or pending run grows over `pending_limit`.
+    """
+
+    def __init__(self, context: int = 4096, pending_limit: int = 65536):
+        self.summary = RepairSummary()
+
+        self.__context_size = context
+        self.__pending_limit = pending_limit
+        self.__context = np.empty(0, dtype=np.int64)
+        self.__pending = np.empty(0, dtype=np.int64)
+
+    def feed(self, timestamps: np.ndarray) -> np.ndarray:
+        """Add timestamps following the previous ones, return repaired timestamps of the next settled points."""
+        self.__pending = np.concatenate((self.__pending, timestamps.astype(np.int64)))
+
+        return self.__settle(final=False)
+
+    def finish(self) -> np.ndarray:
+        """Return repaired timestamps of all pending points."""
+        return self.__settle(final=True)
+
+    def __settle(self, *, final: bool) -> np.ndarray:
+        start = len(self.__context)
+        repaired = np.concatenate((self.__context, self.__pending))
+        result = _repair(repaired)
+
+        if not result.good[:start].all():
+            msg = "timestamps returned before are found broken by the following ones"
+            raise StreamingError(msg)
+
+        if result.ambiguous:
+            msg = "order of timestamps depends on the points following the chunk"
+            raise StreamingError(msg)
+
+        if final:
+            end = len(repaired)
+        else:
+            # the last point is judged without the following one, so it's never settled
+            good = np.flatnonzero(result.good[start:-1])
+            end = start + good[-1] + 1 if len(good) else start
+
+        self.summary.add(result.summary(slice(start, end)))
+
+        self.__pending = self.__pending[end - start :]
+        self.__context = repaired[max(end - self.__context_size, 0) : end]
+
+        if len(self.__pending) > self.__pending_limit:
+            msg = f"run of {len(self.__pending)} broken timestamps is too long"
+            raise StreamingError(msg)
+
+        return repaired[start:end]
+
+
+@dataclass
+class _Repair:
+    """Classification of points by `_repair`."""
+
+    date_ok: np.ndarray  # within the activity runs
+    good: np.ndarray  # within the activity runs and in order
+    date_fixed: np.ndarray  # repaired by changing date only
+    repaired: np.ndarray
+    ambiguous: bool = False  # checks forward and backward disagree, see `_order_ok`
+
+    def summary(self, part: slice = slice(None)) -> RepairSummary:
+        """Summarize repair of the points in `part`."""
+        date_ok, good = self.date_ok[part], self.good[part]
+        date_fixed, repaired = self.date_fixed[part], self.repaired[part]
+
+        return RepairSummary(
+            wrong_date=int(np.count_nonzero(~date_ok)),
+            out_of_order=int(np.count_nonzero(date_ok & ~good)),
+            date_only=int(np.count_nonzero(date_fixed)),
+            interpolated=int(np.count_nonzero(repaired & ~date_fixed)),
+        )
+
+
+def _repair(timestamps: np.ndarray) -> _Repair:
+    """Repair broken timestamps in place, see `repair_timestamps`."""
+    ok = np.ones(len(timestamps), dtype=bool)
+    result = _Repair(ok, ok, np.zeros(len(timestamps), dtype=bool), np.zeros(len(timestamps), dtype=bool))
+
+    if len(timestamps) < 3:  # noqa: PLR2004  # there are no neighbours to check
+        return result
+
+    result.date_ok = _date_ok(timestamps)
+    result.good = result.date_ok.copy()
+    result.good[result.date_ok], result.ambiguous = _order_ok(timestamps[result.date_ok])
+
+    if result.good.all() or not result.good.any():
+        return result
+
+    good_idx = np.flatnonzero(result.good)
+    bad_idx = np.flatnonzero(~result.good)
+    good_ts = timestamps[good_idx]
+
+    estimate = _interpolate(bad_idx, good_idx, good_ts)
+
+    # neighbouring good timestamps, unbound at the edges
+    right = np.searchsorted(good_idx, bad_idx)
+    lower = np.where(right > 0, good_ts[np.maximum(right - 1, 0)], np.iinfo(np.int64).min)
+    upper = np.where(right < len(good_idx), good_ts[np.minimum(right, len(good_idx) - 1)], np.iinfo(np.int64).max)
+
+    original = timestamps[bad_idx]
+    date_fixed = original - np.round((original - estimate) / _day).astype(np.int64) * _day
+    use_date = ~result.date_ok[bad_idx] & (date_fixed >= lower) & (date_fixed <= upper)
+
+    result.repaired = ~result.good
+    result.date_fixed[bad_idx] = use_date
+
+    timestamps[bad_idx] = np.where(use_date, date_fixed, estimate)
+
+    # repaired runs stay between good neighbours, so only the repaired values can be changed here
+    np.maximum.accumulate(timestamps, out=timestamps)
+
+    return result
+
+
+def _date_ok(timestamps: np.ndarray) -> np.ndarray:
+    """Mark points of the runs continuing the largest run with gaps less than a day."""
+    run_id = np.concatenate(([0], np.cumsum(np.abs(np.diff(timestamps)) >= _jump)))
+    bounds = np.flatnonzero(np.diff(run_id, prepend=-1))  # first index of each run
+    sizes = np.diff(np.append(bounds, len(timestamps)))
+
+    reference = int(np.argmax(sizes))
+    run_ok = np.zeros(len(bounds), dtype=bool)
+    run_ok[reference] = True
+
+    last = timestamps[bounds[reference] + sizes[reference] - 1]
+
+    for run in range(reference + 1, len(bounds)):
+        first = timestamps[bounds[run]]
+
+        if last <= first < last + _day:
+            run_ok[run] = True
+            last = timestamps[bounds[run] + sizes[run] - 1]
+
+    first = timestamps[bounds[reference]]
+
+    for run in range(reference - 1, -1, -1):
+        last = timestamps[bounds[run] + sizes[run] - 1]
+
+        if first - _day < last <= first:
+            run_ok[run] = True
+            first = timestamps[bounds[run]]
+
+    return run_ok[run_id]
+
+
+def _order_ok(timestamps: np.ndarray) -> tuple[np.ndarray, bool]:
+    """Mark points forming non-decreasing sequence, dropping as few points as possible.
+
+    Return the marks and whether checks forward and backward disagree, so that the marks depend on all points.
+    """
+    ok = np.ones(len(timestamps), dtype=bool)
+
+    if len(timestamps) < 3:  # noqa: PLR2004  # there are no neighbours to check
+        return ok, False
+
+    prev, curr, nxt = timestamps[:-2], timestamps[1:-1], timestamps[2:]
+
+    # single points out of order: spikes and dips
+    ok[1:-1] = ~(((curr > nxt) | (curr < prev)) & (prev <= nxt))
+
+    rest = timestamps[ok]
+
+    # rest is checked both ways, as a point far ahead breaks all following points if checked forward only
+    # and a point far behind breaks all preceding points if checked backward only
+    forward = rest >= np.maximum.accumulate(rest)
+    backward = rest <= np.minimum.accumulate(rest[::-1])[::-1]
+
+    ok[ok] = forward if np.count_nonzero(forward) >= np.count_nonzero(backward) else backward
+
+    return ok, not np.array_equal(forward, backward)
+
+
+def _interpolate(bad_idx: np.ndarray, good_idx: np.ndarray, good_ts: np.ndarray) -> np.ndarray:
+    """Interpolate timestamps by point index, extrapolating at the edges with median sample interval."""
+    estimate = np.interp(bad_idx, good_idx, good_ts)
+
+    step = np.median(np.diff(good_ts) / np.diff(good_idx)) if len(good_idx) > 1 else 1
+
+    before = bad_idx < good_idx[0]
+    after = bad_idx > good_idx[-1]
+
+    estimate[before] = good_ts[0] - (good_idx[0] - bad_idx[before]) * step
+    estimate[after] = good_ts[-1] + (bad_idx[after] - good_idx[-1]) * step
+
+    return np.round(estimate).astype(np.int64)
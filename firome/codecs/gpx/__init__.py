@@ -1,6 +1,6 @@
 """GPX file operations."""
 
-from .interpolate import interpolate
+from .interpolate import RouteModel, interpolate, route_model
 from .parse import parse_gpx
 
-__all__ = ["interpolate", "parse_gpx"]
+__all__ = ["RouteModel", "interpolate", "parse_gpx", "route_model"]
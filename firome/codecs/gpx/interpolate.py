@@ -23,137 +23,218 @@
 # Original implementation:
 # https://github.com/remisalmon/gpx-interpolate/blob/00af3c636d566d049f6a140c093af4e91d0482d5/gpx_interpolate.py
 import numpy as np
-from scipy.interpolate import pchip_interpolate
 
-from firome.classes.points import PositionPoint
+from firome.classes.tracks import RouteTrack, filled_elevation
+from firome.geodesy import Accuracy, segment_distances, with_elevation
 from firome.logger import LOGGER
+from firome.profiling import count, stage
+from firome.progress import Progress, report, slices
 
 # classes
-_GPXData = dict[str, list[float] | None]
-
-# globals
-_EARTH_RADIUS = 6371e3  # meters
+_GPXData = dict[str, np.ndarray | None]
 
 _fields = ("lat", "lon", "ele", "dist")
+_arc_step = 0.5  # meters between the samples measuring arc length of the route model
+
+
+@stage("interpolate")
+def interpolate(
+    track: RouteTrack,
+    resolution: float,
+    progress: Progress | None = None,
+    *,
+    accuracy: Accuracy = Accuracy.ELLIPSOID,
+) -> RouteTrack:
+    """Interpolate parsed track with given resolution (m), reporting interpolated points to `progress` token.
+
+    Distances of the track are expected to be horizontal, interpolated points are measured with given `accuracy`.
+    """
+    gpx_data_nodup, gpx_dist_nodup = __gpx_data(track)
+
+    gpx_data_interp = __gpx_interpolate(gpx_data_nodup, gpx_dist_nodup, resolution, progress)
+    count("points", len(gpx_data_interp["lat"]))
+
+    return __to_track(gpx_data_interp, accuracy)
+
+
+class RouteModel:
+    """Route spline evaluated lazily at requested distances instead of fixed resolution.
+
+    Spline is fitted over the cumulative chord length of route points, and reparametrized by its arc length:
+    it's sampled every `arc_step` meters once, distances between the samples are measured with given `accuracy`.
+    """
+
+    def __init__(  # noqa: PLR0913  # spline and its measurement
+        self,
+        distance: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        ele: np.ndarray | None,
+        *,
+        accuracy: Accuracy = Accuracy.ELLIPSOID,
+        arc_step: float = _arc_step,
+    ):
+        self._has_ele = ele is not None
+
+        channels = [lat, lon, ele] if self._has_ele else [lat, lon]
+
+        from scipy.interpolate import PchipInterpolator  # noqa: PLC0415  # scipy is slow to import
+
+        self._spline = PchipInterpolator(distance, np.array(channels), axis=1, extrapolate=False)
+
+        # chord length of the samples and their arc length
+        self._chord = np.linspace(distance[0], distance[-1], max(int(np.ceil(distance[-1] / arc_step)), 1) + 1)
+        y = self._spline(self._chord)
+
+        segments = segment_distances(y[0], y[1], accuracy)
+        self._arc = np.cumsum(with_elevation(segments, y[2]) if self._has_ele else segments)
+
+        self.start = float(self._arc[0])
+        self.end = float(self._arc[-1])
+
+    def __call__(self, distances: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return latitude, longitude and elevation at given distances along the route.
+
+        Distances outside of the route are clamped to the route ends. Elevation is NaN if route has none.
+        """
+        y = self._spline(np.interp(np.clip(distances, self.start, self.end), self._arc, self._chord))
+
+        ele = y[2] if self._has_ele else np.full(len(distances), np.nan)
+
+        return y[0], y[1], ele
+
+
+@stage("interpolate")
+def route_model(
+    track: RouteTrack,
+    progress: Progress | None = None,
+    *,
+    accuracy: Accuracy = Accuracy.ELLIPSOID,
+) -> RouteModel:
+    """Build route model of parsed track to be evaluated at activity distances, see `RouteModel`.
 
+    Distances of the track are expected to be horizontal, the model is measured with given `accuracy`.
+    Model is built at once, `progress` token is checked when it's done.
+    """
+    gpx_data_nodup, gpx_dist_nodup = __gpx_data(track)
+
+    distance = np.cumsum(__gpx_calculate_distance(gpx_data_nodup, gpx_dist_nodup, use_ele=True))
+
+    model = RouteModel(
+        distance,
+        gpx_data_nodup["lat"],
+        gpx_data_nodup["lon"],
+        gpx_data_nodup["ele"],
+        accuracy=accuracy,
+    )
+    report(progress, "interpolate", len(distance), len(distance))
 
-def interpolate(track: list[PositionPoint], resolution: float) -> list[PositionPoint]:
-    """Interpolate track with given resolution (m)."""
+    return model
+
+
+def __gpx_data(track: RouteTrack) -> tuple[_GPXData, np.ndarray]:
+    """Return gpx_data of the track without duplicate trackpoints and its horizontal distances between trackpoints."""
     gpx_data = __from_track(track)
-    gpx_data_nodup = __gpx_remove_duplicates(gpx_data)
+    gpx_data_nodup, gpx_dist_nodup = __gpx_remove_duplicates(gpx_data)
 
     if len(gpx_data_nodup["lat"]) != len(gpx_data["lat"]):
         LOGGER.warning("Removed {} duplicate trackpoint(s)".format(len(gpx_data["lat"]) - len(gpx_data_nodup["lat"])))
 
-    gpx_data_interp = __gpx_interpolate(gpx_data_nodup, resolution)
+    count("duplicates_removed", len(gpx_data["lat"]) - len(gpx_data_nodup["lat"]))
 
-    return __to_track(gpx_data_interp)
+    return gpx_data_nodup, gpx_dist_nodup
 
 
-def __gpx_interpolate(gpx_data: _GPXData, res: float = 5.0) -> _GPXData:
+def __gpx_interpolate(
+    gpx_data: _GPXData,
+    gpx_dist: np.ndarray,
+    res: float = 5.0,
+    progress: Progress | None = None,
+) -> _GPXData:
     """Return gpx_data interpolated with a spatial resolution res using piecewise cubic Hermite splines.
 
-    If num is passed, gpx_data is interpolated to num points and res is ignored.
+    gpx_data is expected to have no duplicates, gpx_dist are its horizontal distances between trackpoints.
+    Spline is evaluated in chunks, checking `progress` token between them.
     """
-    if all(gpx_data[i] in (None, []) for i in _fields):
+    if len(gpx_data["lat"]) == 0:
         return gpx_data
 
-    _gpx_data = __gpx_remove_duplicates(gpx_data)
-    _gpx_dist = __gpx_calculate_distance(_gpx_data, use_ele=True)
-
-    xi = np.cumsum(_gpx_dist)
-    yi = np.array([_gpx_data[i] for i in _fields if _gpx_data[i]])
+    xi = np.cumsum(__gpx_calculate_distance(gpx_data, gpx_dist, use_ele=True))
+    fields = [i for i in _fields if gpx_data[i] is not None]
+    yi = np.array([gpx_data[i] for i in fields])
 
     num = int(np.ceil(xi[-1] / res))
 
     x = np.linspace(xi[0], xi[-1], num=num, endpoint=True)
-    y = pchip_interpolate(xi, yi, x, axis=1)
-
-    return {
-        "lat": list(y[0, :]),
-        "lon": list(y[1, :]),
-        "ele": list(y[2, :]) if gpx_data["ele"] else None,
-        "dist": list(y[3, :]),
-    }
 
+    from scipy.interpolate import PchipInterpolator  # noqa: PLC0415  # scipy is slow to import
 
-def __gpx_calculate_distance(gpx_data: _GPXData, *, use_ele: bool = True) -> list[float]:
-    """Return the distance between GPX trackpoints.
+    spline = PchipInterpolator(xi, yi, axis=1)
+    y = np.empty((len(fields), num))
 
-    if use_ele is True and gpx_data['ele'] is not None, the elevation data is used to compute the distance.
-    """
-    gpx_dist = np.zeros(len(gpx_data["lat"]))
+    for part in slices(num):
+        y[:, part] = spline(x[part])
+        report(progress, "interpolate", part.stop, num)
 
-    for i in range(len(gpx_dist) - 1):
-        lat1 = np.radians(gpx_data["lat"][i])
-        lon1 = np.radians(gpx_data["lon"][i])
-        lat2 = np.radians(gpx_data["lat"][i + 1])
-        lon2 = np.radians(gpx_data["lon"][i + 1])
+    result = dict.fromkeys(_fields)
+    result.update(zip(fields, y, strict=True))
 
-        delta_lat = lat2 - lat1
-        delta_lon = lon2 - lon1
+    return result
 
-        c = 2.0 * np.arcsin(
-            np.sqrt(np.sin(delta_lat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2.0) ** 2),
-        )  # haversine formula
 
-        dist_latlon = _EARTH_RADIUS * c  # great-circle distance
+def __gpx_calculate_distance(gpx_data: _GPXData, gpx_dist: np.ndarray, *, use_ele: bool = True) -> np.ndarray:
+    """Return the distance between GPX trackpoints.
 
-        if gpx_data["ele"] and use_ele:
-            dist_ele = gpx_data["ele"][i + 1] - gpx_data["ele"][i]
+    gpx_dist are already known horizontal distances.
+    if use_ele is True and gpx_data['ele'] is not None, the elevation data is used to compute the distance.
+    """
+    if gpx_data["ele"] is not None and use_ele:
+        return with_elevation(gpx_dist, gpx_data["ele"])
 
-            gpx_dist[i + 1] = np.sqrt(dist_latlon**2 + dist_ele**2)
-        else:
-            gpx_dist[i + 1] = dist_latlon
+    return gpx_dist
 
-    return gpx_dist.tolist()
 
+def __gpx_remove_duplicates(gpx_data: _GPXData) -> tuple[_GPXData, np.ndarray]:
+    """Return gpx_data where duplicate trackpoints are removed and its horizontal distances between trackpoints.
 
-def __gpx_remove_duplicates(gpx_data: _GPXData) -> _GPXData:
-    """Return gpx_data where duplicate trackpoints are removed."""
-    gpx_dist = __gpx_calculate_distance(gpx_data, use_ele=False)
+    Distances are taken from cumulative horizontal distance of the parsed track, duplicates are exactly zero there.
+    """
+    gpx_dist = np.diff(gpx_data["dist"], prepend=gpx_data["dist"][:1])
 
     i_dist = np.concatenate(([0], np.nonzero(gpx_dist)[0]))  # keep gpx_dist[0] = 0.0
 
     if len(i_dist) == len(gpx_dist):
-        return gpx_data
-
-    gpx_data_nodup = {fld: [] for fld in _fields}
+        return gpx_data, gpx_dist
 
-    for k in _fields:
-        gpx_data_nodup[k] = [gpx_data[k][i] for i in i_dist] if gpx_data[k] else None
+    # removed trackpoints repeat the previous kept one, so the distances between kept trackpoints stay the same
+    return {k: None if gpx_data[k] is None else gpx_data[k][i_dist] for k in _fields}, gpx_dist[i_dist]
 
-    return gpx_data_nodup
 
+def __from_track(track: RouteTrack) -> _GPXData:
+    """Return a GPXData structure from a route track."""
+    ele = filled_elevation(track)
 
-def __from_track(track: list[PositionPoint]) -> _GPXData:
-    """Return a GPXData structure from a GPX file."""
-    # for some reason `dict.fromkeys(_fields, [])` not working, scipy tries to allocate a lot of data (40G+)
-    gpx_data = {"lat": [], "lon": [], "ele": [], "dist": []}
-
-    for point in track:
-        gpx_data["lat"].append(point.position[0])
-        gpx_data["lon"].append(point.position[1])
-        gpx_data["ele"].append(point.elevation)
-        gpx_data["dist"].append(point.distance)
-
-    return gpx_data
+    if ele is not None:
+        count("elevation_filled", int(np.ma.count_masked(track.elevation)))
 
+    return {
+        "lat": track.lat,
+        "lon": track.lon,
+        "ele": ele,
+        "dist": track.distance,
+    }
 
-def __to_track(gpx_data: _GPXData) -> list[PositionPoint]:
-    gpx_track = []
 
+def __to_track(gpx_data: _GPXData, accuracy: Accuracy) -> RouteTrack:
     # re-calculate distance for interpolated points
-    _ip_dist = np.cumsum(__gpx_calculate_distance(gpx_data, use_ele=True))
-
-    for i in range(len(gpx_data["lat"])):
-        lat = gpx_data["lat"][i]
-        lon = gpx_data["lon"][i]
-        dist = _ip_dist[i]
-        ele = gpx_data["ele"][i] if gpx_data["ele"] else None
-
-        gpx_point = PositionPoint(position=(lat, lon), elevation=ele, distance=dist)
+    gpx_dist = segment_distances(gpx_data["lat"], gpx_data["lon"], accuracy)
+    _ip_dist = np.cumsum(__gpx_calculate_distance(gpx_data, gpx_dist, use_ele=True))
 
-        gpx_track.append(gpx_point)
+    ele = gpx_data["ele"]
 
-    return gpx_track
+    return RouteTrack(
+        lat=gpx_data["lat"],
+        lon=gpx_data["lon"],
+        distance=_ip_dist,
+        elevation=None if ele is None else np.ma.masked_invalid(ele),
+    )
@@ -1,55 +1,103 @@
 from pathlib import Path
 
-from geopy.distance import geodesic
-from lxml import etree
+import numpy as np
 
-from ...classes.points import Position, PositionPoint
+from ...classes.tracks import RouteTrack
+from ...geodesy import Accuracy, segment_distances
+from ...profiling import count, stage
+from ...progress import CHUNK_SIZE, Progress, report
 from ..errors import UnsupportedFileExtError
 from ..xml import add_ns
-from ..zip import unzip
+from ..zip import Source, single_source
 
+_any_ns = "*"
+_point_tags = ("trkpt", "rtept")  # track and route points
+_ele_tag = add_ns("ele", _any_ns)
 
-def parse_gpx(src: Path) -> list[PositionPoint]:
-    """Parse GPX file by given path."""
-    if src.suffix.lower() == ".zip":
-        src = unzip(src)
+_initial_capacity = 4096  # points
 
-    if not src.suffix.lower() == ".gpx":
-        raise UnsupportedFileExtError(src)
 
-    result = []
+class _PointBuffer:
+    """Growing preallocated arrays of point coordinates."""
 
-    root: etree.ElementBase = etree.parse(src).getroot()  # локальное приложение
+    def __init__(self):
+        self.size = 0
+        self.lat = np.empty(_initial_capacity)
+        self.lon = np.empty(_initial_capacity)
+        self.ele = np.empty(_initial_capacity)
 
-    default_ns = root.nsmap[None]
+    def append(self, lat: float, lon: float, ele: float):
+        if self.size == len(self.lat):
+            self.__grow()
 
-    track_points: list[etree.ElementBase] = root.findall(
-        "./" + add_ns("trk", default_ns) + "/" + add_ns("trkseg", default_ns) + "/" + add_ns("trkpt", default_ns),
-    )
+        self.lat[self.size] = lat
+        self.lon[self.size] = lon
+        self.ele[self.size] = ele
+        self.size += 1
 
-    prev = None
+    def __grow(self):
+        capacity = 2 * len(self.lat)
 
-    for point in track_points:
-        position = (float(point.attrib["lat"]), float(point.attrib["lon"]))
+        for name in ("lat", "lon", "ele"):
+            values = np.empty(capacity)
+            values[: self.size] = getattr(self, name)
+            setattr(self, name, values)
 
-        elevation_element: etree.ElementBase = point.find("./" + add_ns("ele", default_ns))
+    def to_track(self, accuracy: Accuracy) -> RouteTrack:
+        lat, lon, ele = self.lat[: self.size].copy(), self.lon[: self.size].copy(), self.ele[: self.size].copy()
 
-        gpx_point = PositionPoint(
-            position=position,
-            distance=__total_distance(position, prev),
-            elevation=float(elevation_element.text),
+        return RouteTrack(
+            lat=lat,
+            lon=lon,
+            distance=np.cumsum(segment_distances(lat, lon, accuracy)),
+            elevation=None if np.isnan(ele).all() else np.ma.masked_invalid(ele),
         )
-        result.append(gpx_point)
 
-        prev = gpx_point
 
-    return result
+@stage("parse_gpx")
+def parse_gpx(
+    src: Path | Source,
+    progress: Progress | None = None,
+    *,
+    accuracy: Accuracy = Accuracy.ELLIPSOID,
+) -> RouteTrack:
+    """Parse GPX file by given path or source, see `firome.codecs.zip.Source`.
+
+    Points of all tracks and track segments are joined in document order. Route points are used if there are no
+    tracks in the file. Elevation is optional. Distance is horizontal, computed with given `accuracy`.
+    File is read incrementally, parsed elements are dropped as soon as the point is stored. Parsed points are
+    reported to `progress` token.
+    """
+    source = single_source(src)
+
+    if source.suffix != ".gpx":
+        raise UnsupportedFileExtError(src)
+
+    from lxml import etree  # noqa: PLC0415  # imported on the first use
+
+    buffers = {tag: _PointBuffer() for tag in _point_tags}
+    parsed = 0
+
+    with source.open() as stream:
+        for _, point in etree.iterparse(stream, events=("end",), tag=[add_ns(tag, _any_ns) for tag in _point_tags]):
+            ele = point.findtext(_ele_tag)
+
+            buffers[etree.QName(point).localname].append(
+                float(point.attrib["lat"]),
+                float(point.attrib["lon"]),
+                np.nan if ele is None or not ele.strip() else float(ele),  # some exporters write empty element
+            )
 
+            # drop the point and already processed siblings
+            point.clear(keep_tail=False)
+            while point.getprevious() is not None:
+                del point.getparent()[0]
 
-def __total_distance(current: Position, previous: PositionPoint | None) -> float:
-    if previous is None:
-        return 0
+            parsed += 1
+            if parsed % CHUNK_SIZE == 0:
+                report(progress, "parse_gpx", parsed)
 
-    distance = geodesic(current, previous.position)
+    buffer = buffers["trkpt"] if buffers["trkpt"].size else buffers["rtept"]
+    count("points", buffer.size)
 
-    return distance.meters + previous.distance
+    return buffer.to_track(accuracy)
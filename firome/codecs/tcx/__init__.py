@@ -1,5 +1,5 @@
 """TCX file operations."""
 
-from .export import export_as_tcx
+from .export import export_as_tcx, export_chunks_as_tcx
 
-__all__ = ["export_as_tcx"]
+__all__ = ["export_as_tcx", "export_chunks_as_tcx"]
@@ -1,74 +1,124 @@
-from datetime import timezone
-from typing import TYPE_CHECKING
+import gzip
+from collections.abc import Callable, Iterable
+from pathlib import Path
 
-from lxml import etree
+import numpy as np
 
 from ... import __version__
-from ...classes.export import ExportFields
-from ...classes.points import DataPoint
-from .common import _namespaces, _time_format, _with_ns
+from ...classes.export import ExportFields, ExportPrecision
+from ...classes.tracks import ActivityTrack
+from ...profiling import count, stage
+from ...progress import Progress, report
+from ..chunks import export_parts
+from .common import _namespaces, _with_ns
 
-if TYPE_CHECKING:
-    from lxml.etree import ElementBase
+_root_attrs = {
+    _with_ns("schemaLocation", "xsi"): "http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2 "
+    "http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2.xsd",
+}
 
+_encoding = "UTF-8"
+_lap_close = "</Track></Lap>"
 
-def export_as_tcx(points: list[DataPoint], destination: str, fields=None):
+_gzip_suffix = ".gz"
+_gzip_level = 6  # compresses almost as good as the maximum level, but several times faster
+
+
+def export_as_tcx(points: ActivityTrack, destination: str, fields=None, precision=None, progress=None):
     """Export data points to TCX file."""
+    export_chunks_as_tcx([points], destination, fields, precision, progress)
+
+
+@stage("export_tcx")
+def export_chunks_as_tcx(
+    chunks: Iterable[ActivityTrack],
+    destination: str,
+    fields=None,
+    precision=None,
+    progress: Progress | None = None,
+):
+    """Export data points to TCX file writing chunks as they come.
+
+    Only the chunk being written is kept in memory, large chunks are rendered in parts. Document head is serialized
+    by lxml once, trackpoints are rendered from the text templates of the same serialization.
+    Values are rounded according to `precision`, `ExportPrecision()` by default.
+    Output is compressed with gzip if destination ends with `.gz`.
+    Written points are reported to `progress` token, with the total if chunks are given as a sequence.
+    """
     if fields is None:
         fields = ExportFields()
 
-    start_ts = points[0].timestamp.strftime(_time_format)
+    if precision is None:
+        precision = ExportPrecision()
 
-    root_attrs = {
-        etree.QName(
-            "http://www.w3.org/2001/XMLSchema-instance",
-            "schemaLocation",
-        ): "http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2 "
-        "http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2.xsd",
-    }
-    root: ElementBase = etree.Element(_with_ns("TrainingCenterDatabase"), root_attrs, nsmap=_namespaces)
+    first, chunks, total = export_parts(chunks)
 
-    activities = etree.SubElement(root, _with_ns("Activities"))
+    start_ts = _format_time(first.timestamp[:1])[0]
+    head, tail = _skeleton(start_ts)
+    lap_open = f'<Lap StartTime="{start_ts}"><TriggerMethod>Manual</TriggerMethod><Track>'
 
-    activity = etree.SubElement(activities, _with_ns("Activity"), {"Sport": "Biking"})
+    with _open(destination) as dst:
+        dst.write(head)
+
+        lap_i = 0
+        written = 0
+
+        for chunk in chunks:
+            count("points", len(chunk))
+
+            parts = []
+            laps = chunk.lap
+            starts = np.flatnonzero(np.diff(laps, prepend=lap_i)).tolist()  # points starting new laps
+            points = _trackpoints(chunk, fields, precision)
+            prev = 0
+
+            for start in starts:
+                parts.extend(points[prev:start])
+                parts.append(lap_open if lap_i == 0 else _lap_close + lap_open)
+
+                lap_i = int(laps[start])
+                prev = start
 
-    activity_id = etree.SubElement(activity, _with_ns("Id"))
-    activity_id.text = start_ts
+            parts.extend(points[prev:])
 
-    notes = etree.SubElement(activity, _with_ns("Notes"))
-    notes.text = f"Merged by firome {__version__}"
+            dst.write("".join(parts).encode(_encoding))
 
-    lap_i = 0
-    lap_track = None
+            written += len(chunk)
+            report(progress, "export_tcx", written, total)
 
-    for p in points:
-        if p.lap is None:
-            if lap_track is None:
-                continue
+        dst.write(_lap_close.encode(_encoding) + tail)
 
-            p.lap = lap_i
+    count("bytes", Path(destination).stat().st_size)
 
-        if p.lap != lap_i:
-            lap_i = p.lap
 
-            lap_track = _new_lap(activity, start_ts)
+def _open(destination: str):
+    if destination.lower().endswith(_gzip_suffix):
+        # zero mtime keeps the output reproducible
+        return gzip.GzipFile(destination, "wb", compresslevel=_gzip_level, mtime=0)
 
-        _append_point(p, lap_track, fields)
+    return open(destination, "wb")  # noqa: PTH123  # destination is str
 
-    root.getroottree().write(destination, encoding="utf-8", xml_declaration=True)
 
+def _skeleton(start_ts: str) -> tuple[bytes, bytes]:
+    """Return serialized document before the first lap and after the last one."""
+    from lxml import etree  # noqa: PLC0415  # imported on the first use
 
-def _new_lap(activity: etree.ElementBase, start_ts: str) -> etree.ElementBase:
-    lap = etree.SubElement(activity, _with_ns("Lap"), {"StartTime": start_ts})
+    root = etree.Element(_with_ns("TrainingCenterDatabase"), _root_attrs, nsmap=_namespaces)
+    activities = etree.SubElement(root, _with_ns("Activities"))
+    activity = etree.SubElement(activities, _with_ns("Activity"), {"Sport": "Biking"})
+
+    etree.SubElement(activity, _with_ns("Id")).text = start_ts
+    etree.SubElement(activity, _with_ns("Notes")).text = f"Merged by firome {__version__}"
+    etree.SubElement(activity, _with_ns("Lap"))  # placeholder
 
-    lap_trigger_method = etree.SubElement(lap, _with_ns("TriggerMethod"))
-    lap_trigger_method.text = "Manual"
+    document = etree.tostring(root.getroottree(), encoding=_encoding, xml_declaration=True)
+    head, tail = document.split(b"<Lap/>")
 
-    return etree.SubElement(lap, _with_ns("Track"))
+    return head, tail
 
 
-def _append_point(point: DataPoint, base_element: etree.ElementBase, fields: ExportFields) -> etree.ElementBase:
-    """Trackpoint example.
+def _trackpoints(points: ActivityTrack, fields: ExportFields, precision: ExportPrecision) -> list[str]:
+    """Render trackpoints, missing values are skipped.
 
     <Trackpoint>
       <Time>2014-11-30T05:51:36Z</Time>
@@ -90,63 +140,87 @@ def _append_point(point: DataPoint, base_element: etree.ElementBase, fields: Exp
       </Extensions>
     </Trackpoint>
     """
-    result = etree.SubElement(base_element, _with_ns("Trackpoint"))
-
-    # <Time>2014-11-30T05:51:36Z</Time>
-    p_time = etree.SubElement(result, _with_ns("Time"))
-    p_time.text = point.timestamp.astimezone(timezone.utc).strftime(_time_format)
-
-    #   <Position>
-    #     <LatitudeDegrees>51.791013</LatitudeDegrees>
-    #     <LongitudeDegrees>39.199698</LongitudeDegrees>
-    #   </Position>
-
-    if point.position is not None:
-        p_position = etree.SubElement(result, _with_ns("Position"))
-        p_pos_lat = etree.SubElement(p_position, _with_ns("LatitudeDegrees"))
-        p_pos_lat.text = str(point.position[0])
-        p_pos_lon = etree.SubElement(p_position, _with_ns("LongitudeDegrees"))
-        p_pos_lon.text = str(point.position[1])
-
-    #  <AltitudeMeters>152</AltitudeMeters>
-    if fields.altitude and point.elevation is not None:
-        p_alt = etree.SubElement(result, _with_ns("AltitudeMeters"))
-        p_alt.text = str(point.elevation)
-
-    # <DistanceMeters>14956.23</DistanceMeters>
-    if fields.distance:
-        p_distance = etree.SubElement(result, _with_ns("DistanceMeters"))
-        p_distance.text = str(point.distance)
-
-    #   <HeartRateBpm>
-    #     <Value>168</Value>
-    #   </HeartRateBpm>
-    if fields.heart_rate and point.heart_rate is not None:
-        p_hr = etree.SubElement(result, _with_ns("HeartRateBpm"))
-        p_hr_val = etree.SubElement(p_hr, _with_ns("Value"))
-        p_hr_val.text = str(point.heart_rate)
-
-    # <Cadence>90</Cadence>
-    if fields.cadence and point.cadence is not None:
-        p_cadence = etree.SubElement(result, _with_ns("Cadence"))
-        p_cadence.text = str(point.cadence)
-
-    #   <Extensions>
-    #       <ns3:TPX>
-    #           <ns3:Speed>0</ns3:Speed>
-    #           <ns3:Watts>135</ns3:Watts>
-    #       </ns3:TPX>
-    #   </Extensions>
-    need_speed = fields.speed and point.speed is not None
-    need_pwr = fields.power and point.power is not None
-    if need_speed or need_pwr:
-        p_ext = etree.SubElement(result, _with_ns("Extensions"))
-        p_ext_tpx = etree.SubElement(p_ext, _with_ns("TPX", "ns3"))
-        if need_speed:
-            p_ext_tpx_speed = etree.SubElement(p_ext_tpx, _with_ns("Speed", "ns3"))
-            p_ext_tpx_speed.text = str(point.speed)
-        if need_pwr:
-            p_ext_watts = etree.SubElement(p_ext_tpx, _with_ns("Watts", "ns3"))
-            p_ext_watts.text = str(point.power)
-
-    return result
+    size = len(points)
+
+    position = [
+        "" if lat is None or lon is None else
+        f"<Position><LatitudeDegrees>{lat}</LatitudeDegrees><LongitudeDegrees>{lon}</LongitudeDegrees></Position>"
+        for lat, lon in zip(
+            _text(points.lat, size, enabled=True, decimals=precision.position),
+            _text(points.lon, size, enabled=True, decimals=precision.position),
+            strict=True,
+        )
+    ]  # fmt: skip
+
+    speed = _text(points.speed, size, enabled=fields.speed, decimals=precision.speed)
+    power = _text(points.power, size, enabled=fields.power)
+
+    extensions = [
+        "" if s is None and w is None else
+        "<Extensions><ns3:TPX>"
+        + ("" if s is None else f"<ns3:Speed>{s}</ns3:Speed>")
+        + ("" if w is None else f"<ns3:Watts>{w}</ns3:Watts>")
+        + "</ns3:TPX></Extensions>"
+        for s, w in zip(speed, power, strict=True)
+    ]  # fmt: skip
+
+    heart_rate = _text(points.heart_rate, size, enabled=fields.heart_rate)
+
+    columns = (
+        _wrap(_format_time(points.timestamp), "<Trackpoint><Time>", "</Time>"),
+        position,
+        _wrap(
+            _text(points.elevation, size, enabled=fields.altitude, decimals=precision.altitude),
+            "<AltitudeMeters>",
+            "</AltitudeMeters>",
+        ),
+        _wrap(
+            _text(points.distance, size, enabled=fields.distance, decimals=precision.distance),
+            "<DistanceMeters>",
+            "</DistanceMeters>",
+        ),
+        _wrap(heart_rate, "<HeartRateBpm><Value>", "</Value></HeartRateBpm>"),
+        _wrap(_text(points.cadence, size, enabled=fields.cadence), "<Cadence>", "</Cadence>"),
+        extensions,
+        ["</Trackpoint>"] * size,
+    )
+
+    return list(map("".join, zip(*columns, strict=True)))
+
+
+def _wrap(texts: list[str | None], opening: str, closing: str) -> list[str]:
+    """Wrap texts into tags, missing texts are rendered empty."""
+    return ["" if text is None else opening + text + closing for text in texts]
+
+
+def _format_time(timestamps: np.ndarray) -> list[str]:
+    """Format UTC timestamps as `2014-11-30T05:51:36Z`."""
+    return [f"{ts}Z" for ts in np.datetime_as_string(timestamps, unit="s").tolist()]
+
+
+def _text(channel: np.ndarray | None, size: int, *, enabled: bool, decimals: int | None = None) -> list[str | None]:
+    """Return text representation of channel values with `None` for missing values.
+
+    Float values are formatted with given number of decimals, or the shortest representation if it's `None`.
+    """
+    if channel is None or not enabled:
+        return [None] * size
+
+    data = np.ma.getdata(channel)
+
+    if decimals is not None and np.issubdtype(data.dtype, np.floating):
+        values = map(_formatter(decimals), data.tolist())
+    elif data.dtype == np.float32:
+        # float32 is formatted by numpy to keep the shortest representation of the stored value
+        values = data.astype(str).tolist()
+    else:
+        values = map(str, data.tolist())
+
+    mask = np.ma.getmaskarray(channel).tolist()
+
+    return [None if missing else value for value, missing in zip(values, mask, strict=True)]
+
+
+def _formatter(decimals: int) -> Callable[[float], str]:
+    """Return fixed-point formatter, printf-style formatting is the fastest one for floats."""
+    return f"%.{decimals}f".__mod__
@@ -1,3 +1,4 @@
-from .unzip import unzip
+from .errors import EmptyArchiveError, MultipleFilesError
+from .source import Source, single_source, sources
 
-__all__ = ["unzip"]
+__all__ = ["EmptyArchiveError", "MultipleFilesError", "Source", "single_source", "sources"]
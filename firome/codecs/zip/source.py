@@ -0,0 +1,132 @@
+"""Input files read directly from ZIP archives and gzip streams, without extraction to disk."""
+
+import gzip
+import mmap
+import struct
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO
+
+from .errors import EmptyArchiveError, MultipleFilesError
+
+_zip_suffix = ".zip"
+_gzip_suffix = ".gz"
+
+_local_header = struct.Struct("<4s5H3I2H")  # ZIP local file header, up to the variable-length fields
+
+
+@dataclass(frozen=True)
+class Source:
+    """Input file, or a member of ZIP archive if `member` is set. Files ending with `.gz` are decompressed."""
+
+    path: Path
+    member: str | None = None
+
+    @property
+    def name(self) -> str:
+        """Name of the file content, without archive and compression suffixes."""
+        name = Path(self.member).name if self.member is not None else self.path.name
+
+        return name[: -len(_gzip_suffix)] if name.lower().endswith(_gzip_suffix) else name
+
+    @property
+    def suffix(self) -> str:
+        """Lowercase extension of the file content, e.g. `.fit`."""
+        return Path(self.name).suffix.lower()
+
+    def open(self) -> IO[bytes]:
+        """Open file content as binary stream."""
+        if self.member is None:
+            stream = self.path.open("rb")
+        else:
+            archive = zipfile.ZipFile(self.path)
+            stream = _ArchiveMember(archive, archive.open(self.member))
+
+        if self.__compressed:
+            return gzip.GzipFile(fileobj=stream, mode="rb")
+
+        return stream
+
+    def read(self) -> bytes:
+        """Return the whole file content.
+
+        Members stored in ZIP archive without compression are copied from the memory-mapped archive.
+        """
+        if self.member is not None and not self.__compressed:
+            with zipfile.ZipFile(self.path) as archive:
+                info = archive.getinfo(self.member)
+
+            if info.compress_type == zipfile.ZIP_STORED and info.file_size > 0:
+                return _mapped(self.path, info)
+
+        if self.member is None and not self.__compressed:
+            return self.path.read_bytes()
+
+        with self.open() as stream:
+            return stream.read()
+
+    @property
+    def __compressed(self) -> bool:
+        name = self.member if self.member is not None else self.path.name
+
+        return name.lower().endswith(_gzip_suffix)
+
+
+def sources(src: Path) -> list[Source]:
+    """Return sources of all files in ZIP archive, or the source of the file itself if it's not an archive."""
+    if src.suffix.lower() != _zip_suffix:
+        return [Source(src)]
+
+    with zipfile.ZipFile(src) as archive:
+        members = [info.filename for info in archive.infolist() if not info.is_dir()]
+
+    if not members:
+        raise EmptyArchiveError(src)
+
+    return [Source(src, member) for member in members]
+
+
+def single_source(src: Path | Source) -> Source:
+    """Return source of the single file in ZIP archive, or the source of the file itself if it's not an archive."""
+    if isinstance(src, Source):
+        return src
+
+    found = sources(src)
+
+    if len(found) > 1:
+        raise MultipleFilesError(src)
+
+    return found[0]
+
+
+class _ArchiveMember:
+    """Archive member stream closing the archive together with the stream."""
+
+    def __init__(self, archive: zipfile.ZipFile, stream: IO[bytes]):
+        self._archive = archive
+        self._stream = stream
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Close member stream and the archive."""
+        self._stream.close()
+        self._archive.close()
+
+
+def _mapped(path: Path, info: zipfile.ZipInfo) -> bytes:
+    """Return content of the stored archive member, copied out of the archive mapping closed afterwards."""
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        fields = _local_header.unpack_from(mapped, info.header_offset)
+        name_size, extra_size = fields[-2:]
+        start = info.header_offset + _local_header.size + name_size + extra_size
+
+        return mapped[start : start + info.file_size]
@@ -0,0 +1,124 @@
+"""Distances between points on the Earth surface, computed over whole coordinate arrays at once."""
+
+from enum import Enum
+
+import numpy as np
+
+EARTH_RADIUS = 6371e3  # mean radius, meters
+
+# WGS 84 ellipsoid
+_WGS84_A = 6378137.0
+_WGS84_F = 1 / 298.257223563
+_WGS84_B = (1 - _WGS84_F) * _WGS84_A
+
+_vincenty_tolerance = 1e-12  # radians, ~0.006 mm
+_vincenty_iterations = 200
+
+
+class Accuracy(Enum):
+    """Model of the Earth used for distances."""
+
+    SPHERE = "sphere"  # haversine formula, error up to 0.5%, fastest
+    ELLIPSOID = "ellipsoid"  # Vincenty formula on WGS 84, sub-millimeter agreement with Karney's geodesic
+
+
+def distance(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray,
+    accuracy: Accuracy = Accuracy.SPHERE,
+) -> np.ndarray:
+    """Return distances in meters between pairs of points given in degrees."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+
+    if accuracy is Accuracy.ELLIPSOID:
+        return _vincenty(lat1, lon1, lat2, lon2)
+
+    return _haversine(lat1, lon1, lat2, lon2)
+
+
+def segment_distances(lat: np.ndarray, lon: np.ndarray, accuracy: Accuracy = Accuracy.SPHERE) -> np.ndarray:
+    """Return distances in meters from the previous point of the track, first distance is zero."""
+    segments = np.zeros(len(lat))
+
+    if len(lat) > 1:
+        segments[1:] = distance(lat[:-1], lon[:-1], lat[1:], lon[1:], accuracy)
+
+    return segments
+
+
+def with_elevation(segments: np.ndarray, ele: np.ndarray) -> np.ndarray:
+    """Return segment distances accounting for elevation change between the points."""
+    ele_delta = np.zeros(len(ele))
+    ele_delta[1:] = np.diff(ele)
+
+    return np.sqrt(segments**2 + ele_delta**2)
+
+
+def _haversine(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    delta_lat = lat2 - lat1
+    delta_lon = lon2 - lon1
+
+    c = 2.0 * np.arcsin(
+        np.sqrt(np.sin(delta_lat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2.0) ** 2),
+    )
+
+    return EARTH_RADIUS * c
+
+
+def _vincenty(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Vincenty's inverse formula, nearly antipodal points not converging fall back to haversine."""
+    u1 = np.arctan((1 - _WGS84_F) * np.tan(lat1))
+    u2 = np.arctan((1 - _WGS84_F) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lon_delta = lon2 - lon1
+    lam = lon_delta
+    converged = np.zeros(np.shape(lam), dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for _ in range(_vincenty_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+
+            sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            sin_alpha = np.where(sin_sigma > 0, cos_u1 * cos_u2 * sin_lam / sin_sigma, 0)
+            cos2_alpha = 1 - sin_alpha**2
+            # equatorial line has cos2_alpha = 0
+            cos_2sigma_m = np.where(cos2_alpha > 0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha, 0)
+
+            c = _WGS84_F / 16 * cos2_alpha * (4 + _WGS84_F * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = lon_delta + (1 - c) * _WGS84_F * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m**2))
+            )
+
+            converged = np.abs(lam - lam_prev) <= _vincenty_tolerance
+
+            if converged.all():
+                break
+
+    u_sq = cos2_alpha * (_WGS84_A**2 - _WGS84_B**2) / _WGS84_B**2
+    a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = (
+        b
+        * sin_sigma
+        * (
+            cos_2sigma_m
+            + b
+            / 4
+            * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+                - b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sigma_m**2)
+            )
+        )
+    )
+
+    result = _WGS84_B * a * (sigma - delta_sigma)
+
+    return np.where(converged, result, _haversine(lat1, lon1, lat2, lon2))
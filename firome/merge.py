@@ -1,27 +1,115 @@
-import math
+from collections.abc import Iterable, Iterator
+from dataclasses import replace
+from functools import partial
 
-from .classes.points import DataPoint, PositionPoint
+import numpy as np
 
+from .classes.tracks import ActivityTrack, RouteTrack
+from .codecs.gpx.interpolate import RouteModel
+from .profiling import count, stage
+from .progress import Progress, report, slices
 
-def merge(position_elements: list[PositionPoint], data_elements: list[DataPoint], precision: float):
-    """Update data_elements points with position data."""
-    p_start = d_i = 0
 
-    p_len = len(position_elements)
-    d_len = len(data_elements)
+@stage("merge")
+def merge(
+    position_elements: RouteTrack | RouteModel,
+    data_elements: ActivityTrack,
+    precision: float,
+    progress: Progress | None = None,
+) -> ActivityTrack:
+    """Return data_elements track updated with position data.
 
-    while d_i < d_len:
-        for p_i in range(p_start, p_len):
-            if data_elements[d_i].distance is None:
-                break  # exit internal loop
+    Position and elevation are interpolated between two route points bracketing the activity point distance,
+    or evaluated directly from the route model.
+    Activity points further than `precision / 2` outside of the route are left without position.
+    Activity is processed in chunks, reporting merged points to `progress` token.
+    """
+    dist = data_elements.distance
 
-            if math.isclose(position_elements[p_i].distance, data_elements[d_i].distance, abs_tol=precision / 2):
-                data_elements[d_i].position = position_elements[p_i].position
-                data_elements[d_i].elevation = position_elements[p_i].elevation
-                p_start = p_i
+    if isinstance(position_elements, RouteModel):
+        positions = position_elements
+        start, end = position_elements.start, position_elements.end
+    elif len(position_elements) > 0:
+        positions = partial(_from_positions, position_elements)
+        start, end = position_elements.distance[0], position_elements.distance[-1]
+    else:
+        return data_elements
 
-                break
+    lat, lon, ele = np.empty(len(dist)), np.empty(len(dist)), np.empty(len(dist))
 
-        d_i += 1
+    for part in slices(len(dist)):
+        lat[part], lon[part], ele[part] = positions(dist[part])
+        report(progress, "merge", part.stop, len(dist))
 
-    return data_elements
+    missing = (dist < start - precision / 2) | (dist > end + precision / 2)
+
+    count("points", len(dist))
+    count("matched", len(dist) - np.count_nonzero(missing))
+
+    return replace(
+        data_elements,
+        lat=np.ma.MaskedArray(lat, mask=missing),
+        lon=np.ma.MaskedArray(lon, mask=missing),
+        elevation=np.ma.MaskedArray(ele, mask=missing | np.isnan(ele)),
+    )
+
+
+def merge_chunks(
+    position_elements: RouteTrack | RouteModel,
+    chunks: Iterable[ActivityTrack],
+    precision: float,
+    progress: Progress | None = None,
+) -> Iterator[ActivityTrack]:
+    """Merge position data into activity chunks as they come, see `merge`.
+
+    Route is looked up by binary search for each chunk, so only the current chunk of activity is kept in memory.
+    Total of merged points is reported to `progress` token after each chunk.
+    """
+    merged = 0
+
+    for chunk in chunks:
+        result = merge(position_elements, chunk, precision)
+        merged += len(chunk)
+        report(progress, "merge", merged)
+
+        yield result
+
+
+def _from_positions(position_elements: RouteTrack, dist: np.ndarray):
+    route_ele = position_elements.elevation
+    route_ele = np.full(len(position_elements), np.nan) if route_ele is None else route_ele.filled(np.nan)
+
+    left, weight = _bracket(position_elements.distance, dist)
+
+    return (
+        _lerp(position_elements.lat, left, weight),
+        _lerp(position_elements.lon, left, weight),
+        _lerp(route_ele, left, weight),
+    )
+
+
+def _bracket(route_dist: np.ndarray, dist: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Find index of the left route point bracketing each distance and relative position between neighbours.
+
+    Distances outside of the route are clamped to the route ends.
+    """
+    if len(route_dist) == 1:
+        return np.zeros(len(dist), dtype=np.intp), np.zeros(len(dist))
+
+    left = np.clip(np.searchsorted(route_dist, dist, side="right") - 1, 0, len(route_dist) - 2)
+
+    span = route_dist[left + 1] - route_dist[left]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(span > 0, (dist - route_dist[left]) / span, 0)
+
+    return left, np.clip(weight, 0, 1)
+
+
+def _lerp(values: np.ndarray, left: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    if len(values) == 1:
+        return np.repeat(values, len(left))
+
+    base = values[left]
+
+    return np.where(weight > 0, base + (values[left + 1] - base) * weight, base)
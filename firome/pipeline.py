@@ -0,0 +1,417 @@
+"""Merge jobs processing, single and in batches on a process pool."""
+
+import csv
+import json
+import os
+import signal
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+
+from .cache import TrackCache
+from .classes.export import OUTPUT_FORMATS, ExportFields, ExportPrecision
+from .classes.tracks import ActivityTrack, RouteTrack
+from .codecs.fit import StreamingError, export_chunks_as_fit, fit_sources, parse_fit_chunks
+from .codecs.gpx import RouteModel, route_model
+from .codecs.tcx import export_chunks_as_tcx
+from .codecs.zip import Source
+from .logger import LOGGER
+from .merge import merge_chunks
+from .profiling import Profiler
+from .progress import Progress
+from .simplify import Simplification, simplify_chunks
+
+_manifest_columns = ("route", "recording", "output", "precision")
+_routes_kept = 8  # routes kept in memory by a worker
+
+
+class ManifestError(Exception):
+    """Invalid batch manifest."""
+
+
+@dataclass(frozen=True)
+class Options:
+    """Options shared by all jobs."""
+
+    fields: ExportFields = field(default_factory=ExportFields)
+    precision: ExportPrecision = field(default_factory=ExportPrecision)
+    output_format: str = "tcx"
+    stream: bool = False
+    simplification: Simplification = field(default_factory=Simplification)
+    cache_dir: Path | None = None
+    use_cache: bool = True
+    profile: bool = False  # collect stage statistics of jobs run on the pool, see `JobResult.stages`
+    trace_memory: bool = False  # trace memory allocations of the profiled stages
+
+
+@dataclass(frozen=True)
+class Job:
+    """Merge of the route with the recording.
+
+    Output path is derived from the recording name if it's not set. Recording archive with several FIT files results
+    in an output per file, named after the file.
+    """
+
+    route: Path
+    recording: Path
+    output: Path | None = None
+    precision: float | None = None
+
+
+@dataclass(frozen=True)
+class JobResult:
+    """Outcome of the job, `error` is set if the job failed."""
+
+    job: Job
+    outputs: list[Path]
+    points: int = 0
+    elapsed: float = 0  # seconds
+    error: str | None = None
+    stages: dict | None = None  # see `firome.profiling.Profiler.to_dict`, set if profiling is enabled
+    exported: int = 0  # points written to outputs, fewer than `points` if simplified
+
+
+@dataclass(frozen=True)
+class BatchSummary:
+    """Totals of the batch."""
+
+    succeeded: int
+    failed: int
+    points: int
+    elapsed: float  # seconds, wall time
+
+    def __str__(self):
+        """Return one-line report of the batch."""
+        jobs = self.succeeded + self.failed
+        elapsed = max(self.elapsed, 1e-9)
+
+        return (
+            f"{jobs} jobs: {self.succeeded} succeeded, {self.failed} failed in {self.elapsed:.2f} s; "
+            f"{jobs / elapsed:.2f} jobs/s, {self.points / elapsed:.0f} points/s"
+        )
+
+
+def read_manifest(path: Path) -> list[Job]:
+    """Read jobs from CSV or JSON manifest.
+
+    CSV manifest has a header with `route`, `recording`, `output` and `precision` columns, JSON one is a list
+    of objects with the same keys. Only `route` and `recording` are required. Relative paths are resolved against
+    the manifest directory.
+    """
+    try:
+        if path.suffix.lower() == ".json":
+            rows = json.loads(path.read_text(encoding="utf-8"))
+        else:
+            with path.open(newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+    except (OSError, ValueError, csv.Error) as e:
+        msg = f"failed to read manifest {path}: {e}"
+        raise ManifestError(msg) from e
+
+    if not isinstance(rows, list):
+        msg = f"manifest {path} must be a list of jobs"
+        raise ManifestError(msg)
+
+    return [_job(row, path.parent, i) for i, row in enumerate(rows, 1)]
+
+
+def output_path(job: Job, output_format: str, output_dir: Path) -> Path:
+    """Return deterministic output path of the job."""
+    if job.output is not None:
+        return job.output
+
+    return output_dir / f"{recording_stem(job.recording.name)}.{output_format}"
+
+
+def recording_stem(name: str) -> str:
+    """File name without archive, compression and format suffixes, e.g. `ride` for `ride.fit.zip`."""
+    for suffix in (".zip", ".gz", ".fit"):
+        if name.lower().endswith(suffix):
+            name = name[: -len(suffix)]
+
+    return name
+
+
+def process(
+    job: Job,
+    options: Options,
+    cache: TrackCache | None = None,
+    route=None,
+    progress: Progress | None = None,
+) -> JobResult:
+    """Run the job, see `Job`. Route loaded in advance may be passed as `route`.
+
+    Stages report to `progress` token and stop with `firome.progress.CancelledError` once it's cancelled,
+    partial output is removed.
+    """
+    started = time.perf_counter()
+
+    if cache is None:
+        cache = TrackCache(options.cache_dir, enabled=options.use_cache)
+
+    if route is None:
+        route = load_route(cache, job.route, job.precision, progress)
+
+    recordings = fit_sources(job.recording)
+    output = job.output if job.output is not None else output_path(job, options.output_format, Path())
+    output_format = _output_format(output, options.output_format)
+
+    outputs = []
+    points = exported = 0
+
+    for recording in recordings:
+        destination = output if len(recordings) == 1 else _member_output(output, recording, output_format)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            counts = _merge(route, recording, destination, job, options=options, cache=cache, progress=progress)
+        except StreamingError as e:
+            LOGGER.warning("%s can't be streamed (%s), loading it whole", recording.name, e)
+            whole = replace(options, stream=False)
+            counts = _merge(route, recording, destination, job, options=whole, cache=cache, progress=progress)
+
+        points += counts[0]
+        exported += counts[1]
+        outputs.append(destination)
+
+    return JobResult(job, outputs, points, time.perf_counter() - started, exported=exported)
+
+
+def load_route(
+    cache: TrackCache,
+    src: Path,
+    precision: float | None,
+    progress: Progress | None = None,
+) -> RouteTrack | RouteModel:
+    """Load route ready for merging, see `merge`."""
+    route = cache.load_route(src, precision, progress)
+
+    return route_model(route, progress, accuracy=cache.accuracy) if precision is None else route
+
+
+def run_batch(
+    jobs: Iterable[Job],
+    options: Options,
+    output_dir: Path = Path(),
+    workers: int | None = None,
+) -> Iterator[JobResult]:
+    """Run jobs on a pool of processes yielding results as jobs complete.
+
+    Failed jobs are reported in results without stopping the batch. Jobs writing to the same output as a previous
+    job fail without running.
+    """
+    seen = set()
+    pending = []
+
+    for job in jobs:
+        output = output_path(job, options.output_format, output_dir).resolve()
+        job = Job(job.route, job.recording, output, job.precision)  # noqa: PLW2901
+
+        if output in seen:
+            yield JobResult(job, [], error=f"output {output} is already written by another job")
+            continue
+
+        seen.add(output)
+        pending.append(job)
+
+    if not pending:
+        return
+
+    with worker_pool(options, min(workers or os.cpu_count() or 1, len(pending))) as pool:
+        futures = [submit(pool, job) for job in pending]
+
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def worker_pool(options: Options, workers: int | None = None) -> ProcessPoolExecutor:
+    """Return pool of processes running jobs with given options, one process per CPU core by default."""
+    return ProcessPoolExecutor(workers or os.cpu_count() or 1, initializer=_init_worker, initargs=(options,))
+
+
+def submit(pool: ProcessPoolExecutor, job: Job) -> Future[JobResult]:
+    """Run the job on the pool created by `worker_pool`, failures are reported in the result.
+
+    Pool workers keep loaded routes in memory for the following jobs.
+    """
+    return pool.submit(_run_job, job)
+
+
+def summarize(results: Iterable[JobResult], elapsed: float) -> BatchSummary:
+    """Return totals of the batch results."""
+    succeeded = failed = points = 0
+
+    for result in results:
+        if result.error is None:
+            succeeded += 1
+            points += result.points
+        else:
+            failed += 1
+
+    return BatchSummary(succeeded, failed, points, elapsed)
+
+
+_worker_options: Options | None = None
+_worker_cache: TrackCache | None = None
+_worker_routes: dict[tuple, RouteTrack | RouteModel] = {}
+
+
+def _init_worker(options: Options):
+    global _worker_options, _worker_cache  # noqa: PLW0603  # per-process state of the pool worker
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # interruption is handled by the parent process
+
+    _worker_options = options
+    _worker_cache = TrackCache(options.cache_dir, enabled=options.use_cache)
+
+
+def _run_job(job: Job) -> JobResult:
+    if not _worker_options.profile:
+        return _run_worker_job(job)
+
+    profiler = Profiler(trace_memory=_worker_options.trace_memory)
+
+    with profiler.activate():
+        result = _run_worker_job(job)
+
+    return replace(result, stages=profiler.to_dict())
+
+
+def _run_worker_job(job: Job) -> JobResult:
+    started = time.perf_counter()
+
+    try:
+        stat = job.route.stat()
+        key = (job.route.resolve(), stat.st_mtime_ns, stat.st_size, job.precision)  # changed route is loaded again
+        route = _worker_routes.get(key)
+
+        if route is None:
+            route = load_route(_worker_cache, job.route, job.precision)
+
+            if len(_worker_routes) >= _routes_kept:
+                _worker_routes.pop(next(iter(_worker_routes)))
+
+            _worker_routes[key] = route
+
+        return process(job, _worker_options, _worker_cache, route)
+    except Exception as e:  # noqa: BLE001  # any failure is reported for the job, the batch goes on
+        return JobResult(job, [], elapsed=time.perf_counter() - started, error=f"{type(e).__name__}: {e}")
+
+
+def _merge(  # noqa: PLR0913  # stages of a single recording
+    route: RouteTrack | RouteModel,
+    recording: Source,
+    destination: Path,
+    job: Job,
+    *,
+    options: Options,
+    cache: TrackCache,
+    progress: Progress | None,
+) -> tuple[int, int]:
+    """Merge the recording into the destination, return the numbers of merged and exported points."""
+    chunks = _Counter(_activity_chunks(recording, options, cache, progress))
+    merged = merge_chunks(route, chunks, job.precision or 0, progress)
+
+    if options.simplification.enabled:
+        merged = simplify_chunks(merged, options.simplification, progress)
+
+    merged = _Counter(merged)
+    export_merged(merged, destination, options, progress)
+
+    return chunks.points, merged.points
+
+
+def _activity_chunks(
+    recording: Source,
+    options: Options,
+    cache: TrackCache,
+    progress: Progress | None,
+) -> Iterable[ActivityTrack]:
+    if options.stream:
+        return parse_fit_chunks(recording, fields=options.fields, progress=progress)
+
+    return [cache.load_activity(recording, options.fields, progress)]
+
+
+def export_merged(chunks: Iterable[ActivityTrack], destination: Path, options: Options, progress: Progress | None):
+    """Export merged chunks in the format given by destination suffix, removing partial output on failure.
+
+    Destination without known suffix is written in `options.output_format`.
+    """
+    try:
+        if _output_format(destination, options.output_format) == "fit":
+            export_chunks_as_fit(chunks, str(destination), options.fields, progress)
+        else:
+            export_chunks_as_tcx(chunks, str(destination), options.fields, options.precision, progress)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+
+
+class _Counter:
+    """Chunks iterator counting the points passed."""
+
+    def __init__(self, chunks: Iterable[ActivityTrack]):
+        self.chunks = iter(chunks)
+        self.points = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> ActivityTrack:
+        chunk = next(self.chunks)
+        self.points += len(chunk)
+
+        return chunk
+
+
+def _job(row, base: Path, number: int) -> Job:
+    if not isinstance(row, dict):
+        msg = f"job {number}: expected an object with {', '.join(_manifest_columns)}"
+        raise ManifestError(msg)
+
+    unknown = set(row) - set(_manifest_columns)
+    if unknown:
+        msg = f"job {number}: unknown columns {', '.join(sorted(map(str, unknown)))}"
+        raise ManifestError(msg)
+
+    route, recording = row.get("route"), row.get("recording")
+    if not route or not recording:
+        msg = f"job {number}: route and recording are required"
+        raise ManifestError(msg)
+
+    output = row.get("output") or None
+    precision = row.get("precision")
+
+    try:
+        precision = None if precision in {None, ""} else float(precision)
+    except (TypeError, ValueError) as e:
+        msg = f"job {number}: invalid precision {precision!r}"
+        raise ManifestError(msg) from e
+
+    return Job(
+        route=base / route,
+        recording=base / recording,
+        output=None if output is None else base / output,
+        precision=precision,
+    )
+
+
+def _output_format(output: Path, default: str) -> str:
+    name = output.name.lower()
+
+    # the longest matching suffix wins, `tcx.gz` over `gz`
+    for output_format in sorted(OUTPUT_FORMATS, key=len, reverse=True):
+        if name.endswith("." + output_format):
+            return output_format
+
+    return default
+
+
+def _member_output(output: Path, recording: Source, output_format: str) -> Path:
+    suffix = "." + output_format
+    stem = output.name[: -len(suffix)] if output.name.lower().endswith(suffix) else output.name
+
+    return output.with_name(f"{stem}-{recording_stem(recording.name)}{suffix}")
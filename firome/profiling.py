@@ -0,0 +1,299 @@
+"""Per-stage instrumentation: wall and CPU time, memory peak, item counts and optional cProfile dumps.
+
+Processing functions mark their stages with `stage` and report processed items with `count`, both do nothing
+unless a `Profiler` is activated. Nested stages are reported both inclusive and exclusive of the inner ones.
+"""
+
+import cProfile
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_active: "Profiler | None" = None
+_end = object()  # end of iteration marker
+
+
+@dataclass
+class StageStats:
+    """Totals of all runs of the stage."""
+
+    calls: int = 0
+    wall: float = 0  # seconds, including inner stages
+    wall_self: float = 0  # seconds, excluding inner stages
+    cpu: float = 0  # seconds of the running thread, including inner stages
+    memory_peak: int = 0  # bytes allocated over the stage start, if memory is traced
+    counts: Counter = field(default_factory=Counter)
+
+    def add(self, other: "StageStats"):
+        """Add totals of another stage runs."""
+        self.calls += other.calls
+        self.wall += other.wall
+        self.wall_self += other.wall_self
+        self.cpu += other.cpu
+        self.memory_peak = max(self.memory_peak, other.memory_peak)
+        self.counts.update(other.counts)
+
+
+@dataclass
+class _Frame:
+    """Running stage."""
+
+    name: str
+    wall: float
+    cpu: float
+    memory: int | None  # allocated on start, `None` if memory is not traced
+    memory_peak: int = 0
+    inner_wall: float = 0
+    profile: cProfile.Profile | None = None
+
+
+class Profiler:
+    """Stage statistics collector, see `stage` and `count`.
+
+    If `trace_memory` is set, allocations are traced with `tracemalloc`, which slows processing down.
+    If `profile_dir` is set, each stage is profiled with cProfile exclusive of inner stages, and dumped to
+    `<stage>.prof` on `dump_profiles`. Stages may run in several threads at once.
+    """
+
+    def __init__(self, *, trace_memory: bool = False, profile_dir: Path | None = None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.stages: dict[str, StageStats] = {}
+
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__profiles: dict[str, cProfile.Profile] = {}
+
+    @contextmanager
+    def activate(self):
+        """Collect statistics of the stages run in the context."""
+        global _active  # noqa: PLW0603  # instrumentation is enabled for the whole process
+
+        previous, _active = _active, self
+
+        # tracing started by the caller is left running
+        started = self.trace_memory and not tracemalloc.is_tracing()
+
+        if started:
+            tracemalloc.start()
+
+        try:
+            yield self
+        finally:
+            _active = previous
+
+            if started:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure the stage run, see `stage`."""
+        stack = self.__stack()
+        parent = stack[-1] if stack else None
+
+        memory = None
+
+        if tracemalloc.is_tracing():
+            memory = tracemalloc.get_traced_memory()[0]
+
+            if parent is not None:
+                parent.memory_peak = max(parent.memory_peak, tracemalloc.get_traced_memory()[1])
+
+            tracemalloc.reset_peak()
+
+        frame = _Frame(name, time.perf_counter(), time.thread_time(), memory)
+        stack.append(frame)
+        self.__switch_profile(parent, frame)
+
+        try:
+            yield
+        finally:
+            stack.pop()
+            self.__switch_profile(frame, parent)
+            self.__finish(frame, parent)
+
+    def count(self, name: str, value: int = 1):
+        """Add value to the counter of the innermost running stage, see `count`."""
+        stack = self.__stack()
+
+        if not stack:
+            return
+
+        with self.__lock:
+            self.stages.setdefault(stack[-1].name, StageStats()).counts[name] += int(value)
+
+    def merge(self, stats: dict):
+        """Add statistics given as `to_dict` result, e.g. collected by another process."""
+        with self.__lock:
+            for name, values in stats.items():
+                other = StageStats(**{**values, "counts": Counter(values["counts"])})
+                self.stages.setdefault(name, StageStats()).add(other)
+
+    def to_dict(self) -> dict:
+        """Return statistics of the stages in order of their first run."""
+        with self.__lock:
+            return {
+                name: {
+                    "calls": stats.calls,
+                    "wall": stats.wall,
+                    "wall_self": stats.wall_self,
+                    "cpu": stats.cpu,
+                    "memory_peak": stats.memory_peak,
+                    "counts": dict(stats.counts),
+                }
+                for name, stats in self.stages.items()
+            }
+
+    def write_json(self, path: Path):
+        """Write statistics of the stages as JSON, see `to_dict`."""
+        path.write_text(json.dumps({"stages": self.to_dict(), "max_rss": max_rss()}, indent=2), encoding="utf-8")
+
+    def table(self) -> str:
+        """Return statistics of the stages formatted as text table."""
+        rows = [("stage", "calls", "wall, s", "self, s", "cpu, s", "memory, MiB", "counts")]
+
+        for name, stats in self.to_dict().items():
+            counts = ", ".join(f"{key}: {value}" for key, value in stats["counts"].items())
+            memory = f"{stats['memory_peak'] / 2**20:.1f}" if self.trace_memory else "-"
+            rows.append(
+                (
+                    name,
+                    str(stats["calls"]),
+                    f"{stats['wall']:.3f}",
+                    f"{stats['wall_self']:.3f}",
+                    f"{stats['cpu']:.3f}",
+                    memory,
+                    counts,
+                ),
+            )
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1)]
+        lines = [
+            "  ".join([*(cell.rjust(width) for cell, width in zip(row, widths, strict=False)), row[-1]]) for row in rows
+        ]
+
+        rss = max_rss()
+        if rss is not None:
+            lines.append(f"max RSS: {rss / 2**20:.1f} MiB")
+
+        return "\n".join(lines)
+
+    def dump_profiles(self) -> list[Path]:
+        """Write cProfile statistics of the stages, return paths of the dumps."""
+        if self.profile_dir is None:
+            return []
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+
+        for name, profile in self.__profiles.items():
+            path = self.profile_dir / f"{name}.prof"
+            profile.dump_stats(path)
+            paths.append(path)
+
+        return paths
+
+    def __stack(self) -> list[_Frame]:
+        if not hasattr(self.__local, "stack"):
+            self.__local.stack = []
+
+        return self.__local.stack
+
+    def __finish(self, frame: _Frame, parent: _Frame | None):
+        wall = time.perf_counter() - frame.wall
+        cpu = time.thread_time() - frame.cpu
+        memory_peak = 0
+
+        if frame.memory is not None and tracemalloc.is_tracing():
+            peak = max(frame.memory_peak, tracemalloc.get_traced_memory()[1])
+            memory_peak = peak - frame.memory
+
+            if parent is not None:
+                parent.memory_peak = max(parent.memory_peak, peak)
+
+        if parent is not None:
+            parent.inner_wall += wall
+
+        with self.__lock:
+            self.stages.setdefault(frame.name, StageStats()).add(
+                StageStats(1, wall, wall - frame.inner_wall, cpu, memory_peak),
+            )
+
+    def __switch_profile(self, current: _Frame | None, following: _Frame | None):
+        """Pause profiling of the current stage and continue profiling of the following one."""
+        if self.profile_dir is None:
+            return
+
+        if current is not None and current.profile is not None:
+            current.profile.disable()
+
+        if following is None:
+            return
+
+        with self.__lock:
+            following.profile = self.__profiles.setdefault(following.name, cProfile.Profile())
+
+        try:
+            following.profile.enable()
+        except ValueError:  # another thread is profiled
+            following.profile = None
+
+
+@contextmanager
+def stage(name: str):
+    """Mark code run in the context as processing stage of the active profiler, if there is one."""
+    profiler = _active
+
+    if profiler is None:
+        yield
+        return
+
+    with profiler.stage(name):
+        yield
+
+
+def count(name: str, value: int = 1):
+    """Add value to the counter of the running stage of the active profiler, if there is one."""
+    if _active is not None:
+        _active.count(name, value)
+
+
+def active() -> Profiler | None:
+    """Return the activated profiler, `None` if there is no one."""
+    return _active
+
+
+def profiled(name: str, items: Iterable) -> Iterator:
+    """Iterate over items measuring each step as the stage, for lazily processed chunks."""
+    iterator = iter(items)
+
+    while True:
+        with stage(name):
+            item = next(iterator, _end)
+
+        if item is _end:
+            return
+
+        yield item
+
+
+def max_rss() -> int | None:
+    """Return peak resident set size of the process in bytes, `None` if it's unknown."""
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return rss if sys.platform == "darwin" else rss * 1024  # bytes on macOS, kilobytes elsewhere
@@ -0,0 +1,71 @@
+"""Progress reporting and cooperative cancellation of processing stages.
+
+Stages accept optional `Progress` token, report processed items to it at chunk granularity and stop with
+`CancelledError` as soon as the token is cancelled, e.g. by the GUI when the job is superseded.
+"""
+
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+CHUNK_SIZE = 65536  # points processed between the checks of the token
+
+
+class CancelledError(Exception):
+    """Processing was cancelled by the token."""
+
+
+@dataclass(frozen=True)
+class ProgressReport:
+    """Items processed by the stage so far."""
+
+    stage: str
+    done: int
+    total: int | None = None  # unknown for streamed inputs
+    unit: str = "points"
+
+
+class Progress:
+    """Token shared by the stages of a job, see the module description.
+
+    `callback` is called with `ProgressReport` in the thread running the stage. Token can be cancelled
+    from any thread, or from another process if `event` is shared with it, e.g. `multiprocessing.Manager().Event()`.
+    """
+
+    def __init__(self, callback: Callable[[ProgressReport], None] | None = None, event=None):
+        self.callback = callback
+
+        self.__cancelled = threading.Event() if event is None else event
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the token is cancelled."""
+        return self.__cancelled.is_set()
+
+    def cancel(self):
+        """Stop the stages on their next check of the token."""
+        self.__cancelled.set()
+
+    def check(self):
+        """Raise `CancelledError` if the token is cancelled."""
+        if self.cancelled:
+            raise CancelledError
+
+    def report(self, stage: str, done: int, total: int | None = None, unit: str = "points"):
+        """Report processed items, raise `CancelledError` if the token is cancelled."""
+        self.check()
+
+        if self.callback is not None:
+            self.callback(ProgressReport(stage, done, total, unit))
+
+
+def report(progress: Progress | None, stage: str, done: int, total: int | None = None, unit: str = "points"):
+    """Report processed items to the token, if there is one, see `Progress.report`."""
+    if progress is not None:
+        progress.report(stage, done, total, unit)
+
+
+def slices(size: int, chunk_size: int = CHUNK_SIZE) -> Iterator[slice]:
+    """Split `size` items into slices checked by the token one by one."""
+    for start in range(0, size, chunk_size):
+        yield slice(start, min(start + chunk_size, size))
@@ -0,0 +1,390 @@
+"""Local HTTP merge service.
+
+Minimal HTTP/1.1 server on asyncio streams, one request per connection. `POST /merge` accepts multipart form
+with `route` and `recording` files and optional `precision` and `output` fields, and responds with the merged file.
+`GET /metrics` reports request latency and job queue depth in Prometheus text format.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import zipfile
+from bisect import bisect_left
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from pathlib import Path
+
+from .cache import evict
+from .classes.export import OUTPUT_FORMATS
+from .codecs.errors import UnsupportedFileExtError
+from .codecs.fit import fit_sources
+from .codecs.zip import EmptyArchiveError
+from .logger import LOGGER
+from .pipeline import Job, Options, submit, worker_pool
+
+_max_header_size = 64 * 1024  # bytes
+_content_types = {
+    "tcx": "application/vnd.garmin.tcx+xml",
+    "tcx.gz": "application/gzip",
+    "fit": "application/vnd.ant.fit",
+}
+_route_suffixes = (".gpx", ".gpx.gz", ".zip")
+_latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+
+
+class _HTTPError(Exception):
+    """Request failed with given status."""
+
+    def __init__(self, status: HTTPStatus, message: str | None = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class _Metrics:
+    """Request counters and latency histogram of merges."""
+
+    def __init__(self):
+        self.responses = Counter()  # by path and status
+        self.latency_counts = [0] * (len(_latency_buckets) + 1)  # the last one is +Inf
+        self.latency_sum = 0.0
+        self.points = 0
+
+    def observe(self, path: str, status: HTTPStatus, elapsed: float):
+        """Count response, merge latency is added to the histogram."""
+        self.responses[path, status.value] += 1
+
+        if path == "/merge":
+            self.latency_counts[bisect_left(_latency_buckets, elapsed)] += 1
+            self.latency_sum += elapsed
+
+    def render(self, in_flight: int, workers: int, capacity: int) -> str:
+        """Return metrics in Prometheus text format."""
+        lines = ["# TYPE firome_http_responses_total counter"]
+        lines.extend(
+            f'firome_http_responses_total{{path="{path}",status="{status}"}} {count}'
+            for (path, status), count in sorted(self.responses.items())
+        )
+
+        lines.append("# TYPE firome_merge_duration_seconds histogram")
+        cumulative = 0
+
+        for bound, count in zip((*_latency_buckets, "+Inf"), self.latency_counts, strict=True):
+            cumulative += count
+            lines.append(f'firome_merge_duration_seconds_bucket{{le="{bound}"}} {cumulative}')
+
+        lines += [
+            f"firome_merge_duration_seconds_sum {self.latency_sum:.6f}",
+            f"firome_merge_duration_seconds_count {cumulative}",
+            "# TYPE firome_merged_points_total counter",
+            f"firome_merged_points_total {self.points}",
+            "# TYPE firome_jobs_in_flight gauge",
+            f"firome_jobs_in_flight {in_flight}",
+            "# TYPE firome_jobs_queued gauge",
+            f"firome_jobs_queued {max(in_flight - workers, 0)}",
+            "# TYPE firome_jobs_capacity gauge",
+            f"firome_jobs_capacity {capacity}",
+        ]
+
+        return "\n".join(lines) + "\n"
+
+
+class Server:
+    """Merge service running jobs on a pool of processes.
+
+    At most `workers + queue_size` jobs are accepted at once, requests over the limit are rejected with
+    `503 Service Unavailable`. Job running longer than `timeout` seconds is responded with `504 Gateway Timeout`.
+    Uploaded routes are stored by content hash, so pool workers keep the same route loaded in memory between
+    requests, and interpolated routes are taken from the cache, see `firome.cache.TrackCache`. Stored routes
+    are limited to `max_routes` bytes, least recently used ones are removed.
+    """
+
+    def __init__(  # noqa: PLR0913  # server configuration
+        self,
+        options: Options | None = None,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        *,
+        workers: int | None = None,
+        queue_size: int = 16,
+        timeout: float = 60,
+        max_upload: int = 64 * 1024 * 1024,
+        max_routes: int = 256 * 1024 * 1024,
+    ):
+        self.options = Options() if options is None else options
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_upload = max_upload
+        self.max_routes = max_routes
+
+        self.__metrics = _Metrics()
+        self.__in_flight = 0
+        self.__pool = None
+        self.__routes: Path | None = None
+
+    def run(self):
+        """Serve until interrupted."""
+        try:
+            asyncio.run(self.__serve())
+        except KeyboardInterrupt:
+            LOGGER.info("stopped")
+
+    async def __serve(self):
+        self.workers = self.workers or os.cpu_count() or 1
+
+        with worker_pool(self.options, self.workers) as pool, tempfile.TemporaryDirectory(prefix="firome-") as tmp:
+            self.__pool = pool
+            self.__routes = Path(tmp)
+
+            server = await asyncio.start_server(self.__handle, self.host, self.port, limit=_max_header_size)
+            LOGGER.info("serving on http://%s:%d with %d workers", self.host, self.port, self.workers)
+
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                pool.shutdown(cancel_futures=True)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        started = time.perf_counter()
+        path = "-"
+
+        try:
+            method, path, headers = await asyncio.wait_for(_read_head(reader), self.timeout)
+            status, body, content_headers = await self.__route(method, path, headers, reader)
+        except _HTTPError as e:
+            status, body, content_headers = e.status, f"{e}\n".encode(), {"Content-Type": "text/plain; charset=utf-8"}
+        except asyncio.TimeoutError:
+            status, body, content_headers = HTTPStatus.REQUEST_TIMEOUT, b"", {}
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+        except Exception:  # noqa: BLE001  # the server goes on
+            LOGGER.exception("failed to handle %s", path)
+            status, body, content_headers = HTTPStatus.INTERNAL_SERVER_ERROR, b"", {}
+
+        if path not in {"/merge", "/metrics"}:
+            path = "other"  # keeps metrics labels bounded
+
+        self.__metrics.observe(path, status, time.perf_counter() - started)
+
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Length: {len(body)}", "Connection: close"]
+        head.extend(f"{name}: {value}" for name, value in content_headers.items())
+
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def __route(self, method: str, path: str, headers: dict[str, str], reader: asyncio.StreamReader):
+        if path == "/metrics":
+            if method != "GET":
+                raise _HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+            text = self.__metrics.render(self.__in_flight, self.workers, self.workers + self.queue_size)
+
+            return HTTPStatus.OK, text.encode(), {"Content-Type": "text/plain; version=0.0.4"}
+
+        if path == "/merge":
+            if method != "POST":
+                raise _HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+            return await self.__merge(headers, reader)
+
+        raise _HTTPError(HTTPStatus.NOT_FOUND)
+
+    async def __merge(self, headers: dict[str, str], reader: asyncio.StreamReader):
+        if self.__in_flight >= self.workers + self.queue_size:
+            raise _HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "too many merges in progress, retry later")
+
+        # the slot is taken before the upload is read and freed when the job is actually done,
+        # not when the request gives up on it
+        self.__in_flight += 1
+        submitted = False
+
+        try:
+            body = await asyncio.wait_for(self.__read_body(headers, reader), self.timeout)
+
+            # parsing and file operations block, they run in threads to keep the loop serving
+            loop = asyncio.get_running_loop()
+            form = await loop.run_in_executor(None, _parse_form, headers, body)
+            output_format = form.get("output", (None, self.options.output_format.encode()))[1].decode()
+
+            if output_format not in OUTPUT_FORMATS:
+                raise _HTTPError(HTTPStatus.BAD_REQUEST, f"output must be one of {', '.join(OUTPUT_FORMATS)}")
+
+            with tempfile.TemporaryDirectory(prefix="firome-") as tmp:
+                job = await loop.run_in_executor(None, self.__job, form, Path(tmp, f"merged.{output_format}"))
+
+                future = submit(self.__pool, job)
+                submitted = True
+                future.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(self.__release))
+
+                try:
+                    result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+                except asyncio.TimeoutError as e:
+                    raise _HTTPError(HTTPStatus.GATEWAY_TIMEOUT, f"merge took longer than {self.timeout} s") from e
+
+                if result.error is not None:
+                    raise _HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, result.error)
+
+                self.__metrics.points += result.points
+                body = await loop.run_in_executor(None, job.output.read_bytes)
+        finally:
+            if not submitted:
+                self.__release()
+
+        return (
+            HTTPStatus.OK,
+            body,
+            {
+                "Content-Type": _content_types[output_format],
+                "Content-Disposition": f'attachment; filename="merged.{output_format}"',
+            },
+        )
+
+    def __job(self, form: dict[str, tuple[str | None, bytes]], output: Path) -> Job:
+        """Store uploaded files next to the output and return the job merging them."""
+        job = Job(
+            route=self.__store_route(_file(form, "route")),
+            recording=_store(output.parent, _file(form, "recording")),
+            output=output,
+            precision=_precision(form),
+        )
+
+        try:
+            recordings = fit_sources(job.recording)
+        except (UnsupportedFileExtError, EmptyArchiveError, zipfile.BadZipFile) as e:
+            raise _HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, f"unsupported recording: {e}") from e
+
+        if len(recordings) > 1:
+            raise _HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, "recording archive must contain a single FIT file")
+
+        return job
+
+    def __release(self):
+        self.__in_flight -= 1
+
+    async def __read_body(self, headers: dict[str, str], reader: asyncio.StreamReader) -> bytes:
+        if "content-length" not in headers:
+            raise _HTTPError(HTTPStatus.LENGTH_REQUIRED)
+
+        try:
+            length = int(headers["content-length"])
+        except ValueError as e:
+            raise _HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length") from e
+
+        if length > self.max_upload:
+            raise _HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+        return await reader.readexactly(length)
+
+    def __store_route(self, file: tuple[str, bytes]) -> Path:
+        """Store route by content hash, the same route is the same file for all requests.
+
+        Least recently used routes are removed once stored ones exceed `max_routes` bytes.
+        """
+        name, data = file
+
+        if not name.lower().endswith(_route_suffixes):
+            raise _HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, "route must be GPX file, possibly in ZIP or gzip")
+
+        path = _store(self.__routes, (hashlib.sha256(data).hexdigest() + _suffixes(name), data), overwrite=False)
+        evict(self.__routes, "*", self.max_routes)
+
+        return path
+
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str]]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError as e:
+        raise _HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE) from e
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+
+    try:
+        method, target, _ = request_line.split(" ")
+    except ValueError as e:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "invalid request line") from e
+
+    headers = {}
+
+    for line in filter(None, header_lines):
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    return method, target.partition("?")[0], headers
+
+
+def _parse_form(headers: dict[str, str], body: bytes) -> dict[str, tuple[str | None, bytes]]:
+    """Return form fields as `name: (file name, content)`."""
+    content_type = headers.get("content-type", "")
+
+    if not content_type.startswith("multipart/form-data"):
+        raise _HTTPError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "multipart/form-data is expected")
+
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+
+    if not message.is_multipart():
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "invalid multipart form")
+
+    form = {}
+
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+
+        if name:
+            form[name] = (part.get_filename(), part.get_payload(decode=True))
+
+    return form
+
+
+def _file(form: dict[str, tuple[str | None, bytes]], name: str) -> tuple[str, bytes]:
+    if name not in form or not form[name][0]:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, f"{name} file is required")
+
+    filename, data = form[name]
+    filename = Path(filename).name  # client path is dropped
+
+    if filename.startswith("."):
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, f"invalid {name} file name")
+
+    return filename, data
+
+
+def _precision(form: dict[str, tuple[str | None, bytes]]) -> float | None:
+    if "precision" not in form:
+        return None
+
+    try:
+        return float(form["precision"][1])
+    except ValueError as e:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "precision must be a number") from e
+
+
+def _store(directory: Path, file: tuple[str, bytes], *, overwrite: bool = True) -> Path:
+    """Write file to the directory, existing file is only touched unless `overwrite` is set."""
+    name, data = file
+    path = directory / name
+
+    if overwrite or not path.exists():
+        path.write_bytes(data)
+    else:
+        path.touch()  # marks recent use for eviction
+
+    return path
+
+
+def _suffixes(name: str) -> str:
+    """Format and compression suffixes, e.g. `.gpx.gz`."""
+    return "".join(Path(name).suffixes[-2:]).lower()
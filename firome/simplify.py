@@ -0,0 +1,207 @@
+"""Reduction of merged tracks before export: Ramer-Douglas-Peucker on positions and time or distance decimation."""
+
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+import numpy as np
+
+from .classes.tracks import ActivityTrack, filled_elevation
+from .geodesy import EARTH_RADIUS
+from .profiling import count, stage
+from .progress import Progress, report
+
+_peak_channels = ("power", "heart_rate")  # channels which maximums are kept by decimation
+
+
+@dataclass(frozen=True)
+class Simplification:
+    """Simplification methods, disabled ones are `None`. Points kept by any of enabled methods are exported.
+
+    `tolerance` is the largest distance in meters from dropped points to the simplified track, elevation included.
+    `interval` (seconds) and `spacing` (meters) keep the first point of each time or distance bucket, along with
+    power and heart rate peaks of the bucket.
+    """
+
+    tolerance: float | None = None
+    interval: float | None = None
+    spacing: float | None = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any method is enabled."""
+        return self.tolerance is not None or self.interval is not None or self.spacing is not None
+
+
+@stage("simplify")
+def simplify(
+    track: ActivityTrack,
+    simplification: Simplification,
+    progress: Progress | None = None,
+) -> ActivityTrack:
+    """Return track made of points kept by the simplification, see `Simplification`.
+
+    First and last points are always kept. Tolerance applies to points with position only, points without it are
+    kept unless they're decimated.
+    """
+    if len(track) < 3 or not simplification.enabled:  # noqa: PLR2004  # ends are kept anyway
+        return track
+
+    keep = np.zeros(len(track), dtype=bool)
+    keep[[0, -1]] = True
+
+    decimated = simplification.interval is not None or simplification.spacing is not None
+
+    if simplification.interval is not None:
+        seconds = track.timestamp.astype("datetime64[s]").astype(np.int64)
+        keep |= _decimate(track, np.floor(seconds / simplification.interval))
+
+    if simplification.spacing is not None:
+        keep |= _decimate(track, np.floor(track.distance / simplification.spacing))
+
+    if simplification.tolerance is not None:
+        keep = _rdp(track, keep, simplification.tolerance, keep_unpositioned=not decimated)
+
+    kept = int(np.count_nonzero(keep))
+
+    count("points", len(track))
+    count("kept", kept)
+    report(progress, "simplify", len(track), len(track))
+
+    return track if kept == len(track) else track.take(keep)
+
+
+def simplify_chunks(
+    chunks: Iterable[ActivityTrack],
+    simplification: Simplification,
+    progress: Progress | None = None,
+) -> Iterator[ActivityTrack]:
+    """Simplify chunks as they come, see `simplify`. Ends of each chunk are kept.
+
+    Total of processed points is reported to `progress` token after each chunk.
+    """
+    done = 0
+
+    for chunk in chunks:
+        result = simplify(chunk, simplification)
+        done += len(chunk)
+        report(progress, "simplify", done)
+
+        yield result
+
+
+def _decimate(track: ActivityTrack, bucket: np.ndarray) -> np.ndarray:
+    """Mark first points of buckets and points of channel maximums in each bucket."""
+    starts = _run_starts(bucket)
+
+    keep = np.zeros(len(track), dtype=bool)
+    keep[starts] = True
+
+    for name in _peak_channels:
+        channel = getattr(track, name)
+
+        if channel is not None:
+            keep |= _peaks(channel, starts)
+
+    return keep
+
+
+def _peaks(channel: np.ma.MaskedArray, starts: np.ndarray) -> np.ndarray:
+    """Mark the first maximum of the channel in each bucket starting at `starts`, missing values are skipped."""
+    valid = ~np.ma.getmaskarray(channel)
+    values = np.where(valid, channel.data, -np.inf)
+
+    maximums = np.maximum.reduceat(values, starts)
+    sizes = np.diff(np.r_[starts, len(values)])
+
+    # bucket of each maximum candidate, the first candidate of a bucket wins
+    candidates = np.flatnonzero(valid & (values == np.repeat(maximums, sizes)))
+    bucket = np.repeat(np.arange(len(starts)), sizes)[candidates]
+
+    keep = np.zeros(len(values), dtype=bool)
+    keep[candidates[_run_starts(bucket)]] = True
+
+    return keep
+
+
+def _rdp(track: ActivityTrack, keep: np.ndarray, tolerance: float, *, keep_unpositioned: bool) -> np.ndarray:
+    """Ramer-Douglas-Peucker refinement of kept points, run over all segments at once.
+
+    Each pass adds the farthest point of every segment exceeding the tolerance, segments within it are done.
+    """
+    if track.lat is None or track.lon is None:
+        return keep | keep_unpositioned
+
+    positioned = ~(np.ma.getmaskarray(track.lat) | np.ma.getmaskarray(track.lon))
+    keep = keep.copy()
+
+    # segments never span points without position
+    edges = np.flatnonzero(positioned[1:] != positioned[:-1])
+    keep[edges] = keep[edges + 1] = True
+
+    if keep_unpositioned:
+        keep |= ~positioned
+
+    points = _local_coordinates(track, positioned)
+    candidates = np.flatnonzero(positioned & ~keep)
+
+    while len(candidates) > 0:
+        ends = np.flatnonzero(keep)
+        segment = np.searchsorted(ends, candidates) - 1
+
+        squared = _squared_distance(points, candidates, ends, segment)
+
+        first = _run_starts(segment)
+        farthest = np.repeat(np.maximum.reduceat(squared, first), np.diff(np.r_[first, len(segment)]))
+
+        over = farthest > tolerance**2  # points of segments within tolerance are done
+        split = over & (squared == farthest)
+        split = candidates[split][_run_starts(segment[split])]
+
+        keep[split] = True
+        candidates = candidates[over & ~keep[candidates]]
+
+    return keep
+
+
+def _run_starts(values: np.ndarray) -> np.ndarray:
+    """Return indices where runs of equal values start."""
+    return np.flatnonzero(np.r_[True, values[1:] != values[:-1]][: len(values)])
+
+
+def _local_coordinates(track: ActivityTrack, positioned: np.ndarray) -> tuple[np.ndarray, ...]:
+    """Return coordinates of points in meters: equirectangular projection around the track center and elevation.
+
+    Missing elevation is interpolated by distance, it's zero if the track has none, so that distances are horizontal.
+    """
+    lat, lon = np.radians(track.lat.data), np.radians(track.lon.data)
+    center = np.median(lat[positioned]) if positioned.any() else 0
+
+    elevation = filled_elevation(track)
+
+    if elevation is None:
+        elevation = np.zeros(len(track))
+
+    return EARTH_RADIUS * np.cos(center) * lon, EARTH_RADIUS * lat, elevation
+
+
+def _squared_distance(
+    points: tuple[np.ndarray, ...],
+    idx: np.ndarray,
+    ends: np.ndarray,
+    segment: np.ndarray,
+) -> np.ndarray:
+    """Return squared distance of points to their segments between `ends`, not to the lines through them."""
+    offsets, directions = [], []
+
+    for axis in points:
+        vertices = axis[ends]  # gathered per segment, points are many more
+        offsets.append(axis[idx] - vertices[segment])
+        directions.append(np.diff(vertices)[segment])
+
+    length = sum(d * d for d in directions)
+    projection = sum(o * d for o, d in zip(offsets, directions, strict=True))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        position = np.clip(np.where(length > 0, projection / length, 0), 0, 1)
+
+    return sum((o - position * d) ** 2 for o, d in zip(offsets, directions, strict=True))
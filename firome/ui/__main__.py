@@ -1,22 +1,26 @@
 import argparse
 import logging
 import sys
-
-from PySide6.QtWidgets import QApplication
+from contextlib import nullcontext
+from multiprocessing import freeze_support
 
 from firome import __version__
 from firome.logger import LOGGER
-from firome.ui.main import MainWindow
-
-app = QApplication(sys.argv)
 
 parser = argparse.ArgumentParser(
     description="Combines GPX file with training data with GPX file with position data based on the distance",
 )
 parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Print wall and CPU time, memory and processed items of each processing stage on exit",
+)
 parser.add_argument("--version", action="store_true", help="Print app version")
 
 if __name__ == "__main__":
+    freeze_support()  # pool processes of the frozen executable
+
     args = parser.parse_args()
 
     if args.version:
@@ -27,7 +31,27 @@ if __name__ == "__main__":
     if args.debug:
         LOGGER.setLevel(logging.DEBUG)
 
+    # Qt and the window modules are imported only when the window is shown
+    from PySide6.QtWidgets import QApplication
+
+    from firome.profiling import Profiler
+    from firome.ui import processes
+    from firome.ui.main import MainWindow
+
+    app = QApplication(sys.argv)
+
     mw = MainWindow()
     mw.show()
 
-    sys.exit(app.exec())
+    # stages run by the window workers are collected from the pool processes
+    profiler = Profiler()
+
+    with profiler.activate() if args.profile else nullcontext():
+        code = app.exec()
+
+    processes.shutdown()
+
+    if args.profile:
+        LOGGER.info("\n%s", profiler.table())
+
+    sys.exit(code)
@@ -1,18 +1,23 @@
 import time
 from pathlib import Path
 
-from PySide6.QtCore import QThreadPool
-from PySide6.QtWidgets import QCheckBox, QFileDialog, QLabel, QMainWindow, QSlider
+from PySide6.QtCore import QThreadPool, QTimer
+from PySide6.QtWidgets import QCheckBox, QDialogButtonBox, QFileDialog, QLabel, QMainWindow, QMessageBox, QSlider
 
 from .. import __version__
 from ..classes.export import ExportFields
-from ..classes.points import DataPoint, PositionPoint
-from ..codecs.tcx import export_as_tcx
+from ..classes.tracks import ActivityTrack, RouteTrack
 from ..i18n import Translator
+from ..logger import LOGGER
+from ..progress import Progress, ProgressReport
+from ..simplify import Simplification
 from .main_ui import Ui_MainWindow
-from .main_workers import LoadActivityWorker, LoadRouteWorker, MergeWorker
+from .main_workers import ExportWorker, InterpolateWorker, LoadActivityWorker, LoadRouteWorker, MergeWorker, Worker
 
 _precision_positions = (0.5, 1.0, 2.0, 3.0, 4.0, 5.0)
+_progress_steps = 1000  # progress bar resolution
+_precision_delay = 250  # milliseconds of slider rest before the route is interpolated
+_simplification = Simplification(tolerance=1.0)  # applied to exports if the track is simplified
 
 
 class MainWindow(QMainWindow):
@@ -21,8 +26,13 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        self._route_points = []
-        self._activity_points = []
+        self._parsed_route: RouteTrack | None = None
+        self._interpolated: dict[float, RouteTrack] = {}  # parsed route interpolated by precision
+        self._route_points: RouteTrack | None = None  # interpolated with `_route_precision`
+        self._route_precision: float | None = None
+        self._activity_points: ActivityTrack | None = None
+        self._merged: ActivityTrack | None = None  # merged in advance, see `_start_merge`
+        self._pending_export: tuple[str, ExportFields, Simplification] | None = None  # confirmed before merge is done
 
         # gettext seems bit too complex
         self._translator = Translator("ui")
@@ -30,6 +40,12 @@ class MainWindow(QMainWindow):
         self._export_fields = ExportFields()
 
         self._threadpool = QThreadPool()
+        self._jobs: dict[str, Progress] = {}  # progress tokens of running workers by kind
+
+        self._precision_timer = QTimer(self)
+        self._precision_timer.setSingleShot(True)
+        self._precision_timer.setInterval(_precision_delay)
+        self._precision_timer.timeout.connect(self._apply_precision)
 
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
@@ -46,6 +62,7 @@ class MainWindow(QMainWindow):
         self._checkbox_values = self._init_checkboxes()
 
         self._translate_static()
+        self._update_buttons()
 
     def tr(self, msg, *_):
         """Translate given message."""
@@ -55,7 +72,7 @@ class MainWindow(QMainWindow):
         dialog = QFileDialog(self)
         dialog.setFileMode(dialog.FileMode.ExistingFile)
         dialog.setAcceptMode(dialog.AcceptMode.AcceptOpen)
-        dialog.setNameFilter(self.tr("nameFilterActivity") + " (*.fit *.fit.zip)")
+        dialog.setNameFilter(self.tr("nameFilterActivity") + " (*.fit *.fit.zip *.fit.gz)")
         if dialog.exec_():
             self.ui.inputActivitySelect.setText(dialog.selectedFiles()[0])
             self._on_activity_select()
@@ -64,71 +81,259 @@ class MainWindow(QMainWindow):
         dialog = QFileDialog(self)
         dialog.setFileMode(dialog.FileMode.ExistingFile)
         dialog.setAcceptMode(dialog.AcceptMode.AcceptOpen)
-        dialog.setNameFilter(self.tr("nameFilterRoute") + " (*.gpx)")
+        dialog.setNameFilter(self.tr("nameFilterRoute") + " (*.gpx *.gpx.zip *.gpx.gz)")
         if dialog.exec_():
             self.ui.inputRouteSelect.setText(dialog.selectedFiles()[0])
             self._on_route_select()
 
-    def _block_buttons(self):
-        self.ui.buttonBox.blockSignals(True)  # noqa:FBT003 # boolean is the only argument
-        self.ui.buttonBox.setEnabled(False)
+    def _update_buttons(self):
+        """Enable confirmation once both inputs are loaded, cancel stays enabled to abort running work."""
+        ready = self._route_points is not None and self._activity_points is not None
+        busy = "export" in self._jobs or self._pending_export is not None
+
+        self.ui.buttonBox.button(QDialogButtonBox.StandardButton.Ok).setEnabled(ready and not busy)
+
+    def _start(self, kind: str, worker: Worker):
+        """Run the worker, cancelling the running worker of the same kind as superseded."""
+        self._cancel(kind)
+
+        self._jobs[kind] = worker.progress
+        worker.signals.progress.connect(self._on_progress)
+        worker.signals.error.connect(self._on_error)
+
+        self._update_buttons()
+
+        self._threadpool.start(worker)
+
+    def _cancel(self, kind: str):
+        superseded = self._jobs.pop(kind, None)
+        if superseded is not None:
+            superseded.cancel()
+
+    def _finish(self, kind: str, progress: Progress) -> bool:
+        """Mark the worker done, return `False` if its result is superseded."""
+        if self._jobs.get(kind) is not progress:
+            return False
+
+        del self._jobs[kind]
+
+        if not self._jobs:
+            self._reset_progress()
+
+        self._update_buttons()
+
+        return True
+
+    def _cancel_jobs(self):
+        for progress in self._jobs.values():
+            progress.cancel()
+
+        self._jobs.clear()
+        self._pending_export = None
+        self._reset_progress()
+        self._update_buttons()
+
+    def _on_error(self, progress: Progress, message: str):
+        kind = next((kind for kind, running in self._jobs.items() if running is progress), None)
 
-    def _unblock_buttons(self):
-        self.ui.buttonBox.blockSignals(False)  # noqa:FBT003 # boolean is the only argument
-        self.ui.buttonBox.setEnabled(True)
+        if kind is None:
+            return  # superseded
+
+        self._finish(kind, progress)
+
+        LOGGER.error("%s failed: %s", kind, message)
+
+        if kind == "merge":
+            self._pending_export = None
+            self._update_buttons()
+
+        QMessageBox.critical(self, self.windowTitle(), message)
+
+    def _on_progress(self, report: ProgressReport):
+        bar = self.ui.progressBar
+
+        if report.total is None:
+            bar.setRange(0, 0)  # busy indicator
+            bar.setFormat(self.tr(report.stage))
+            return
+
+        bar.setRange(0, _progress_steps)
+        bar.setValue(_progress_steps * report.done // max(report.total, 1))
+        bar.setFormat(f"{self.tr(report.stage)} %p%")
+
+    def _reset_progress(self):
+        self.ui.progressBar.setRange(0, 1)
+        self.ui.progressBar.setValue(0)
+        self.ui.progressBar.setFormat("")
 
     def _on_route_select(self):
-        worker = LoadRouteWorker(Path(self.ui.inputRouteSelect.text()), self._precision)
+        self._parsed_route = None
+        self._interpolated.clear()
+        self._cancel("interpolate")
+        self._set_route(None, None)
+
+        worker = LoadRouteWorker(Path(self.ui.inputRouteSelect.text()))
         worker.signals.result.connect(self._on_load_route)
 
-        self._block_buttons()
+        self._start("route", worker)
 
-        self._threadpool.start(worker)
+    def _on_load_route(self, progress: Progress, positions: RouteTrack):
+        if not self._finish("route", progress):
+            return
+
+        self._parsed_route = positions
+        self._apply_precision()
+
+    def _apply_precision(self):
+        """Interpolate parsed route with the selected precision, interpolations are reused when switching back."""
+        self._precision_timer.stop()
+
+        precision = self._precision
+
+        if self._parsed_route is None or precision == self._route_precision:
+            return
+
+        self._cancel("interpolate")
+        self._set_route(None, None)
+
+        if precision in self._interpolated:
+            self._set_route(self._interpolated[precision], precision)
+            return
 
-    def _on_load_route(self, positions: list[PositionPoint]):
-        self.ui.labelRouteLen.setText(self._len_to_test(positions[-1].distance))
+        worker = InterpolateWorker(self._parsed_route, precision)
+        worker.signals.result.connect(self._on_interpolate)
+
+        self._start("interpolate", worker)
+
+    def _on_interpolate(self, progress: Progress, result: tuple[float, RouteTrack]):
+        if not self._finish("interpolate", progress):
+            return
+
+        precision, positions = result
+        self._interpolated[precision] = positions
+
+        self._set_route(positions, precision)
+
+    def _set_route(self, positions: RouteTrack | None, precision: float | None):
+        """Use route interpolated with given precision for merging, `None` while it's not ready."""
         self._route_points = positions
+        self._route_precision = precision
+
+        if positions is None:
+            self._invalidate_merge()
+            self._update_buttons()
+            return
 
-        self._unblock_buttons()
+        self.ui.labelRouteLen.setText(self._len_to_test(positions.distance[-1]))
+        self._start_merge()
 
     def _on_activity_select(self):
+        self._activity_points = None
+        self._invalidate_merge()
+
         worker = LoadActivityWorker(Path(self.ui.inputActivitySelect.text()))
         worker.signals.result.connect(self._on_load_activity)
 
-        self._block_buttons()
+        self._start("activity", worker)
 
-        self._threadpool.start(worker)
+    def _on_load_activity(self, progress: Progress, points: ActivityTrack):
+        if not self._finish("activity", progress):
+            return
 
-    def _on_load_activity(self, points: list[DataPoint]):
-        self.ui.labelActivityLen.setText(self._len_to_test(points[-1].distance))
+        self.ui.labelActivityLen.setText(self._len_to_test(points.distance[-1]))
         self._activity_points = points
 
-        self._unblock_buttons()
+        self._start_merge()
 
-    def _on_submit(self):
-        worker = MergeWorker(self._route_points, self._activity_points, self._precision)
+    def _invalidate_merge(self):
+        """Drop merge result of the previous inputs, confirmed export of it is dropped too."""
+        self._cancel("merge")
+        self._merged = None
+        self._pending_export = None
+
+    def _start_merge(self):
+        """Merge inputs as soon as both are loaded, so the result is ready when the user confirms."""
+        if self._route_points is None or self._activity_points is None:
+            return
+
+        worker = MergeWorker(self._route_points, self._activity_points, self._route_precision)
         worker.signals.result.connect(self._on_finish_merge)
 
-        self._block_buttons()
+        self._start("merge", worker)
 
-        self._threadpool.start(worker)
+    def _on_finish_merge(self, progress: Progress, points: ActivityTrack):
+        if not self._finish("merge", progress):
+            return
+
+        self._merged = points
+
+        if self._pending_export is not None:
+            export, self._pending_export = self._pending_export, None
+            self._export(*export)
+
+    def _on_submit(self):
+        destination = self._select_destination()
 
-    def _on_finish_merge(self, points: list[DataPoint]):
+        if destination is None:
+            return
+
+        fields = ExportFields(**{k: v.isChecked() for k, v in self._checkbox_values.items()})
+        simplification = _simplification if self.ui.checkboxSimplify.isChecked() else Simplification()
+
+        if self._merged is None:
+            self._pending_export = (destination, fields, simplification)  # exported as soon as merge is done
+            self._update_buttons()
+            return
+
+        self._export(destination, fields, simplification)
+
+    def _select_destination(self) -> str | None:
         dialog = QFileDialog(self)
         dialog.setFileMode(dialog.FileMode.AnyFile)
         dialog.setAcceptMode(dialog.AcceptMode.AcceptSave)
+        suffixes = {
+            self.tr("nameFilterTcx") + " (*.tcx)": "tcx",
+            self.tr("nameFilterTcxGz") + " (*.tcx.gz)": "tcx.gz",
+            self.tr("nameFilterFit") + " (*.fit)": "fit",
+        }
+        dialog.setNameFilters(list(suffixes))
+        # name typed without suffix gets the one of the selected filter
+        dialog.filterSelected.connect(lambda name: dialog.setDefaultSuffix(suffixes.get(name, "tcx")))
         dialog.setDefaultSuffix("tcx")
         dialog.selectFile(f"{int(time.time())}.tcx")
 
-        if dialog.exec_():
-            checkbox_dict = {k: v.isChecked() for k, v in self._checkbox_values.items()}
+        if not dialog.exec_():
+            return None
+
+        return dialog.selectedFiles()[0]
+
+    def _export(self, destination: str, fields: ExportFields, simplification: Simplification):
+        worker = ExportWorker(self._merged, destination, fields, simplification)
+        worker.signals.result.connect(self._on_finish_export)
+
+        self._start("export", worker)
 
-            export_as_tcx(points, dialog.selectedFiles()[0], ExportFields(**checkbox_dict))
+    def _on_finish_export(self, progress: Progress, result: tuple[str, int, int]):
+        if not self._finish("export", progress):
+            return
+
+        destination, merged, exported = result
+
+        if exported != merged:
+            LOGGER.info("simplified: %d of %d points exported (%.1f%%)", exported, merged, 100 * exported / merged)
+
+        LOGGER.info("result: %s", destination)
 
         self._reset_input()
-        self._unblock_buttons()
 
     def _reset_input(self):
+        self._precision_timer.stop()
+        self._cancel("interpolate")
+        self._parsed_route = None
+        self._interpolated.clear()
+        self._set_route(None, None)
+        self._activity_points = None
+
         self.ui.inputRouteSelect.setText("")
         self.ui.inputActivitySelect.setText("")
 
@@ -137,6 +342,8 @@ class MainWindow(QMainWindow):
         self.ui.labelRouteLen.setText(self._len_to_test(0))
         self.ui.labelActivityLen.setText(self._len_to_test(0))
 
+        self._update_buttons()
+
     def _len_to_test(self, length_meters: float):
         km = int(length_meters / 1000)
         m = round(length_meters % 1000)
@@ -152,8 +359,14 @@ class MainWindow(QMainWindow):
         return " ".join(parts)
 
     def _on_cancel(self):
+        self._cancel_jobs()
         self._reset_input()
 
+    def closeEvent(self, event):  # noqa: N802  # Qt event handler
+        """Cancel running workers on close."""
+        self._cancel_jobs()
+        super().closeEvent(event)
+
     def _init_precision_slider(self):
         slider = self.ui.horizontalSlider
         slider.setTickPosition(QSlider.TickPosition.TicksBelow)
@@ -198,14 +411,15 @@ class MainWindow(QMainWindow):
     def _update_precision_value(self):
         self.ui.precisionValue.setText(str(self._precision))
 
-        if len(self._route_points) > 0:
-            # update distance with updated precision
-            self._on_route_select()
+        if self._parsed_route is not None:
+            # route is interpolated once the slider rests, loading route is interpolated when it's parsed
+            self._precision_timer.start()
 
     def _translate_static(self):
         self.ui.buttonRouteSelect.setText(self.tr("btnRouteSelect"))
         self.ui.buttonActivitySelect.setText(self.tr("btnActivitySelect"))
         self.ui.precisionLabel.setText(self.tr("lblPrecision"))
+        self.ui.checkboxSimplify.setText(self.tr("chkSimplify"))
 
         for button in self.ui.buttonBox.buttons():
             button.setText(self.tr(button.text()))
@@ -15,9 +15,10 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QAbstractButton, QApplication, QDialogButtonBox, QLabel,
-    QLineEdit, QMainWindow, QPushButton, QSizePolicy,
-    QSlider, QVBoxLayout, QWidget)
+from PySide6.QtWidgets import (QAbstractButton, QApplication, QCheckBox, QDialogButtonBox,
+    QLabel, QLineEdit, QMainWindow, QProgressBar,
+    QPushButton, QSizePolicy, QSlider, QVBoxLayout,
+    QWidget)
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -66,6 +67,14 @@ class Ui_MainWindow(object):
         self.labelActivityLen = QLabel(self.centralwidget)
         self.labelActivityLen.setObjectName(u"labelActivityLen")
         self.labelActivityLen.setGeometry(QRect(20, 120, 141, 17))
+        self.checkboxSimplify = QCheckBox(self.centralwidget)
+        self.checkboxSimplify.setObjectName(u"checkboxSimplify")
+        self.checkboxSimplify.setGeometry(QRect(460, 220, 170, 23))
+        self.progressBar = QProgressBar(self.centralwidget)
+        self.progressBar.setObjectName(u"progressBar")
+        self.progressBar.setGeometry(QRect(20, 394, 260, 23))
+        self.progressBar.setMaximum(1)
+        self.progressBar.setValue(0)
         MainWindow.setCentralWidget(self.centralwidget)
 
         self.retranslateUi(MainWindow)
@@ -80,6 +89,8 @@ class Ui_MainWindow(object):
         self.precisionValue.setText(QCoreApplication.translate("MainWindow", u"0", None))
         self.labelRouteLen.setText(QCoreApplication.translate("MainWindow", u"0m", None))
         self.labelActivityLen.setText(QCoreApplication.translate("MainWindow", u"0m", None))
+        self.checkboxSimplify.setText(QCoreApplication.translate("MainWindow", u"Simplify track", None))
+        self.progressBar.setFormat("")
         pass
     # retranslateUi
 
@@ -2,64 +2,108 @@ from pathlib import Path
 
 from PySide6.QtCore import QObject, QRunnable, Signal, Slot
 
-from ..classes.points import DataPoint, PositionPoint
-from ..codecs.fit import parse_fit
-from ..codecs.gpx import interpolate, parse_gpx
+from ..classes.export import ExportFields
+from ..classes.tracks import ActivityTrack, RouteTrack
+from ..codecs.gpx import interpolate
 from ..merge import merge
+from ..progress import CancelledError, Progress
+from ..simplify import Simplification
+from . import processes
 
 
 class WorkerSignals(QObject):
     """Signals supported by worker."""
 
-    result = Signal(list)
+    result = Signal(object, object)  # progress token of the worker, result
+    error = Signal(object, str)  # progress token of the worker, error message
+    progress = Signal(object)  # see `firome.progress.ProgressReport`
 
 
-class LoadRouteWorker(QRunnable):
-    """Loading and interpolating route."""
+class Worker(QRunnable):
+    """Worker reporting progress, cancelled with its progress token.
 
-    def __init__(self, route_path: Path, precision: float):
+    Work is run in the pool of processes, see `firome.ui.processes`, the worker thread only waits for it.
+    """
+
+    def __init__(self):
         super().__init__()
 
-        self.args = (route_path, precision)
         self.signals = WorkerSignals()
+        self.progress = Progress(self.signals.progress.emit)
 
     @Slot()
     def run(self):
-        """Execute route loading and interpolation."""
-        route_path, precision = self.args
-        result = interpolate(parse_gpx(route_path), precision)
+        """Execute the work, nothing is emitted if it's cancelled."""
+        try:
+            result = self._work()
+        except CancelledError:
+            return
+        except Exception as e:  # noqa: BLE001  # any failure is reported to the window
+            self.signals.error.emit(self.progress, f"{type(e).__name__}: {e}")
+            return
+
+        if not self.progress.cancelled:
+            self.signals.result.emit(self.progress, result)
+
+    def _work(self):
+        raise NotImplementedError
+
+
+class LoadRouteWorker(Worker):
+    """Loading route."""
+
+    def __init__(self, route_path: Path):
+        super().__init__()
+
+        self.args = (route_path,)
+
+    def _work(self) -> RouteTrack:
+        return processes.run(processes.load_route, self.args, self.progress)
+
+
+class InterpolateWorker(Worker):
+    """Interpolating loaded route, the result is returned with the precision."""
+
+    def __init__(self, route: RouteTrack, precision: float):
+        super().__init__()
+
+        self.args = (route, precision)
 
-        self.signals.result.emit(result)
+    def _work(self) -> tuple[float, RouteTrack]:
+        return self.args[1], processes.run(interpolate, self.args, self.progress)
 
 
-class LoadActivityWorker(QRunnable):
+class LoadActivityWorker(Worker):
     """Loading activity."""
 
     def __init__(self, activity_path: Path):
         super().__init__()
 
-        self.args = (activity_path,)
-        self.signals = WorkerSignals()
-
-    @Slot()
-    def run(self):
-        """Execute activity loading."""
-        result = parse_fit(Path(self.args[0]).resolve())
+        self.args = (Path(activity_path),)
 
-        self.signals.result.emit(result)
+    def _work(self) -> ActivityTrack:
+        return processes.run(processes.load_activity, self.args, self.progress)
 
 
-class MergeWorker(QRunnable):
+class MergeWorker(Worker):
     """Worker thread."""
 
-    def __init__(self, position_elements: list[PositionPoint], data_elements: list[DataPoint], precision: float):
+    def __init__(self, position_elements: RouteTrack, data_elements: ActivityTrack, precision: float):
         super().__init__()
 
         self.args = (position_elements, data_elements, precision)
-        self.signals = WorkerSignals()
 
-    @Slot()
-    def run(self):
-        """Merge input data."""
-        result = merge(*self.args)
-        self.signals.result.emit(result)
+    def _work(self) -> ActivityTrack:
+        return processes.run(merge, self.args, self.progress)
+
+
+class ExportWorker(Worker):
+    """Exporting merged data to TCX or FIT file, by destination extension, see `firome.ui.processes.export`."""
+
+    def __init__(self, points: ActivityTrack, destination: str, fields: ExportFields, simplification: Simplification):
+        super().__init__()
+
+        self.args = (points, destination, fields, simplification)
+
+    def _work(self) -> tuple[str, int, int]:
+        return processes.run(processes.export, self.args, self.progress)
@@ -0,0 +1,166 @@
+"""Processing stages of the window workers run in a pool of processes.
+
+Pure Python parts of the stages (FIT decoding, merge, XML loops) hold the GIL, so running them in threads of the window
+process makes it stutter. Tracks are passed to and from the pool as pickled NumPy arrays. Stages report progress to
+a queue relayed by the worker thread and stop once the event shared with the pool is set by the worker thread.
+Pool and its manager are started by the first task in the worker thread, the window thread never waits for them.
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import SyncManager
+from pathlib import Path
+
+from ..cache import TrackCache
+from ..classes.export import ExportFields
+from ..classes.tracks import ActivityTrack, RouteTrack
+from ..pipeline import Options, export_merged
+from ..profiling import Profiler, active
+from ..progress import CancelledError, Progress
+from ..simplify import Simplification, simplify
+
+_processes = 4  # at most, route, activity, merge and export may run at once
+_poll_interval = 0.05  # seconds between the checks of the token by the worker thread
+
+_lock = threading.Lock()
+_pool: ProcessPoolExecutor | None = None
+_manager: SyncManager | None = None
+
+
+def run(task: Callable, args: tuple, progress: Progress):
+    """Run `task(*args, progress)` in the pool and return its result.
+
+    Reports of the task are relayed to `progress` in the calling thread. `CancelledError` is raised as soon as
+    `progress` is cancelled, the task stops on its next report.
+    """
+    pool, manager = _start()
+    reports = manager.Queue()
+    cancelled = manager.Event()  # `progress` of the task in the pool
+
+    profiler = active()
+    trace_memory = None if profiler is None else profiler.trace_memory
+
+    future = pool.submit(_run, task, args, reports, cancelled, trace_memory=trace_memory)
+
+    try:
+        while not future.done():
+            try:
+                report = reports.get(timeout=_poll_interval)
+            except queue.Empty:
+                progress.check()
+                continue
+
+            progress.report(report.stage, report.done, report.total, report.unit)
+
+        result, stats = future.result()
+
+        while not reports.empty():  # the last reports of the task
+            report = reports.get()
+            progress.report(report.stage, report.done, report.total, report.unit)
+    except CancelledError:
+        cancelled.set()
+        raise
+    except BrokenProcessPool:
+        _discard(pool)  # process died, e.g. out of memory, following tasks start a new pool
+        raise
+
+    if profiler is not None:
+        profiler.merge(stats)
+
+    return result
+
+
+def shutdown():
+    """Stop the pool, cancelled tasks are waited for until their next report."""
+    global _pool, _manager  # pool is shared by all workers of the process
+
+    with _lock:
+        pool, manager, _pool, _manager = _pool, _manager, None, None
+
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+    if manager is not None:
+        manager.shutdown()
+
+
+def load_route(path: Path, progress: Progress) -> RouteTrack:
+    """Load route, not interpolated."""
+    return TrackCache().load_route(path, progress=progress)
+
+
+def load_activity(path: Path, progress: Progress) -> ActivityTrack:
+    """Load activity."""
+    return TrackCache().load_activity(path.resolve(), progress=progress)
+
+
+def export(
+    points: ActivityTrack,
+    destination: str,
+    fields: ExportFields,
+    simplification: Simplification,
+    progress: Progress,
+) -> tuple[str, int, int]:
+    """Export merged data to TCX or FIT file, by destination extension, see `firome.pipeline.export_merged`.
+
+    Return the destination, the numbers of merged and exported points, fewer if simplified.
+    """
+    exported = simplify(points, simplification, progress)
+    export_merged([exported], Path(destination), Options(fields=fields), progress)
+
+    return destination, len(points), len(exported)
+
+
+def _start() -> tuple[ProcessPoolExecutor, SyncManager]:
+    global _pool, _manager  # noqa: PLW0603  # pool is shared by all workers of the process
+
+    with _lock:
+        # fork of the process running Qt threads is unsafe, processes are spawned on all platforms
+        context = multiprocessing.get_context("spawn")
+
+        if _manager is None:
+            _manager = context.Manager()
+
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                min(_processes, os.cpu_count() or 1),
+                mp_context=context,
+                initializer=_init_process,
+            )
+
+        return _pool, _manager
+
+
+def _discard(pool: ProcessPoolExecutor):
+    global _pool  # noqa: PLW0603  # pool is shared by all workers of the process
+
+    with _lock:
+        if _pool is pool:
+            _pool = None
+
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _init_process():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # interruption is handled by the window process
+
+
+def _run(task: Callable, args: tuple, reports: queue.Queue, event, *, trace_memory: bool | None) -> tuple:
+    """Run the task in the pool process, return its result and stage statistics unless `trace_memory` is `None`."""
+    progress = Progress(reports.put, event)
+
+    if trace_memory is None:
+        return task(*args, progress), None
+
+    profiler = Profiler(trace_memory=trace_memory)
+
+    with profiler.activate():
+        result = task(*args, progress)
+
+    return result, profiler.to_dict()
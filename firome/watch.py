@@ -0,0 +1,199 @@
+"""Inbox directory watching, merging new recordings as they appear."""
+
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+from .cache import TrackCache
+from .logger import LOGGER
+from .pipeline import Job, JobResult, Options, load_route, recording_stem, submit, worker_pool
+
+_recording_suffixes = (".fit", ".fit.zip", ".fit.gz")
+_sidecar_suffix = ".route"
+_staging_dir = ".partial"
+_ledger_name = ".firome-ledger.jsonl"
+
+
+@dataclass(frozen=True)
+class _Entry:
+    """Inbox file version, changed file is processed again."""
+
+    name: str
+    size: int
+    mtime_ns: int
+
+
+class Watcher:
+    """Inbox watcher merging recordings on a pool of processes.
+
+    Inbox is polled every `interval` seconds, recording is processed once its size and modification time stay
+    the same for two polls. Recording is merged with the route named in the sidecar file next to it,
+    e.g. `ride.route` for `ride.fit`, or with the default `route`. Sidecar contains path to GPX file,
+    relative to the inbox. Outputs are written to the staging directory of the outbox and moved to the outbox
+    when complete. Processed recordings are recorded in the ledger, so they are not processed again after restart.
+    """
+
+    def __init__(  # noqa: PLR0913  # watcher configuration
+        self,
+        inbox: Path,
+        outbox: Path,
+        route: Path | None = None,
+        precision: float | None = None,
+        options: Options | None = None,
+        *,
+        workers: int | None = None,
+        interval: float = 2,
+        ledger: Path | None = None,
+    ):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.route = route
+        self.precision = precision
+        self.options = Options() if options is None else options
+        self.workers = workers
+        self.interval = interval
+        self.ledger = outbox / _ledger_name if ledger is None else ledger
+
+        self.__done = _read_ledger(self.ledger)
+        self.__seen: dict[str, _Entry] = {}  # inbox files of the previous poll
+        self.__in_flight: dict[Future[JobResult], _Entry] = {}
+        self.__waiting: set[_Entry] = set()  # recordings without a route, reported once
+
+    def run(self):
+        """Process recordings until interrupted."""
+        staging = self.outbox / _staging_dir
+        staging.mkdir(parents=True, exist_ok=True)
+
+        for leftover in staging.iterdir():  # outputs of the jobs interrupted by the previous run
+            leftover.unlink()
+
+        if self.route is not None:
+            # fills the cache for the workers and fails early on broken route
+            load_route(TrackCache(self.options.cache_dir, enabled=self.options.use_cache), self.route, self.precision)
+
+        LOGGER.info("watching %s, outputs are moved to %s", self.inbox, self.outbox)
+
+        with worker_pool(self.options, self.workers) as pool:
+            try:
+                while True:
+                    self.__poll(pool)
+                    self.__collect()
+            except KeyboardInterrupt:
+                # unfinished jobs are not in the ledger, so they are processed again after restart
+                LOGGER.info("stopping, %d unfinished jobs are left for the next run", len(self.__in_flight))
+                pool.shutdown(cancel_futures=True)
+
+    def __poll(self, pool):
+        current = {}
+
+        for path in self.inbox.iterdir():
+            if not path.name.lower().endswith(_recording_suffixes) or not path.is_file():
+                continue
+
+            stat = path.stat()
+            entry = _Entry(path.name, stat.st_size, stat.st_mtime_ns)
+            current[entry.name] = entry
+
+            if entry != self.__seen.get(entry.name) or entry in self.__done or entry in self.__in_flight.values():
+                continue  # still being written or already processed
+
+            job = self.__job(path, entry)
+
+            if job is not None:
+                LOGGER.info("processing %s", entry.name)
+                self.__in_flight[submit(pool, job)] = entry
+
+        self.__seen = current
+
+    def __job(self, path: Path, entry: _Entry) -> Job | None:
+        route = self.route
+        sidecar = path.with_name(recording_stem(path.name) + _sidecar_suffix)
+
+        if sidecar.is_file():
+            route = self.inbox / sidecar.read_text(encoding="utf-8").strip()
+
+        if route is None:
+            if entry not in self.__waiting:
+                LOGGER.warning("no route for %s, waiting for %s", entry.name, sidecar.name)
+                self.__waiting.add(entry)
+
+            return None
+
+        self.__waiting.discard(entry)
+        output = self.outbox / _staging_dir / f"{recording_stem(path.name)}.{self.options.output_format}"
+
+        return Job(route, path, output, self.precision)
+
+    def __collect(self):
+        """Wait for the next poll, handling jobs completed meanwhile."""
+        if not self.__in_flight:
+            time.sleep(self.interval)
+            return
+
+        done, _ = wait(self.__in_flight, timeout=self.interval, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            entry = self.__in_flight.pop(future)
+            result = future.result()
+            outputs = []
+
+            if result.error is None:
+                for staged in result.outputs:
+                    output = self.outbox / staged.name
+                    staged.replace(output)  # atomic within the same file system
+                    outputs.append(output)
+
+                LOGGER.info("done %s -> %s", entry.name, ", ".join(map(str, outputs)))
+            else:
+                LOGGER.error("failed %s: %s", entry.name, result.error)
+
+            self.__record(entry, result, outputs)
+
+    def __record(self, entry: _Entry, result: JobResult, outputs: list[Path]):
+        """Append processed recording to the ledger, failed ones are not retried until changed."""
+        line = json.dumps(
+            {
+                "name": entry.name,
+                "size": entry.size,
+                "mtime_ns": entry.mtime_ns,
+                "outputs": [output.name for output in outputs],
+                "error": result.error,
+            },
+        )
+
+        with self.ledger.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.__done.add(entry)
+
+
+def _read_ledger(path: Path) -> set[_Entry]:
+    done = set()
+
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        return done
+
+    for line in lines:
+        entry = _ledger_entry(line)
+
+        if entry is None:
+            LOGGER.warning("skipping broken ledger line: %s", line)  # e.g. interrupted write
+        else:
+            done.add(entry)
+
+    return done
+
+
+def _ledger_entry(line: str) -> _Entry | None:
+    try:
+        record = json.loads(line)
+        return _Entry(record["name"], record["size"], record["mtime_ns"])
+    except (ValueError, KeyError, TypeError):
+        return None